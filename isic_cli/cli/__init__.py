@@ -1,37 +1,24 @@
 from __future__ import annotations
 
 import datetime
-from http.client import HTTPConnection
+import functools
+import json
 import logging
 import os
+from pathlib import Path
 import platform
 import sys
 import traceback
 
-from authlib.integrations.base_client.errors import OAuthError
 import click
 from click import UsageError, get_current_context
-from requests.exceptions import HTTPError
-import sentry_sdk
-from sentry_sdk import capture_exception
-from sentry_sdk.api import set_context, set_tag
-from sentry_sdk.integrations.argv import ArgvIntegration
-from sentry_sdk.integrations.atexit import AtexitIntegration
-from sentry_sdk.integrations.dedupe import DedupeIntegration
-from sentry_sdk.integrations.logging import LoggingIntegration
-from sentry_sdk.integrations.modules import ModulesIntegration
-from sentry_sdk.integrations.stdlib import StdlibIntegration
-from sentry_sdk.integrations.threading import ThreadingIntegration
-
-from isic_cli.cli.accession import accession as accession_group
-from isic_cli.cli.collection import collection as collection_group
+
 from isic_cli.cli.context import IsicContext
-from isic_cli.cli.image import image as image_group
-from isic_cli.cli.metadata import metadata as metadata_group
-from isic_cli.cli.user import user as user_group
-from isic_cli.io.http import get_users_me
-from isic_cli.oauth import get_oauth_client
-from isic_cli.session import get_session
+from isic_cli.cli.types import ByteSize
+from isic_cli.cli.utils import LazyGroup
+from isic_cli.resilience import RATE_LIMITER, CircuitOpenError
+from isic_cli.stats import STATS
+from isic_cli.tracing import TRACER
 from isic_cli.utils.version import check_for_newer_version, get_version, is_dev_install
 
 DOMAINS = {
@@ -52,7 +39,18 @@ def _sentry_atexit_display(pending: int, timeout: int) -> None:
     sys.stderr.flush()
 
 
+# sentry is only initialized once a user has opted in to sending a bug report, this keeps the
+# cost of importing sentry_sdk and its integrations off of the startup path of every command.
 def _sentry_setup():
+    import sentry_sdk
+    from sentry_sdk.integrations.argv import ArgvIntegration
+    from sentry_sdk.integrations.atexit import AtexitIntegration
+    from sentry_sdk.integrations.dedupe import DedupeIntegration
+    from sentry_sdk.integrations.logging import LoggingIntegration
+    from sentry_sdk.integrations.modules import ModulesIntegration
+    from sentry_sdk.integrations.stdlib import StdlibIntegration
+    from sentry_sdk.integrations.threading import ThreadingIntegration
+
     if not is_dev_install():
         sentry_sdk.init(
             SENTRY_DSN,
@@ -79,7 +77,18 @@ def _sentry_setup():
         )
 
 
-@click.group(context_settings={"help_option_names": ["-h", "--help"]}, no_args_is_help=True)
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "accession": "isic_cli.cli.accession:accession",
+        "collection": "isic_cli.cli.collection:collection",
+        "image": "isic_cli.cli.image:image",
+        "metadata": "isic_cli.cli.metadata:metadata",
+        "user": "isic_cli.cli.user:user",
+    },
+    context_settings={"help_option_names": ["-h", "--help"]},
+    no_args_is_help=True,
+)
 @click.option(
     "--guest", is_flag=True, default=False, help="Simulate a non logged in user.", hidden=True
 )
@@ -105,15 +114,57 @@ def _sentry_setup():
     default=False,
     help="Disable the version upgrade check.",
     hidden=True,
+    envvar="ISIC_NO_VERSION_CHECK",
 )
 @click.option("-v", "--verbose", is_flag=True, help="Enable verbose mode.")
+@click.option(
+    "--stats",
+    "print_stats",
+    is_flag=True,
+    default=False,
+    help="Print a summary of HTTP request timings, retries, and transfers on exit.",
+)
+@click.option(
+    "--stats-json",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Write HTTP request statistics as JSON to a file on exit.",
+)
+@click.option(
+    "--trace",
+    type=click.Path(dir_okay=False, writable=True, path_type=Path),
+    help="Record a trace of the command in the chrome trace format (viewable in Perfetto).",
+)
+@click.option(
+    "--max-requests-per-second",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Limit the rate of requests made to the ISIC Archive.",
+)
+@click.option(
+    "--max-bandwidth",
+    type=ByteSize(),
+    help="Limit the download bandwidth, in bytes per second (e.g. 10MB).",
+)
 @click.version_option()
 @click.pass_context
-def cli(ctx, verbose: bool, guest: bool, sandbox: bool, dev: bool, no_version_check: bool):  # noqa: FBT001, C901, PLR0913
+def cli(  # noqa: PLR0913
+    ctx,
+    verbose: bool,  # noqa: FBT001
+    guest: bool,  # noqa: FBT001
+    sandbox: bool,  # noqa: FBT001
+    dev: bool,  # noqa: FBT001
+    no_version_check: bool,  # noqa: FBT001
+    print_stats: bool,  # noqa: FBT001
+    stats_json: Path | None,
+    trace: Path | None,
+    max_requests_per_second: float | None,
+    max_bandwidth: int | None,
+):
     logger.addHandler(logging.StreamHandler(sys.stderr))
     logger.setLevel(logging.WARNING)
 
     if verbose:
+        from http.client import HTTPConnection
+
         HTTPConnection.debuglevel = 1
         requests_log = logging.getLogger("requests.packages.urllib3")
         requests_log.addHandler(logging.StreamHandler(sys.stderr))
@@ -129,60 +180,49 @@ def cli(ctx, verbose: bool, guest: bool, sandbox: bool, dev: bool, no_version_ch
     elif dev:
         env = "dev"
 
-    _sentry_setup()
-
     if no_version_check:
         logger.warning("Disabling the version check could cause errors.")
     else:
         check_for_newer_version()
 
-    oauth = get_oauth_client(f"{DOMAINS[env]}/oauth")
-
-    if not guest:
-        try:
-            oauth.maybe_restore_login()
-        except OAuthError as e:
-            # This is really rare, but in the event of a refresh token being revoked
-            # (this happens in dev all the time) the restoration will fail with an
-            # invalid_grant error.
-            logger.debug(e)
-            oauth.logout()
-            click.secho(
-                "Something went wrong with restoring a login, you may need to log back in.",
-                fg="yellow",
-            )
-
-    with get_session(f"{DOMAINS[env]}/api/v2/", oauth.auth_headers) as session:
-        user = None
-        if oauth.auth_headers:
-            try:
-                user = get_users_me(session)
-            except HTTPError as e:
-                if e.response.status_code == 404:
-                    # perhaps a stale token
-                    oauth.logout()
-                else:
-                    raise
-
-        ctx.obj = IsicContext(
-            oauth=oauth,
-            session=session,
-            env=env,
-            user=user,
-            verbose=verbose,
-        )
+    RATE_LIMITER.configure(
+        max_requests_per_second=max_requests_per_second, max_bandwidth=max_bandwidth
+    )
+
+    ctx.obj = IsicContext(env=env, domain=DOMAINS[env], guest=guest, verbose=verbose)
+    ctx.call_on_close(ctx.obj.close)
+
+    if print_stats or stats_json:
+        STATS.enable()
+        ctx.call_on_close(functools.partial(_report_stats, print_stats, stats_json))
+
+    if trace:
+        TRACER.enable()
+        # close callbacks run in reverse order, so the span ends before the trace is written
+        ctx.call_on_close(functools.partial(TRACER.write, trace))
+        command_span = TRACER.span(f'isic {" ".join(sys.argv[1:])}', "command")
+        command_span.__enter__()
+        ctx.call_on_close(functools.partial(command_span.__exit__, None, None, None))
+
 
+def _report_stats(print_stats: bool, stats_json: Path | None) -> None:  # noqa: FBT001
+    if print_stats:
+        from rich.console import Console
 
-cli.add_command(accession_group, name="accession")
-cli.add_command(collection_group, name="collection")
-cli.add_command(image_group, name="image")
-cli.add_command(metadata_group, name="metadata")
-cli.add_command(user_group, name="user")
+        STATS.print_summary(Console(stderr=True))
+
+    if stats_json:
+        with stats_json.open("w", encoding="utf8") as outfile:
+            json.dump(STATS.to_dict(), outfile, indent=2)
 
 
 def main():
     try:
         cli()
+    except CircuitOpenError as e:
+        # an outage of the archive, rather than a bug worth reporting
+        click.secho(f"{e} Please try again later.", fg="red", err=True)
+        sys.exit(1)
     except Exception as e:  # noqa: BLE001
         click.echo(
             click.style(
@@ -199,19 +239,13 @@ def main():
         user = "-"
 
         if ctx and ctx.obj:
-            env = ctx.obj["env"]
+            env = ctx.obj.env
 
-            if ctx.obj.user:
+            # only report a user that was already fetched, making requests while handling an
+            # unexpected error is likely to cause more errors.
+            if "user" in vars(ctx.obj) and ctx.obj.user:
                 user = ctx.obj.user["id"]
 
-        set_tag("platform", platform.system())
-        set_tag("isic-env", env)
-        # https://pyinstaller.org/en/stable/runtime-information.html#run-time-information
-        set_tag("pyinstaller", getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"))
-
-        set_context("operating system", {"name": platform.platform()})
-        set_context("user", {"id": user})
-
         click.echo(f'isic-cli: v{get_version() or "-"}', err=True)
         click.echo(f"python:   v{platform.python_version()}", err=True)
         click.echo(
@@ -237,6 +271,18 @@ def main():
 
         # this is the only code that actually sends data to sentry, so it's guarded with an opt-in
         if send_bug_report == "y":
+            from sentry_sdk import capture_exception, set_context, set_tag
+
+            _sentry_setup()
+
+            set_tag("platform", platform.system())
+            set_tag("isic-env", env)
+            # https://pyinstaller.org/en/stable/runtime-information.html#run-time-information
+            set_tag("pyinstaller", getattr(sys, "frozen", False) and hasattr(sys, "_MEIPASS"))
+
+            set_context("operating system", {"name": platform.platform()})
+            set_context("user", {"id": user})
+
             capture_exception(e)
         else:
             click.secho("Alternatively you can open an issue below: \n", fg="yellow", err=True)
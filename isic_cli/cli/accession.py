@@ -8,12 +8,11 @@ from typing import TYPE_CHECKING
 
 import click
 from requests.exceptions import HTTPError
-from rich.console import Console
-from s3_file_field_client import S3FileFieldClient
 
 from isic_cli.cli.types import CohortId
 from isic_cli.cli.utils import require_login
 from isic_cli.io.http import create_accession
+from isic_cli.utils.ledger import UploadLedger, file_digest
 
 if TYPE_CHECKING:
     from isic_cli.cli.context import IsicContext
@@ -41,41 +40,77 @@ def upload(
     *,
     json_: bool,
 ):
+    from rich.console import Console
+
+    from isic_cli.cli import DOMAINS
+    from isic_cli.io.upload import ResumableS3FileFieldClient
+
+    content_type = mimetypes.guess_type(accession.name)[0]
+
+    if content_type is None:
+        click.secho(f"Unable to determine content type for {accession.name}.", fg="red", err=True)
+        sys.exit(1)
+
     console = Console(stderr=True)
     with console.status("Uploading"):
-        from isic_cli.cli import DOMAINS
-
-        s3ff_client = S3FileFieldClient(f"{DOMAINS[ctx.env]}/api/v2/s3-upload/", ctx.session)
+        # the ledger allows reruns of an interrupted bulk upload to skip files which already
+        # became accessions, and to resume partially uploaded files.
+        ledger = UploadLedger.load(ctx.env)
+        digest = file_digest(accession)
+        entry = ledger.get(cohort_id, digest) or {}
 
-        with accession.open("rb") as file_stream:
-            content_type = mimetypes.guess_type(accession.name)[0]
+        if entry.get("status") == "created":
+            result = entry["accession"]
+        else:
 
-            if content_type is None:
-                click.secho(
-                    f"Unable to determine content type for {accession.name}.", fg="red", err=True
+            def save_state(state: dict) -> None:
+                ledger.update(
+                    cohort_id,
+                    digest,
+                    {"status": "uploading", "file_name": accession.name, "upload": state},
                 )
-                sys.exit(1)
 
-            field_value = s3ff_client.upload_file(
-                file_stream=file_stream,
-                file_name=accession.name,
-                file_content_type=content_type,
-                field_id="ingest.Accession.original_blob",
+            s3ff_client = ResumableS3FileFieldClient(
+                f"{DOMAINS[ctx.env]}/api/v2/s3-upload/",
+                ctx.session,
+                state=entry.get("upload", {}),
+                save_state=save_state,
             )
 
-        try:
-            result = create_accession(ctx.session, cohort_id, field_value)
-        except HTTPError as e:
-            if "non_field_errors" in e.response.json():
-                click.secho(e.response.json()["non_field_errors"][0], fg="red", err=True)
-                sys.exit(1)
-            else:
-                raise
+            with accession.open("rb") as file_stream:
+                field_value = s3ff_client.upload_file(
+                    file_stream=file_stream,
+                    file_name=accession.name,
+                    file_content_type=content_type,
+                    field_id="ingest.Accession.original_blob",
+                )
+
+            try:
+                result = create_accession(ctx.session, cohort_id, field_value)
+            except HTTPError as e:
+                if "non_field_errors" in e.response.json():
+                    ledger.remove(cohort_id, digest)
+                    click.secho(e.response.json()["non_field_errors"][0], fg="red", err=True)
+                    sys.exit(1)
+                else:
+                    raise
+
+            ledger.update(
+                cohort_id,
+                digest,
+                {"status": "created", "file_name": accession.name, "accession": result},
+            )
 
     if json_:
         click.echo(json.dumps(result, indent=2))
     else:
-        click.secho(f'Accession uploaded, id={result["id"]}.', fg="green")
+        if entry.get("status") == "created":
+            click.secho(
+                f'{accession.name} was already uploaded to this cohort, id={result["id"]}.',
+                fg="yellow",
+            )
+        else:
+            click.secho(f'Accession uploaded, id={result["id"]}.', fg="green")
         click.secho(
             f"Browse accessions: {DOMAINS[ctx.env]}/upload/{cohort_id}/browser/", fg="green"
         )
@@ -7,15 +7,14 @@ from typing import TYPE_CHECKING
 
 import click
 from humanize.number import intcomma
-from rich.console import Console
-from rich.progress import Progress
-from rich.table import Table
 
 from isic_cli.cli.types import CollectionId
 from isic_cli.cli.utils import require_login, suggest_guest_login
 from isic_cli.io.http import bulk_collection_operation, get_collections
 
 if TYPE_CHECKING:
+    from rich.table import Table
+
     from isic_cli.cli.context import IsicContext
 
 logger = logging.getLogger(__name__)
@@ -31,7 +30,9 @@ def _parse_isic_ids(ctx, param, value) -> list[str]:
     return list(isic_ids)
 
 
-def _table_from_summary(summary: dict[str, list[str]], nice_map: dict | None = None):
+def _table_from_summary(summary: dict[str, list[str]], nice_map: dict | None = None) -> Table:
+    from rich.table import Table
+
     nice_map = {} if nice_map is None else nice_map
     table = Table()
 
@@ -69,6 +70,9 @@ def collection(ctx: IsicContext):
 @click.pass_obj
 @suggest_guest_login
 def list_(ctx: IsicContext):
+    from rich.console import Console
+    from rich.table import Table
+
     table = Table("ID", "Name", "Public", "Pinned", "Locked", "DOI")
 
     collections = sorted(get_collections(ctx.session), key=lambda coll: coll["name"])
@@ -101,6 +105,9 @@ def list_(ctx: IsicContext):
 @click.pass_obj
 @require_login
 def add_images(ctx: IsicContext, collection_id: int, from_isic_ids: list[str]):
+    from rich.console import Console
+    from rich.progress import Progress
+
     # TODO: fix this import
     from isic_cli.cli import DOMAINS
 
@@ -143,6 +150,9 @@ def add_images(ctx: IsicContext, collection_id: int, from_isic_ids: list[str]):
 @click.pass_obj
 @require_login
 def remove_images(ctx: IsicContext, collection_id: int, from_isic_ids: list[str]):
+    from rich.console import Console
+    from rich.progress import Progress
+
     # TODO: fix this import
     from isic_cli.cli import DOMAINS
 
@@ -1,18 +1,123 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import cached_property
+import hashlib
+import logging
 from typing import TYPE_CHECKING
 
+import click
+
+from isic_cli.io.http import get_users_me
+from isic_cli.oauth import OAuthTokenAuth, get_oauth_client
+from isic_cli.session import get_session
+from isic_cli.utils.storage import get_data_dir, read_json, write_json
+
 if TYPE_CHECKING:
     from girder_cli_oauth_client import GirderCliOAuthClient
 
     from isic_cli.session import IsicCliSession
 
+logger = logging.getLogger("isic_cli")
+
+
+def _identity_cache_path():
+    return get_data_dir() / "identity.json"
+
+
+def _token_fingerprint(auth_headers: dict) -> str:
+    return hashlib.sha256(auth_headers["Authorization"].encode()).hexdigest()
+
 
 @dataclass
 class IsicContext:
-    oauth: GirderCliOAuthClient
-    session: IsicCliSession
+    """
+    The state shared by all commands.
+
+    Restoring a login and fetching the current user both require network requests, so they
+    are deferred until a command actually accesses the session or user.
+    """
+
     env: str  # One of dev/sandbox/prod
-    user: dict | None = None
+    domain: str
+    guest: bool = False
     verbose: bool | None = False
+
+    @cached_property
+    def oauth(self) -> GirderCliOAuthClient:
+        return get_oauth_client(f"{self.domain}/oauth")
+
+    @cached_property
+    def session(self) -> IsicCliSession:
+        from authlib.integrations.base_client.errors import OAuthError
+
+        if self.guest:
+            return get_session(f"{self.domain}/api/v2/")
+
+        try:
+            self.oauth.maybe_restore_login()
+        except OAuthError as e:
+            # This is really rare, but in the event of a refresh token being revoked
+            # (this happens in dev all the time) the restoration will fail with an
+            # invalid_grant error.
+            logger.debug(e)
+            self.logout()
+            click.secho(
+                "Something went wrong with restoring a login, you may need to log back in.",
+                fg="yellow",
+            )
+
+        session = get_session(f"{self.domain}/api/v2/")
+        if self.oauth.auth_headers:
+            # rather than fixed headers, so long running commands outlive the access token
+            session.auth = OAuthTokenAuth(self.oauth)
+        return session
+
+    @cached_property
+    def user(self) -> dict | None:
+        from requests.exceptions import HTTPError
+
+        session = self.session
+
+        if self.guest or not self.oauth.auth_headers:
+            return None
+
+        # the identity is cached alongside a fingerprint of the token it was fetched with, so
+        # logging in as someone else (or a token refresh) invalidates it.
+        fingerprint = _token_fingerprint(self.oauth.auth_headers)
+        cache = read_json(_identity_cache_path())
+        if cache.get(self.env, {}).get("token") == fingerprint:
+            return cache[self.env]["user"]
+
+        try:
+            user = get_users_me(session)
+        except HTTPError as e:
+            if e.response.status_code == 404:
+                # perhaps a stale token
+                self.logout()
+                return None
+            raise
+
+        cache[self.env] = {"token": fingerprint, "user": user}
+        write_json(_identity_cache_path(), cache)
+        return user
+
+    @property
+    def cache_namespace(self) -> str:
+        """A prefix for cache keys of API responses, which vary by environment and user."""
+        if self.session.auth is None:
+            return f"{self.env}:guest"
+
+        return f"{self.env}:{_token_fingerprint(self.oauth.auth_headers)}"
+
+    def logout(self) -> None:
+        self.oauth.logout()
+
+        cache = read_json(_identity_cache_path())
+        if cache.pop(self.env, None) is not None:
+            write_json(_identity_cache_path(), cache)
+
+    def close(self) -> None:
+        # avoid creating a session just to close it
+        if "session" in self.__dict__:
+            self.session.close()
@@ -1,13 +1,12 @@
 from __future__ import annotations
 
 import atexit
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future, ThreadPoolExecutor
 import csv
 import functools
-import itertools
+import json
 import logging
 import os
-from pathlib import Path
 import signal
 import sys
 from typing import TYPE_CHECKING
@@ -16,41 +15,45 @@ import click
 from click.types import IntRange
 from humanize import intcomma, naturalsize
 from more_itertools.more import chunked
-from rich.console import Console
-from rich.progress import Progress
 
-from isic_cli.cli.types import CommaSeparatedCollectionIds, SearchString
-from isic_cli.cli.utils import _extract_metadata, get_attributions, suggest_guest_login
+from isic_cli.cli.types import (
+    CommaSeparatedCollectionIds,
+    OutputDirectory,
+    PageSize,
+    SearchString,
+)
+from isic_cli.cli.utils import (
+    get_attributions,
+    plan_search,
+    search_images,
+    suggest_guest_login,
+)
 from isic_cli.io.http import (
+    SignedUrlRefresher,
     download_image,
     get_available_disk_space,
-    get_images,
     get_license,
-    get_num_images,
-    get_size_images,
+    skip_failed_downloads,
 )
+from isic_cli.io.sinks import LocalSink, get_sink
+from isic_cli.metadata import MetadataRecords, flatten_metadata
+from isic_cli.stats import STATS
+from isic_cli.tracing import TRACER
 
 if TYPE_CHECKING:
+    from collections.abc import Iterable
+    from pathlib import Path
+
     from isic_cli.cli.context import IsicContext
+    from isic_cli.io.http import AdaptivePageSize
+    from isic_cli.io.sinks import Sink
 
 
 logger = logging.getLogger(__name__)
 
 
 def cleanup_partially_downloaded_files(directory: Path) -> None:
-    permission_errors = False
-    for p in directory.glob(f"**/.isic-partial.{os.getpid()}.*"):
-        # missing_ok=True because it's possible that another thread moved the temporary file to
-        # its final destination after listing it but before unlinking.
-        try:
-            p.unlink(missing_ok=True)
-        except PermissionError:  # noqa: PERF203
-            # frequently on windows this is raised. it appears like this could be caused by
-            # antivirus or various indexers that attempt to use the file shortly after it's
-            # created.
-            permission_errors = True
-
-    if permission_errors:
+    if not LocalSink(directory).cleanup():
         logger.warning(
             click.style(
                 "Permission error while cleaning up one or more partially downloaded files",
@@ -59,6 +62,108 @@ def cleanup_partially_downloaded_files(directory: Path) -> None:
         )
 
 
+def _cleanup_sink(sink: Sink) -> None:
+    if isinstance(sink, LocalSink):
+        cleanup_partially_downloaded_files(sink.directory)
+    else:
+        sink.cleanup()
+
+
+def _raise_for_failed(futures: list[Future]) -> list[Future]:
+    """
+    Raise the exception of any failed download, returning those which are still running.
+
+    Individual images are skipped when they fail (see skip_failed_downloads), so this only
+    raises when the whole download should stop, e.g. with a CircuitOpenError.
+    """
+    running = []
+    for future in futures:
+        if future.done():
+            future.result()
+        else:
+            running.append(future)
+
+    return running
+
+
+def _download_with_threads(  # noqa: PLR0913
+    ctx: IsicContext,
+    sink: Sink,
+    images: Iterable[dict],
+    existing_files: dict[str, int],
+    progress,
+    task,
+) -> MetadataRecords:
+    # See comment above extract_metadata for why this is necessary. Only the metadata of
+    # each image is kept, rather than the whole image.
+    records = MetadataRecords()
+    func = functools.partial(
+        skip_failed_downloads(download_image),
+        to=sink,
+        progress=progress,
+        task=task,
+        refresh_url=SignedUrlRefresher(ctx.session).refresh,
+        existing_files=existing_files,
+    )
+    futures: list[Future] = []
+    with ThreadPoolExecutor(max(10, os.cpu_count() or 10)) as thread_pool:
+        try:
+            for image_chunk in chunked(images, 100):
+                for image in image_chunk:
+                    records.append(flatten_metadata(image))
+                futures = _raise_for_failed(futures)
+                futures.extend(thread_pool.submit(func, image) for image in image_chunk)
+
+            for future in futures:
+                future.result()
+        except BaseException:
+            thread_pool.shutdown(cancel_futures=True)
+            raise
+
+    return records
+
+
+def _download_with_processes(  # noqa: PLR0913
+    ctx: IsicContext,
+    sink: Sink,
+    outdir: Path | str,
+    images: Iterable[dict],
+    existing_files: dict[str, int],
+    progress,
+    task,
+    processes: int,
+) -> MetadataRecords:
+    from isic_cli.io.processes import ProcessDownloader
+
+    def advance(future: Future[int]) -> None:
+        if not future.cancelled() and future.exception() is None:
+            progress.update(task, advance=future.result())
+
+    records = MetadataRecords()
+    futures = []
+    with ProcessDownloader(
+        processes,
+        outdir,
+        existing_files=existing_files,
+        # refreshed by the parent, which keeps the login fresh
+        refresh_url=SignedUrlRefresher(ctx.session).refresh,
+    ) as downloader:
+        # small batches, so progress is reported smoothly
+        for image_chunk in chunked(images, 25):
+            for image in image_chunk:
+                records.append(flatten_metadata(image))
+
+            futures = _raise_for_failed(futures)
+            future = downloader.submit(image_chunk)
+            future.add_done_callback(advance)
+            futures.append(future)
+
+        for future in futures:
+            future.result()
+
+    return records
+
+
 def _check_and_confirm_available_disk_space(outdir: Path, download_size: int) -> None:
     available_space = get_available_disk_space(outdir)
 
@@ -78,6 +183,36 @@ def _check_and_confirm_available_disk_space(outdir: Path, download_size: int) ->
             sys.exit(0)
 
 
+def _parse_fields(ctx, param, value: str | None) -> list[tuple[str, ...]] | None:
+    if not value:
+        return None
+
+    fields = [tuple(field.strip().split(".")) for field in value.split(",") if field.strip()]
+    if any("" in field for field in fields):
+        raise click.BadParameter(f'Improperly formatted value "{value}".')
+
+    return fields
+
+
+def _project(image: dict, fields: list[tuple[str, ...]]) -> dict:
+    """Return only the (dotted) fields of an image, preserving their nesting."""
+    projected: dict = {}
+
+    for path in fields:
+        value = image
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                break
+            value = value[key]
+        else:
+            target = projected
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+
+    return projected
+
+
 @click.group(short_help="Manage images.")
 @click.pass_obj
 def image(ctx):
@@ -112,22 +247,41 @@ def image(ctx):
     type=IntRange(min=0),
     help="Download at most LIMIT images. Use a value of 0 to download all images.",
 )
-@click.argument(
-    "outdir",
-    type=click.Path(file_okay=False, dir_okay=True, path_type=Path),
+@click.option(
+    "--page-size",
+    type=PageSize(),
+    help=(
+        "The number of results to fetch per request, or 'auto' to grow pages while the "
+        "server responds quickly."
+    ),
+)
+@click.option(
+    "--processes",
+    default=1,
+    type=IntRange(min=1),
+    help=(
+        "Download with this many worker processes, each with their own threads. Useful on hosts "
+        "with more bandwidth than a single process can use."
+    ),
 )
+@click.argument("outdir", type=OutputDirectory())
 @click.pass_obj
 @suggest_guest_login
-def download(
+def download(  # noqa: PLR0913, PLR0915
     ctx: IsicContext,
     search: str,
     collections: str,
     limit: int,
-    outdir: Path,
+    page_size: int | AdaptivePageSize | None,
+    processes: int,
+    outdir: Path | str,
 ):
     """
     Download images from the ISIC Archive.
 
+    OUTDIR is a local directory, or a s3://bucket/prefix url to upload images and metadata
+    straight to S3 compatible object storage (requires boto3).
+
     The search query uses a simple DSL syntax.
 
     Some example queries are:
@@ -138,6 +292,20 @@ def download(
 
     anatom_site_general:*torso AND image_type:dermoscopic
     """
+    from rich.console import Console
+    from rich.progress import Progress
+
+    if processes > 1 and (STATS.enabled or TRACER.enabled):
+        # the requests of worker processes aren't recorded
+        raise click.UsageError(
+            "Illegal usage: --stats, --stats-json, and --trace can't be combined with --processes."
+        )
+
+    # only show size information when downloading all images (no limit) because when
+    # a limit is applied we can't accurately predict which specific images will be
+    # downloaded.
+    plan = plan_search(ctx, search, collections, include_size=limit == 0, page_size=page_size)
+
     if not search and not collections and limit == 0:
         click.echo()
         click.secho(
@@ -151,29 +319,29 @@ def download(
         )
         click.echo()
 
-    outdir.mkdir(parents=True, exist_ok=True)
+    sink = get_sink(outdir)
+    sink.prepare()
+    with TRACER.span("index output directory", "planning"):
+        existing_files = sink.index()
 
     def signal_handler(signum, frame):
-        cleanup_partially_downloaded_files(outdir)
+        _cleanup_sink(sink)
         sys.exit(1)
 
     # remove partially downloaded files on exit
-    atexit.register(cleanup_partially_downloaded_files, outdir)
+    atexit.register(_cleanup_sink, sink)
     # also remove partially downloaded files on SIGINT/SIGTERM
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
-    archive_num_images = get_num_images(ctx.session, search, collections)
+    archive_num_images = plan.num_images
     download_num_images = archive_num_images if limit == 0 else min(archive_num_images, limit)
     nice_num_images = intcomma(download_num_images)
 
-    # only show size information when downloading all images (no limit) because when
-    # a limit is applied we can't accurately predict which specific images will be
-    # downloaded.
-    if limit == 0:
-        archive_total_size = get_size_images(ctx.session, search, collections)
-        nice_total_size = naturalsize(archive_total_size)
-        _check_and_confirm_available_disk_space(outdir, archive_total_size)
+    if plan.total_size is not None:
+        nice_total_size = naturalsize(plan.total_size)
+        if isinstance(sink, LocalSink):
+            _check_and_confirm_available_disk_space(sink.directory, plan.total_size)
 
     with Progress(console=Console(file=sys.stderr)) as progress:
         if limit == 0:
@@ -183,44 +351,120 @@ def download(
 
         task = progress.add_task(message, total=download_num_images)
 
-        images_iterator = itertools.islice(
-            get_images(ctx.session, search, collections), download_num_images
+        images_iterator = search_images(
+            ctx, plan, search, collections, limit=limit, page_size=page_size
         )
 
-        # See comment above _extract_metadata for why this is necessary
-        images = []
-        func = functools.partial(download_image, to=outdir, progress=progress, task=task)
-        with ThreadPoolExecutor(max(10, os.cpu_count() or 10)) as thread_pool:
-            for image_chunk in chunked(images_iterator, 100):
-                images.extend(image_chunk)
-                thread_pool.map(func, image_chunk)
-
-        headers, records = _extract_metadata(images)
-        with (outdir / "metadata.csv").open("w", newline="", encoding="utf8") as outfile:
-            writer = csv.DictWriter(outfile, headers)
+        if processes > 1:
+            records = _download_with_processes(
+                ctx, sink, outdir, images_iterator, existing_files, progress, task, processes
+            )
+        else:
+            records = _download_with_threads(
+                ctx, sink, images_iterator, existing_files, progress, task
+            )
+
+        with (
+            TRACER.span("write metadata.csv", "output"),
+            sink.open("metadata.csv", text=True) as outfile,
+        ):
+            writer = csv.DictWriter(outfile, records.fields)
             writer.writeheader()
             writer.writerows(records)
 
-        with (outdir / "attribution.txt").open("w", encoding="utf8") as outfile:
+        with (
+            TRACER.span("write attribution.txt", "output"),
+            sink.open("attribution.txt", text=True) as outfile,
+        ):
             # TODO: os.linesep?
             outfile.write("\n\n".join(get_attributions(records)))
 
-        licenses = {record["copyright_license"] for record in records}
-        (outdir / "licenses").mkdir(exist_ok=True)
-        for license_type in licenses:
-            with (outdir / "licenses" / f"{license_type}.txt").open("w") as outfile:
-                outfile.write(get_license(ctx.session, license_type))
+        licenses = set(records.value_counts("copyright_license"))
+        with TRACER.span("fetch licenses", "output", licenses=sorted(licenses)):
+            for license_type in licenses:
+                with sink.open(f"licenses/{license_type}.txt", text=True) as outfile:
+                    outfile.write(get_license(ctx.session, license_type))
 
     click.echo()
-    click.secho(f"Successfully downloaded {nice_num_images} images to {outdir}/.", fg="green")
+    click.secho(f"Successfully downloaded {nice_num_images} images to {sink}.", fg="green")
     click.secho(
-        f'Successfully wrote {nice_num_images} metadata records to {outdir / "metadata.csv"}.',
+        f"Successfully wrote {nice_num_images} metadata records to "
+        f'{sink.location("metadata.csv")}.',
         fg="green",
     )
     click.secho(
-        f'Successfully wrote attributions to {outdir / "attribution.txt"}.',
+        f'Successfully wrote attributions to {sink.location("attribution.txt")}.',
         fg="green",
     )
     click.secho(
-        f'Successfully wrote {len(licenses)} license(s) to {outdir / "licenses"}.', fg="green"
+        f'Successfully wrote {len(licenses)} license(s) to {sink.location("licenses")}.',
+        fg="green",
     )
+
+
+@image.command(name="list", help="List images as JSON lines, optionally filtering results.")
+@click.option(
+    "-s",
+    "--search",
+    type=SearchString(),
+    default="",
+    help="e.g. 'diagnosis_3:\"Melanoma Invasive\" AND age_approx:50'",
+)
+@click.option(
+    "-c",
+    "--collections",
+    type=CommaSeparatedCollectionIds(),
+    default="",
+    help=(
+        "Filter the images based on a comma separated string of collection"
+        " ids (see isic collection list)."
+    ),
+)
+@click.option(
+    "-l",
+    "--limit",
+    default=0,
+    metavar="INTEGER",
+    type=IntRange(min=0),
+    help="List at most LIMIT images. Use a value of 0 to list all images.",
+)
+@click.option(
+    "--page-size",
+    type=PageSize(),
+    help=(
+        "The number of results to fetch per request, or 'auto' to grow pages while the "
+        "server responds quickly."
+    ),
+)
+@click.option(
+    "-f",
+    "--fields",
+    callback=_parse_fields,
+    help="Comma separated fields to include, e.g. 'isic_id,files.full.url,files.full.size'.",
+)
+@click.pass_obj
+@suggest_guest_login
+def list_(  # noqa: PLR0913
+    ctx: IsicContext,
+    search: str,
+    collections: str,
+    limit: int,
+    page_size: int | AdaptivePageSize | None,
+    fields: list[tuple[str, ...]] | None,
+):
+    """
+    List images from the ISIC Archive as one JSON object per line.
+
+    Results are written as they're fetched, so the output can be piped into other tools.
+    """
+    plan = plan_search(ctx, search, collections, page_size=page_size)
+    images = search_images(ctx, plan, search, collections, limit=limit, page_size=page_size)
+
+    try:
+        for image in images:
+            click.echo(json.dumps(_project(image, fields) if fields else image))
+    except BrokenPipeError:
+        # the reader went away (e.g. head), see https://docs.python.org/3/library/signal.html#note-on-sigpipe
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
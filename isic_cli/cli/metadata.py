@@ -2,7 +2,6 @@ from __future__ import annotations
 
 from collections import defaultdict
 import csv
-import itertools
 import os
 from pathlib import Path
 import sys
@@ -11,25 +10,26 @@ from typing import TYPE_CHECKING
 import click
 from click.types import IntRange
 from humanize import intcomma
-from isic_metadata.metadata import MetadataBatch, MetadataRow, convert_errors
-from isic_metadata.utils import get_unstructured_columns
-from pydantic import ValidationError
-from rich.console import Console
-from rich.progress import Progress, track
-from rich.table import Table
 
 from isic_cli.cli.types import (
     CommaSeparatedCollectionIds,
+    PageSize,
     SearchString,
     WritableFilePath,
 )
-from isic_cli.cli.utils import _extract_metadata, suggest_guest_login
-from isic_cli.io.http import get_images, get_num_images
+from isic_cli.cli.utils import (
+    plan_search,
+    search_images,
+    suggest_guest_login,
+)
+from isic_cli.metadata import extract_metadata
+from isic_cli.tracing import TRACER
 
 if TYPE_CHECKING:
     import io
 
     from isic_cli.cli.context import IsicContext
+    from isic_cli.io.http import AdaptivePageSize
 
 
 @click.group(short_help="Manage metadata.")
@@ -45,6 +45,13 @@ def metadata(obj):
 )
 def validate(csv_file: io.TextIOWrapper):  # noqa: C901, PLR0915, PLR0912
     """Validate metadata from a local csv."""
+    from isic_metadata.metadata import MetadataBatch, MetadataRow, convert_errors
+    from isic_metadata.utils import get_unstructured_columns
+    from pydantic import ValidationError
+    from rich.console import Console
+    from rich.progress import track
+    from rich.table import Table
+
     console = Console()
 
     # get number of rows in csv
@@ -165,6 +172,14 @@ def validate(csv_file: io.TextIOWrapper):  # noqa: C901, PLR0915, PLR0912
     type=IntRange(min=0),
     help="Download at most LIMIT metadata records. Use a value of 0 to download all records.",
 )
+@click.option(
+    "--page-size",
+    type=PageSize(),
+    help=(
+        "The number of results to fetch per request, or 'auto' to grow pages while the "
+        "server responds quickly."
+    ),
+)
 @click.option(
     "-o",
     "--outfile",
@@ -173,11 +188,12 @@ def validate(csv_file: io.TextIOWrapper):  # noqa: C901, PLR0915, PLR0912
 )
 @click.pass_obj
 @suggest_guest_login
-def download(
+def download(  # noqa: PLR0913
     ctx: IsicContext,
     search: str,
     collections: str,
     limit: int,
+    page_size: int | AdaptivePageSize | None,
     outfile: Path,
 ):
     """
@@ -193,16 +209,21 @@ def download(
 
     anatom_site_general:*torso AND image_type:dermoscopic
     """
-    archive_num_images = get_num_images(ctx.session, search, collections)
+    from rich.console import Console
+    from rich.progress import Progress
+
+    plan = plan_search(ctx, search, collections, page_size=page_size)
+    archive_num_images = plan.num_images
     download_num_images = archive_num_images if limit == 0 else min(archive_num_images, limit)
     nice_num_images = intcomma(download_num_images)
-    images = itertools.islice(get_images(ctx.session, search, collections), download_num_images)
+    images = search_images(ctx, plan, search, collections, limit=limit, page_size=page_size)
 
     with Progress(console=Console(file=sys.stderr)) as progress:
         task = progress.add_task(
             f"Downloading metadata records ({nice_num_images})", total=download_num_images
         )
-        headers, records = _extract_metadata(images, progress, task)
+        with TRACER.span("extract metadata", "metadata"):
+            headers, records = extract_metadata(images, progress, task)
 
     if records:
         if outfile is None or os.fsdecode(outfile) == "-":
@@ -211,7 +232,8 @@ def download(
         else:
             stream = Path(outfile).open("w", newline="", encoding="utf8")  # noqa: SIM115
 
-        writer = csv.DictWriter(stream, headers)
-        writer.writeheader()
-        for record in records:
-            writer.writerow(record)
+        with TRACER.span("write csv", "output"):
+            writer = csv.DictWriter(stream, headers)
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
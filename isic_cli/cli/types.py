@@ -1,13 +1,29 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+import importlib.util
+from pathlib import Path
 import re
 import sys
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
 import click
 from click.types import IntParamType
 from requests.models import HTTPError
 
-from isic_cli.io.http import get_cohort, get_collection
+from isic_cli.io.http import AdaptivePageSize, get_cohort, get_collection
+from isic_cli.tracing import TRACER
+from isic_cli.utils.cache import TTLCache
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    from isic_cli.session import IsicCliSession
+
+# lookups are only used for validating user input, so a short lived cache is enough to make
+# repeated invocations cheap without hiding changes for long.
+LOOKUP_CACHE_TTL = 60 * 5
 
 unsupported_diagnosis_message = (
     "\n\nThe 'diagnosis' search filter is no longer supported.\n"
@@ -21,6 +37,53 @@ unsupported_diagnosis_message = (
 )
 
 
+def _lookup(
+    ctx: click.Context,
+    kind: str,
+    ids: list[str],
+    fetch: Callable[[IsicCliSession, str], dict],
+    *,
+    use_cache: bool = True,
+) -> dict[str, dict | None]:
+    """
+    Look up several objects by id concurrently, returning None for ids which don't exist.
+
+    Found objects are cached across invocations for LOOKUP_CACHE_TTL seconds. Without
+    use_cache every object is fetched again, e.g. when its current state matters.
+    """
+    if not ids:
+        return {}
+
+    cache = TTLCache(f"{kind}-lookups", LOOKUP_CACHE_TTL)
+    namespace = ctx.obj.cache_namespace
+    session = ctx.obj.session
+
+    results = {id_: cache.get(f"{namespace}:{id_}") if use_cache else None for id_ in ids}
+    missing = [id_ for id_, result in results.items() if result is None]
+
+    if missing:
+        with (
+            TRACER.span(f"look up {kind} ids", "validation", ids=missing),
+            ThreadPoolExecutor(min(len(missing), 10)) as thread_pool,
+        ):
+            futures = {id_: thread_pool.submit(fetch, session, id_) for id_ in missing}
+
+        for id_, future in futures.items():
+            try:
+                results[id_] = future.result()
+            except HTTPError as e:  # noqa: PERF203
+                if e.response.status_code == 404:
+                    results[id_] = None
+                else:
+                    raise
+
+        cache.update(
+            {f"{namespace}:{id_}": results[id_] for id_ in missing if results[id_] is not None}
+        )
+
+    return results
+
+
 class SearchString(click.ParamType):
     name = "search_string"
 
@@ -30,9 +93,8 @@ class SearchString(click.ParamType):
         if "diagnosis:" in value:
             self.fail(click.style(unsupported_diagnosis_message, fg="yellow"), param, ctx)
 
-        r = ctx.obj.session.get("images/search/", params={"query": value, "limit": 1})
-        if r.status_code == 400 and "message" in r.json() and "query" in r.json()["message"]:
-            self.fail(f'Invalid search query string "{value}"', param, ctx)
+        # the query is validated by the server as part of the first search request, see
+        # plan_search.
         return value
 
 
@@ -45,24 +107,20 @@ class CommaSeparatedCollectionIds(click.ParamType):
         if value != "" and not re.match(r"^(\d+)(,\d+)*$", value):
             self.fail(f'Improperly formatted value "{value}".', param, ctx)
 
-        collection_ids = value.split(",") if value else []
+        collection_ids = list(dict.fromkeys(value.split(","))) if value else []
+        collections = _lookup(ctx, "collection", collection_ids, get_collection)
 
         for collection_id in collection_ids:
-            try:
-                get_collection(ctx.obj.session, collection_id)
-            except HTTPError as e:  # noqa: PERF203
-                if e.response.status_code == 404:
-                    append = ""
-                    if not ctx.obj.user:
-                        append = "Logging in may help (see `isic user login`)."
-
-                    self.fail(
-                        f"Collection {collection_id} does not exist or you don't have access to it. {append}",  # noqa: E501
-                        param,
-                        ctx,
-                    )
-                else:
-                    raise
+            if collections[collection_id] is None:
+                append = ""
+                if not ctx.obj.user:
+                    append = "Logging in may help (see `isic user login`)."
+
+                self.fail(
+                    f"Collection {collection_id} does not exist or you don't have access to it. {append}",  # noqa: E501
+                    param,
+                    ctx,
+                )
 
         return value
 
@@ -77,15 +135,16 @@ class CollectionId(IntParamType):
     def convert(self, value: str, param, ctx) -> str:
         value = super().convert(value, param, ctx)
 
-        try:
-            collection = get_collection(ctx.obj.session, value)
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                self.fail(
-                    f"Collection {value} does not exist or you don't have access to it.", param, ctx
-                )
-            else:
-                raise
+        # a collection can be locked at any time, so the cache is only good enough for commands
+        # which don't modify it
+        collection = _lookup(
+            ctx, "collection", [str(value)], get_collection, use_cache=bool(self.locked_okay)
+        )[str(value)]
+
+        if collection is None:
+            self.fail(
+                f"Collection {value} does not exist or you don't have access to it.", param, ctx
+            )
 
         if collection["locked"] and not self.locked_okay:
             click.secho(f'"{collection["name"]}" is locked for modifications.', err=True, fg="red")
@@ -100,19 +159,73 @@ class CohortId(IntParamType):
     def convert(self, value: str, param, ctx) -> str:
         value = super().convert(value, param, ctx)
 
-        try:
-            get_cohort(ctx.obj.session, value)
-        except HTTPError as e:
-            if e.response.status_code == 404:
-                self.fail(
-                    f"Cohort {value} does not exist or you don't have access to it.", param, ctx
-                )
-            else:
-                raise
+        if _lookup(ctx, "cohort", [str(value)], get_cohort)[str(value)] is None:
+            self.fail(f"Cohort {value} does not exist or you don't have access to it.", param, ctx)
 
         return value
 
 
+_BYTE_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1000,
+    "kb": 1000,
+    "m": 1000**2,
+    "mb": 1000**2,
+    "g": 1000**3,
+    "gb": 1000**3,
+    "kib": 1024,
+    "mib": 1024**2,
+    "gib": 1024**3,
+}
+
+
+class ByteSize(click.ParamType):
+    """A number of bytes, optionally with a unit e.g. 500KB, 10MB, or 1.5GiB."""
+
+    name = "byte_size"
+
+    def convert(self, value, param, ctx) -> int:
+        if isinstance(value, int):
+            return value
+
+        match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", value)
+        if not match or match.group(2).lower() not in _BYTE_UNITS:
+            self.fail(f'Invalid size "{value}", e.g. 500KB or 10MB.', param, ctx)
+
+        size = int(float(match.group(1)) * _BYTE_UNITS[match.group(2).lower()])
+        if size <= 0:
+            self.fail("Size must be greater than 0.", param, ctx)
+
+        return size
+
+
+class PageSize(click.ParamType):
+    """A number of results per page, or "auto" to adapt it to how quickly pages are served."""
+
+    name = "page_size"
+
+    def get_metavar(self, param, ctx=None):
+        return "[INTEGER|auto]"
+
+    def convert(self, value, param, ctx) -> int | AdaptivePageSize:
+        if isinstance(value, (int, AdaptivePageSize)):
+            return value
+
+        if value == "auto":
+            return AdaptivePageSize()
+
+        try:
+            page_size = int(value)
+        except ValueError:
+            self.fail(f'"{value}" is not an integer or "auto".', param, ctx)
+
+        if page_size < 1:
+            self.fail("Page size must be at least 1.", param, ctx)
+
+        return page_size
+
+
 class WritableFilePath(click.Path):
     name = "writable_file_path"
 
@@ -141,3 +254,26 @@ class WritableFilePath(click.Path):
                 self.fail(f"Permission denied - cannot write to '{value}'.", param, ctx)
 
         return value
+
+
+class OutputDirectory(click.Path):
+    """A local directory, or a s3://bucket/prefix url to write to object storage instead."""
+
+    name = "output_directory"
+
+    def __init__(self) -> None:
+        super().__init__(file_okay=False, dir_okay=True, path_type=Path)
+
+    def convert(self, value, param, ctx) -> Path | str:
+        if isinstance(value, str) and value.startswith("s3://"):
+            if not urlparse(value).netloc:
+                self.fail(f"'{value}' is missing a bucket name.", param, ctx)
+            if importlib.util.find_spec("boto3") is None:
+                self.fail(
+                    "Writing to S3 requires boto3, install it with `pip install isic-cli[s3]`.",
+                    param,
+                    ctx,
+                )
+            return value
+
+        return super().convert(value, param, ctx)
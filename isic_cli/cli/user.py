@@ -4,7 +4,6 @@ import json
 import sys
 from typing import TYPE_CHECKING
 
-from authlib.integrations.base_client.errors import OAuthError
 import click
 
 if TYPE_CHECKING:
@@ -21,6 +20,8 @@ def user(ctx):
 @click.pass_obj
 def login(obj: IsicContext):
     """Login to the ISIC Archive."""
+    from authlib.integrations.base_client.errors import OAuthError
+
     if obj.user:
         click.echo(f'Hello {obj.user["email"]}!')
     else:
@@ -42,7 +43,7 @@ def login(obj: IsicContext):
 @click.pass_obj
 def logout(obj: IsicContext):
     """Logout of the ISIC Archive."""
-    obj.oauth.logout()
+    obj.logout()
 
 
 @user.command(hidden=True)
@@ -1,15 +1,53 @@
 from __future__ import annotations
 
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import importlib
+import itertools
 import sys
 from typing import TYPE_CHECKING
 
 import click
 
+from isic_cli.io.http import (
+    InvalidSearchError,
+    get_images,
+    get_images_page,
+    get_images_partitioned,
+    get_size_images,
+    page_limit,
+)
+from isic_cli.metadata import MetadataRecords
+from isic_cli.tracing import TRACER
+
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Iterable, Iterator
 
     from isic_cli.cli.context import IsicContext
+    from isic_cli.io.http import AdaptivePageSize
+
+
+class LazyGroup(click.Group):
+    """
+    A click group which imports the module of a subcommand only when it's needed.
+
+    lazy_subcommands maps each command name to a "module.path:attribute" string.
+    """
+
+    def __init__(self, *args, lazy_subcommands: dict[str, str] | None = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        return sorted([*super().list_commands(ctx), *self.lazy_subcommands])
+
+    def get_command(self, ctx: click.Context, cmd_name: str) -> click.Command | None:
+        if cmd_name in self.lazy_subcommands:
+            module_name, attribute = self.lazy_subcommands[cmd_name].split(":")
+            return getattr(importlib.import_module(module_name), attribute)
+
+        return super().get_command(ctx, cmd_name)
 
 
 def suggest_guest_login(f):
@@ -38,37 +76,85 @@ def require_login(f):
     return decorator
 
 
-# This is memory inefficient but unavoidable since the CSV needs to look at ALL
-# records to determine what the final headers should be. The alternative would
-# be to iterate through all images_iterator twice (hitting the API each time).
-def _extract_metadata(
-    images: Iterable[dict], progress=None, task=None
-) -> tuple[list[str], list[dict]]:
-    metadata = []
-    base_fields = ["isic_id", "attribution", "copyright_license"]
-    metadata_fields = set()
-
-    for image in images:
-        metadata_fields |= set(image["metadata"]["acquisition"].keys())
-        metadata_fields |= set(image["metadata"]["clinical"].keys())
-        metadata.append(
-            {
-                "isic_id": image["isic_id"],
-                "attribution": image["attribution"],
-                "copyright_license": image["copyright_license"],
-                **image["metadata"]["acquisition"],
-                **image["metadata"]["clinical"],
-            }
+@dataclass
+class SearchPlan:
+    first_page: dict
+    total_size: int | None = None
+
+    @property
+    def num_images(self) -> int:
+        return self.first_page["count"]
+
+
+def plan_search(
+    ctx: IsicContext,
+    search: str,
+    collections: str,
+    *,
+    include_size: bool = False,
+    page_size: int | AdaptivePageSize | None = None,
+) -> SearchPlan:
+    """
+    Make the requests needed before downloading search results, concurrently.
+
+    The first page of results doubles as validation of the search query and as the count of
+    matching images, so downloading can begin after roughly one round trip.
+    """
+    session = ctx.session
+
+    with TRACER.span("plan search", "planning"), ThreadPoolExecutor(2) as thread_pool:
+        first_page = thread_pool.submit(
+            get_images_page, session, search, collections, page_limit(page_size)
+        )
+        total_size = (
+            thread_pool.submit(get_size_images, session, search, collections)
+            if include_size
+            else None
         )
 
-        if progress is not None and task is not None:
-            progress.update(task, advance=1)
+        try:
+            return SearchPlan(
+                first_page=first_page.result(),
+                total_size=total_size.result() if total_size else None,
+            )
+        except InvalidSearchError as e:
+            raise click.BadParameter(str(e), param_hint="'-s' / '--search'") from e
+
+
+def search_images(  # noqa: PLR0913
+    ctx: IsicContext,
+    plan: SearchPlan,
+    search: str,
+    collections: str,
+    *,
+    limit: int = 0,
+    page_size: int | AdaptivePageSize | None = None,
+) -> Iterator[dict]:
+    """
+    Iterate over the images of a planned search.
+
+    Without a limit, searches across several collections paginate each collection
+    concurrently. A limit keeps the order of the archive, so the same images are returned
+    each time.
+    """
+    if limit:
+        return itertools.islice(
+            get_images(
+                ctx.session, search, collections, first_page=plan.first_page, page_size=page_size
+            ),
+            limit,
+        )
 
-    return base_fields + sorted(metadata_fields), metadata
+    return get_images_partitioned(
+        ctx.session, search, collections, first_page=plan.first_page, page_size=page_size
+    )
 
 
-def get_attributions(images: Iterable[dict]) -> list[str]:
-    counter = Counter(r["attribution"] for r in images)
+def get_attributions(images: Iterable[dict] | MetadataRecords) -> list[str]:
+    if isinstance(images, MetadataRecords):
+        counter = images.value_counts("attribution")
+    else:
+        counter = Counter(r["attribution"] for r in images)
     # sort by the number of images descending, then the name of the institution ascending
     attributions = sorted(counter.most_common(), key=lambda v: (-v[1], v[0]))
     # push anonymous attributions to the end
@@ -0,0 +1,364 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import itertools
+from typing import TYPE_CHECKING, TypeVar
+import zlib
+
+from isic_cli.io.http import (
+    AdaptivePageSize,
+    SignedUrlRefresher,
+    bulk_collection_operation,
+    download_image,
+    get_collections,
+    get_image_bytes,
+    get_images,
+    get_images_page,
+)
+from isic_cli.io.sinks import get_sink
+from isic_cli.metadata import extract_metadata, flatten_metadata
+from isic_cli.oauth import OAuthTokenAuth, get_oauth_client
+from isic_cli.session import get_session
+
+if TYPE_CHECKING:
+    from collections.abc import (
+        AsyncIterable,
+        AsyncIterator,
+        Callable,
+        Iterable,
+        Iterator,
+        Mapping,
+    )
+    from pathlib import Path
+    from typing import TextIO
+
+    from requests.auth import AuthBase
+
+    from isic_cli.io.sinks import Sink
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+DEFAULT_DOMAIN = "https://api.isic-archive.com"
+
+
+def _imap(
+    func: Callable[[T], R], items: Iterable[T], max_workers: int, prefetch: int | None = None
+) -> Iterator[R]:
+    """
+    Like ThreadPoolExecutor.map, but consuming items lazily.
+
+    Results are yielded in order, with at most prefetch (by default twice max_workers) items
+    in flight, so arbitrarily long iterators can be mapped without holding them in memory.
+    """
+    prefetch = max(prefetch or max_workers * 2, 1)
+
+    with ThreadPoolExecutor(max_workers) as thread_pool:
+        in_flight = deque()
+        for item in items:
+            in_flight.append(thread_pool.submit(func, item))
+            if len(in_flight) >= prefetch:
+                yield in_flight.popleft().result()
+
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+async def _batches(items: Iterable[T] | AsyncIterable[T], size: int) -> AsyncIterator[list[T]]:
+    """Group items into lists, consuming blocking iterators (e.g. searches) on a thread."""
+    if hasattr(items, "__aiter__"):
+        batch = []
+        async for item in items:
+            batch.append(item)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    else:
+        iterator = iter(items)
+        while batch := await asyncio.to_thread(list, itertools.islice(iterator, size)):
+            yield batch
+
+
+def _collections_param(collections: Iterable[int]) -> str:
+    return ",".join(str(collection_id) for collection_id in collections)
+
+
+class IsicClient:
+    """
+    A client for using the ISIC Archive from Python, rather than the command line.
+
+    Requests go through the same session as the cli, sharing its retries, rate limits, and
+    circuit breakers. Searches are streamed a page at a time.
+
+    Example:
+        with IsicClient() as client:
+            for image, content in client.fetch_images(client.search("age_approx:50")):
+                ...
+    """
+
+    def __init__(
+        self,
+        domain: str = DEFAULT_DOMAIN,
+        *,
+        auth_headers: dict | None = None,
+        auth: AuthBase | None = None,
+        max_workers: int = 10,
+    ) -> None:
+        self.domain = domain
+        self.max_workers = max_workers
+        self.session = get_session(f"{domain}/api/v2/", auth_headers)
+        self.session.auth = auth
+        self._refresher = SignedUrlRefresher(self.session)
+
+    @classmethod
+    def from_login(cls, domain: str = DEFAULT_DOMAIN, **kwargs) -> IsicClient:
+        """Create a client authenticated as the user logged in with `isic user login`."""
+        oauth = get_oauth_client(f"{domain}/oauth")
+        oauth.maybe_restore_login()
+        return cls(domain, auth=OAuthTokenAuth(oauth) if oauth.auth_headers else None, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.session.close()
+
+    def count(self, query: str = "", collections: Iterable[int] = ()) -> int:
+        """Return the number of images matching a search."""
+        return get_images_page(self.session, query, _collections_param(collections), 1)["count"]
+
+    def search(
+        self,
+        query: str = "",
+        collections: Iterable[int] = (),
+        page_size: int | AdaptivePageSize | None = None,
+    ) -> Iterator[dict]:
+        """
+        Iterate over the images matching a search, fetching pages as they're needed.
+
+        page_size defaults to the server's, pass an AdaptivePageSize to adapt it.
+        """
+        return get_images(self.session, query, _collections_param(collections), page_size=page_size)
+
+    def fetch_image(self, image: dict) -> bytes:
+        """Fetch the file of an image (from search results) into memory."""
+        return get_image_bytes(image, self._refresher.refresh)
+
+    def fetch_images(self, images: Iterable[dict]) -> Iterator[tuple[dict, bytes]]:
+        """Fetch the files of images concurrently, yielding (image, content) in order."""
+        return _imap(lambda image: (image, self.fetch_image(image)), images, self.max_workers)
+
+    def stream_images(  # noqa: PLR0913
+        self,
+        query: str = "",
+        collections: Iterable[int] = (),
+        *,
+        workers: int | None = None,
+        prefetch: int | None = None,
+        rank: int = 0,
+        world_size: int = 1,
+    ) -> ImageStream:
+        """Stream the images of a search into memory, see ImageStream."""
+        return ImageStream(
+            self,
+            query,
+            collections,
+            workers=workers,
+            prefetch=prefetch,
+            rank=rank,
+            world_size=world_size,
+        )
+
+    def download_image(
+        self, image: dict, to: Path | Sink, existing_files: Mapping[str, int] | None = None
+    ) -> Path | str:
+        """Download the file of an image (from search results) to a directory or sink."""
+        return download_image(
+            image, to, refresh_url=self._refresher.refresh, existing_files=existing_files
+        )
+
+    def download_images(self, images: Iterable[dict], to: Path | str) -> Iterator[Path | str]:
+        """
+        Download the files of images concurrently, yielding their locations in order.
+
+        to is a local directory or a s3://bucket/prefix url. Files which were already
+        downloaded are skipped.
+        """
+        sink = get_sink(to)
+        sink.prepare()
+        existing_files = sink.index()
+        return _imap(
+            lambda image: self.download_image(image, sink, existing_files),
+            images,
+            self.max_workers,
+        )
+
+    def export_metadata(
+        self, file: TextIO, query: str = "", collections: Iterable[int] = ()
+    ) -> int:
+        """Write the metadata of images matching a search as csv, returning the row count."""
+        headers, records = extract_metadata(self.search(query, collections))
+
+        writer = csv.DictWriter(file, headers)
+        writer.writeheader()
+        writer.writerows(records)
+
+        return len(records)
+
+    def collections(self) -> Iterator[dict]:
+        return get_collections(self.session)
+
+    def add_to_collection(self, collection_id: int, isic_ids: Iterable[str]) -> dict:
+        """Add images to a collection, returning the isic ids grouped by outcome."""
+        return bulk_collection_operation(
+            self.session, collection_id, "populate-from-list", isic_ids
+        )
+
+    def remove_from_collection(self, collection_id: int, isic_ids: Iterable[str]) -> dict:
+        """Remove images from a collection, returning the isic ids grouped by outcome."""
+        return bulk_collection_operation(self.session, collection_id, "remove-from-list", isic_ids)
+
+
+class ImageStream:
+    """
+    The images of a search as (isic_id, image bytes, metadata record), without writing files.
+
+    Each iteration streams the search anew, so a stream can be reused across epochs. At most
+    prefetch images are held in memory at once. With world_size > 1 each rank gets a disjoint
+    share of the images, e.g. one per data loader worker or distributed process.
+
+    Images are assigned to ranks by a hash of their isic id, so the shards don't depend on the
+    order of the search results. Each rank still pages through the whole search, since the
+    API can't filter by shard.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        client: IsicClient,
+        query: str = "",
+        collections: Iterable[int] = (),
+        *,
+        workers: int | None = None,
+        prefetch: int | None = None,
+        rank: int = 0,
+        world_size: int = 1,
+    ) -> None:
+        if not 0 <= rank < world_size:
+            raise ValueError(f"rank must be in [0, {world_size}), got {rank}")
+
+        self.client = client
+        self.query = query
+        self.collections = list(collections)
+        self.workers = workers or client.max_workers
+        self.prefetch = prefetch
+        self.rank = rank
+        self.world_size = world_size
+
+    def _shard(self) -> Iterator[dict]:
+        images = self.client.search(self.query, self.collections)
+        if self.world_size == 1:
+            return images
+
+        return (
+            image
+            for image in images
+            if zlib.crc32(image["isic_id"].encode()) % self.world_size == self.rank
+        )
+
+    def __iter__(self) -> Iterator[tuple[str, bytes, dict]]:
+        for image, content in _imap(
+            lambda image: (image, self.client.fetch_image(image)),
+            self._shard(),
+            self.workers,
+            self.prefetch,
+        ):
+            yield image["isic_id"], content, flatten_metadata(image)
+
+
+class AsyncIsicClient:
+    """
+    An asyncio flavor of IsicClient.
+
+    Requests are made by an IsicClient on worker threads, so they don't block the event loop.
+    """
+
+    def __init__(self, domain: str = DEFAULT_DOMAIN, **kwargs) -> None:
+        self.client = IsicClient(domain, **kwargs)
+
+    @classmethod
+    def from_login(cls, domain: str = DEFAULT_DOMAIN, **kwargs) -> AsyncIsicClient:
+        """Create a client authenticated as the user logged in with `isic user login`."""
+        async_client = cls.__new__(cls)
+        async_client.client = IsicClient.from_login(domain, **kwargs)
+        return async_client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self.client.close)
+
+    async def count(self, query: str = "", collections: Iterable[int] = ()) -> int:
+        return await asyncio.to_thread(self.client.count, query, collections)
+
+    async def search(
+        self,
+        query: str = "",
+        collections: Iterable[int] = (),
+        page_size: int | AdaptivePageSize | None = None,
+    ) -> AsyncIterator[dict]:
+        async for batch in _batches(self.client.search(query, collections, page_size), 100):
+            for image in batch:
+                yield image
+
+    async def fetch_images(
+        self, images: Iterable[dict] | AsyncIterable[dict]
+    ) -> AsyncIterator[tuple[dict, bytes]]:
+        async for batch in _batches(images, self.client.max_workers):
+            contents = await asyncio.gather(
+                *(asyncio.to_thread(self.client.fetch_image, image) for image in batch)
+            )
+            for image, content in zip(batch, contents):
+                yield image, content
+
+    async def download_images(
+        self, images: Iterable[dict] | AsyncIterable[dict], to: Path | str
+    ) -> AsyncIterator[Path | str]:
+        sink = await asyncio.to_thread(get_sink, to)
+        await asyncio.to_thread(sink.prepare)
+        existing_files = await asyncio.to_thread(sink.index)
+
+        async for batch in _batches(images, self.client.max_workers):
+            paths = await asyncio.gather(
+                *(
+                    asyncio.to_thread(self.client.download_image, image, sink, existing_files)
+                    for image in batch
+                )
+            )
+            for path in paths:
+                yield path
+
+    async def export_metadata(
+        self, file: TextIO, query: str = "", collections: Iterable[int] = ()
+    ) -> int:
+        return await asyncio.to_thread(self.client.export_metadata, file, query, collections)
+
+    async def collections(self) -> list[dict]:
+        return await asyncio.to_thread(list, self.client.collections())
+
+    async def add_to_collection(self, collection_id: int, isic_ids: Iterable[str]) -> dict:
+        return await asyncio.to_thread(self.client.add_to_collection, collection_id, isic_ids)
+
+    async def remove_from_collection(self, collection_id: int, isic_ids: Iterable[str]) -> dict:
+        return await asyncio.to_thread(self.client.remove_from_collection, collection_id, isic_ids)
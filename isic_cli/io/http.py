@@ -1,31 +1,50 @@
 from __future__ import annotations
 
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import copy
+import datetime
+import functools
+import heapq
 import logging
 import os
 from pathlib import PurePosixPath
+import queue
 import shutil
-from tempfile import NamedTemporaryFile
-from typing import TYPE_CHECKING
-from urllib.parse import urlparse
+import threading
+import time
+from typing import TYPE_CHECKING, TypeVar
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlparse
 
 from more_itertools import chunked
-from requests.exceptions import ChunkedEncodingError, ConnectionError
+from requests.exceptions import ChunkedEncodingError, ConnectionError, Timeout
 from tenacity import (
     before_sleep_log,
     retry,
+    retry_if_exception,
     retry_if_exception_type,
     stop_after_attempt,
     wait_exponential,
 )
 
-from isic_cli.session import IsicCliSession
+from isic_cli.io.sinks import LocalSink, S3Sink
+from isic_cli.resilience import HEDGER, RATE_LIMITER, RETRY_BUDGET, CircuitOpenError
+from isic_cli.session import IsicCliSession, fail_fast_on_timeouts
+from isic_cli.tracing import TRACER
+from isic_cli.utils.fastjson import loads
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable
+    from collections.abc import Callable, Iterable, Iterator, Mapping
     from pathlib import Path
 
+    import requests
+
+    from isic_cli.io.schemas import Collection, Image, Page, SearchPage
+    from isic_cli.io.sinks import Sink
+
 logger = logging.getLogger("isic_cli")
 
+T = TypeVar("T")
+
 
 def get_users_me(session: IsicCliSession) -> dict | None:
     r = session.get("users/me/")
@@ -33,7 +52,7 @@ def get_users_me(session: IsicCliSession) -> dict | None:
     return r.json()
 
 
-def get_collection(session: IsicCliSession, collection_id: int | str) -> dict:
+def get_collection(session: IsicCliSession, collection_id: int | str) -> Collection:
     r = session.get(f"collections/{collection_id}/")
     r.raise_for_status()
     return r.json()
@@ -51,14 +70,102 @@ def create_accession(session: IsicCliSession, cohort_id: int, original_blob: str
     return r.json()
 
 
-def get_collections(session: IsicCliSession) -> Iterable[dict]:
-    next_page = "collections/"
+def _get_page(session: IsicCliSession, url: str, params: dict | None = None) -> Page:
+    r = session.get(url, params=params)
+    r.raise_for_status()
+    # pages can be large, so they're decoded once, with the fastest available decoder
+    return loads(r.content)
 
-    while next_page:
-        r = session.get(next_page)
-        r.raise_for_status()
-        yield from r.json()["results"]
-        next_page = r.json()["next"]
+
+def _with_limit(url: str, limit: int) -> str:
+    parsed = urlparse(url)
+    params = [(k, v) for k, v in parse_qsl(parsed.query) if k != "limit"]
+    return parsed._replace(query=urlencode([*params, ("limit", limit)])).geturl()
+
+
+class AdaptivePageSize:
+    """
+    A page size which adapts to how quickly the server returns pages.
+
+    Fewer, larger pages mean fewer round trips, so the page size doubles while pages are
+    returned well within target_seconds. It halves when a page takes longer than that (which
+    includes pages needing retries) or times out, so requests stay clear of the read timeout.
+    Timeouts aren't retried at the same size first, so the page shrinks right away.
+    """
+
+    def __init__(
+        self,
+        initial: int = 100,
+        *,
+        minimum: int = 10,
+        maximum: int = 1000,
+        target_seconds: float = 2.0,
+    ) -> None:
+        self.current = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_seconds = target_seconds
+
+    def record(self, seconds: float) -> None:
+        if seconds > self.target_seconds:
+            self.current = max(self.current // 2, self.minimum)
+        elif seconds < self.target_seconds / 2:
+            self.current = min(self.current * 2, self.maximum)
+
+    def get_page(self, session: IsicCliSession, url: str) -> Page:
+        while True:
+            start = time.monotonic()
+            try:
+                # pages which can't get any smaller are retried as usual
+                with fail_fast_on_timeouts(enabled=self.current > self.minimum):
+                    page = _get_page(session, _with_limit(url, self.current))
+            except (Timeout, ConnectionError):
+                if self.current <= self.minimum:
+                    raise
+
+                logger.debug("Page of %d timed out, retrying with smaller pages", self.current)
+                self.current = max(self.current // 2, self.minimum)
+                continue
+
+            self.record(time.monotonic() - start)
+            logger.debug("Adaptive page size is now %d", self.current)
+            return page
+
+
+def page_limit(page_size: int | AdaptivePageSize | None) -> int | None:
+    return page_size.current if isinstance(page_size, AdaptivePageSize) else page_size
+
+
+def _paginate(
+    session: IsicCliSession,
+    first_page: Page,
+    kind: str,
+    page_size: int | AdaptivePageSize | None = None,
+) -> Iterator[dict]:
+    """Yield the results of first_page and every page after it, fetching pages as needed."""
+    page = first_page
+
+    while True:
+        yield from page["results"]
+
+        if not page["next"]:
+            break
+
+        with TRACER.span(f"fetch {kind} page", "pagination"):
+            if isinstance(page_size, AdaptivePageSize):
+                page = page_size.get_page(session, page["next"])
+            else:
+                # a fixed page size is carried over in the next link
+                page = _get_page(session, page["next"])
+
+
+def get_collections(
+    session: IsicCliSession, page_size: int | AdaptivePageSize | None = None
+) -> Iterator[Collection]:
+    with TRACER.span("fetch collections page", "pagination"):
+        first_page = _get_page(session, "collections/", params={"limit": page_limit(page_size)})
+
+    yield from _paginate(session, first_page, "collections", page_size)
 
 
 def _merge_summaries(a: dict[str, list[str]], b: dict[str, list[str]]) -> dict[str, list[str]]:
@@ -76,8 +183,8 @@ def bulk_collection_operation(  # noqa: PLR0913
     collection_id: int,
     operation: str,
     isic_ids: Iterable[str],
-    progress,
-    task,
+    progress=None,
+    task=None,
 ) -> dict[str, list[str]]:
     results = {}
 
@@ -87,30 +194,139 @@ def bulk_collection_operation(  # noqa: PLR0913
 
         results = _merge_summaries(results, r.json())
 
-        progress.update(task, advance=len(chunk))
+        if progress is not None:
+            progress.update(task, advance=len(chunk))
 
     return results
 
 
-def get_images(session: IsicCliSession, search: str = "", collections: str = "") -> Iterable[dict]:
-    next_page = f"images/search/?query={search}&collections={collections}"
+class InvalidSearchError(ValueError):
+    pass
 
-    while next_page:
-        r = session.get(next_page)
-        r.raise_for_status()
-        yield from r.json()["results"]
-        next_page = r.json()["next"]
 
-
-def get_num_images(session: IsicCliSession, search: str = "", collections: str = "") -> int:
-    params = {
-        "query": search,
-        "collections": collections,
-        "limit": 1,
-    }
-    r = session.get("images/search/", params=params)
+def get_images_page(
+    session: IsicCliSession, search: str = "", collections: str = "", limit: int | None = None
+) -> SearchPage:
+    """Get the first page of images matching the search criteria, including the total count."""
+    r = session.get(
+        "images/search/", params={"query": search, "collections": collections, "limit": limit}
+    )
+    if r.status_code == 400 and "message" in r.json() and "query" in r.json()["message"]:
+        raise InvalidSearchError(f'Invalid search query string "{search}"')
     r.raise_for_status()
-    return r.json()["count"]
+    return loads(r.content)
+
+
+def get_images(
+    session: IsicCliSession,
+    search: str = "",
+    collections: str = "",
+    *,
+    first_page: SearchPage | None = None,
+    page_size: int | AdaptivePageSize | None = None,
+) -> Iterator[Image]:
+    if first_page is None:
+        first_page = get_images_page(session, search, collections, page_limit(page_size))
+
+    yield from _paginate(session, first_page, "images", page_size)
+
+
+def _merge_concurrently(  # noqa: C901
+    iterables: list[Callable[[], Iterable[T]]],
+    max_workers: int,
+    key: Callable[[T], str],
+) -> Iterator[T]:
+    """
+    Consume iterables on a thread each, merging their items in order of key.
+
+    Each iterable should be ordered by key. The merge waits for the next item of every
+    iterable, so the result doesn't depend on the order in which items arrive. At most
+    max_workers of the iterables are advanced at once.
+    """
+    stopped = threading.Event()
+    advancing = threading.Semaphore(max_workers)
+    done = object()
+
+    def put(results: queue.Queue, item) -> bool:
+        # give up once the consumer has stopped, rather than blocking on a full queue forever
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+            except queue.Full:  # noqa: PERF203
+                continue
+            else:
+                return True
+        return False
+
+    def consume(iterable: Callable[[], Iterable[T]], results: queue.Queue) -> None:
+        try:
+            iterator = iter(iterable())
+            while True:
+                with advancing:
+                    item = next(iterator, done)
+                if item is done or not put(results, item):
+                    break
+        except Exception as e:  # noqa: BLE001
+            put(results, e)
+        else:
+            put(results, done)
+
+    def drain(results: queue.Queue) -> Iterator[T]:
+        while (item := results.get()) is not done:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    queues = [queue.Queue(maxsize=500) for _ in iterables]
+    with ThreadPoolExecutor(len(iterables)) as thread_pool:
+        for iterable, results in zip(iterables, queues):
+            thread_pool.submit(consume, iterable, results)
+
+        try:
+            yield from heapq.merge(*(drain(results) for results in queues), key=key)
+        finally:
+            stopped.set()
+
+
+def get_images_partitioned(  # noqa: PLR0913
+    session: IsicCliSession,
+    search: str = "",
+    collections: str = "",
+    *,
+    first_page: SearchPage,
+    page_size: int | AdaptivePageSize | None = None,
+    max_workers: int = 4,
+) -> Iterator[Image]:
+    """
+    Like get_images, but paginating each collection of the search concurrently.
+
+    Cursor pagination is serial, so a search spanning several collections is split into one
+    search per collection and their pages are fetched in parallel. Images belonging to more
+    than one of the collections are only yielded once. The collections are merged on isic id,
+    so the same search yields images in the same order every time.
+    """
+    partitions = list(dict.fromkeys(c for c in collections.split(",") if c))
+    if len(partitions) < 2 or not first_page["next"]:
+        yield from get_images(
+            session, search, collections, first_page=first_page, page_size=page_size
+        )
+        return
+
+    seen: set[str] = set()
+    for image in _merge_concurrently(
+        [
+            # each partition adapts its own page size
+            functools.partial(
+                get_images, session, search, collection, page_size=copy.copy(page_size)
+            )
+            for collection in partitions
+        ],
+        max_workers,
+        key=lambda image: image["isic_id"],
+    ):
+        if image["isic_id"] not in seen:
+            seen.add(image["isic_id"])
+            yield image
 
 
 def get_size_images(session: IsicCliSession, search: str = "", collections: str = "") -> int:
@@ -145,15 +361,211 @@ def get_license(session: IsicCliSession, license_type: str) -> str:
     return r.text
 
 
+def _signed_url_expiry(url: str) -> datetime.datetime | None:
+    """Return when an S3 or CloudFront signed url expires, if it can be determined."""
+    params = {k: v[0] for k, v in parse_qs(urlparse(url).query).items()}
+
+    try:
+        if "X-Amz-Date" in params and "X-Amz-Expires" in params:
+            signed_at = datetime.datetime.strptime(params["X-Amz-Date"], "%Y%m%dT%H%M%SZ").replace(
+                tzinfo=datetime.timezone.utc
+            )
+            return signed_at + datetime.timedelta(seconds=int(params["X-Amz-Expires"]))
+
+        if "Expires" in params:
+            return datetime.datetime.fromtimestamp(
+                float(params["Expires"]), tz=datetime.timezone.utc
+            )
+    except ValueError:
+        pass
+
+    return None
+
+
+def _is_expired_signed_url(r: requests.Response) -> bool:
+    if r.status_code != 403:
+        return False
+
+    if "Request has expired" in r.text:
+        return True
+
+    expires_at = _signed_url_expiry(r.url)
+    return expires_at is not None and expires_at <= datetime.datetime.now(tz=datetime.timezone.utc)
+
+
+class SignedUrlRefresher:
+    """
+    Refetch images with fresh signed urls, batching the requests of concurrent workers.
+
+    The signed urls in search results expire, which on long downloads happens before workers
+    reach them. URLs from the same page expire together, so the first worker to find one
+    expired waits briefly for others to do the same and then refetches them all at once.
+    """
+
+    def __init__(self, session: IsicCliSession, *, batch_size: int = 50, delay: float = 0.25):
+        self.session = session
+        self.batch_size = batch_size
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._pending: dict[str, Future] = {}
+
+    def refresh(self, image: dict) -> dict | None:
+        """Return image with a fresh signed url, or None if it's no longer accessible."""
+        with self._lock:
+            leader = not self._pending
+            future = self._pending.setdefault(image["isic_id"], Future())
+
+        if leader:
+            time.sleep(self.delay)
+
+            with self._lock:
+                batch, self._pending = self._pending, {}
+
+            self._fetch(batch)
+
+        return future.result()
+
+    def _fetch(self, batch: dict[str, Future]) -> None:
+        try:
+            for isic_ids in chunked(batch, self.batch_size):
+                logger.debug("Refreshing signed urls of %d images", len(isic_ids))
+                query = " OR ".join(f"isic_id:{isic_id}" for isic_id in isic_ids)
+                for image in get_images(self.session, query):
+                    if image["isic_id"] in batch:
+                        batch[image["isic_id"]].set_result(image)
+        except Exception as e:  # noqa: BLE001
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for future in batch.values():
+                if not future.done():
+                    future.set_result(None)
+
+
+# enough for the download threads of image download, and their hedges
+_FILE_CONCURRENCY = 2 * max(10, os.cpu_count() or 10)
+
+
+@functools.cache
+def _hedging_executor() -> ThreadPoolExecutor:
+    """Return the threads sending hedgeable requests, reused rather than started per request."""
+    return ThreadPoolExecutor(_FILE_CONCURRENCY, thread_name_prefix="isic-hedged-request")
+
+
+def _close_response(future: Future[requests.Response]) -> None:
+    if future.exception() is None:
+        future.result().close()
+
+
+def _hedged_get(session: IsicCliSession, url: str) -> requests.Response:
+    """
+    Start streaming a file, sending a duplicate request if the first is unusually slow.
+
+    See Hedger for when requests are hedged. The response which arrives first is used and
+    the other is closed.
+    """
+    start = time.monotonic()
+    delay = HEDGER.delay()
+    if delay is None:
+        r = session.get(url, stream=True)
+        HEDGER.record(time.monotonic() - start)
+        return r
+
+    executor = _hedging_executor()
+    primary = executor.submit(session.get, url, stream=True)
+    done, _ = wait([primary], timeout=delay)
+    if done or not HEDGER.budget.try_withdraw():
+        r = primary.result()
+        HEDGER.record(time.monotonic() - start)
+        return r
+
+    logger.debug("Hedging request for %s after %.2fs", urlparse(url).path, delay)
+    with TRACER.span("hedge request", "download", delay=delay) as span:
+        hedge = executor.submit(session.get, url, stream=True)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            winner = next((future for future in done if future.exception() is None), None)
+            if winner is not None:
+                span.args["winner"] = "hedge" if winner is hedge else "primary"
+                for future in pending:
+                    future.add_done_callback(_close_response)
+                return winner.result()
+
+    # both requests failed
+    return primary.result()
+
+
+def _get_image_file(
+    session: IsicCliSession, image: dict, refresh_url: Callable[[dict], dict | None] | None
+) -> requests.Response:
+    r = _hedged_get(session, image["files"]["full"]["url"])
+
+    if refresh_url is not None and _is_expired_signed_url(r):
+        logger.debug("Signed url of %s expired, refreshing", image["isic_id"])
+        fresh_image = refresh_url(image)
+        if fresh_image is not None:
+            # also used by any later attempts of this download
+            image["files"] = fresh_image["files"]
+            r.close()
+            r = _hedged_get(session, image["files"]["full"]["url"])
+
+    if not r.ok:
+        # release the connection back to the shared pool
+        r.close()
+    r.raise_for_status()
+    return r
+
+
 # see https://github.com/danlamanna/retryable-requests/issues/10 to understand the
 # scenario which requires additional retry logic.
-@retry(
-    retry=retry_if_exception_type((ConnectionError, ChunkedEncodingError)),
+_retry_image_file = retry(
+    retry=retry_if_exception_type((ConnectionError, ChunkedEncodingError))
+    & retry_if_exception(lambda _: RETRY_BUDGET.try_withdraw()),
     wait=wait_exponential(multiplier=1, min=3, max=10),
     stop=stop_after_attempt(5),
     before_sleep=before_sleep_log(logger, logging.DEBUG),
 )
-def download_image(image: dict, to: Path, progress, task) -> None:
+
+
+@functools.cache
+def _file_session() -> IsicCliSession:
+    """
+    Return the session for fetching image files, shared by every worker to reuse connections.
+
+    It intentionally has no auth headers, since the files have s3 signed urls that already
+    contain credentials.
+    """
+    return IsicCliSession(pool_maxsize=_FILE_CONCURRENCY)
+
+
+@_retry_image_file
+def get_image_bytes(image: dict, refresh_url: Callable[[dict], dict | None] | None = None) -> bytes:
+    """Fetch the full image file into memory."""
+    with TRACER.span("fetch image", "download", isic_id=image["isic_id"]):
+        content = _get_image_file(_file_session(), image, refresh_url).content
+        RATE_LIMITER.consume_bytes(len(content))
+        return content
+
+
+@_retry_image_file
+def download_image(  # noqa: PLR0913
+    image: dict,
+    to: Path | Sink,
+    progress=None,
+    task=None,
+    refresh_url: Callable[[dict], dict | None] | None = None,
+    existing_files: Mapping[str, int] | None = None,
+) -> Path | str:
+    """
+    Download the file of an image to a directory (or other sink), unless it's already there.
+
+    existing_files maps the names of files already in the sink to their sizes, sparing a
+    lookup per image. Without it, the sink is checked directly.
+    """
+    sink = to if isinstance(to, (LocalSink, S3Sink)) else LocalSink(to)
+
     url = image["files"]["full"]["url"]
     parsed_url = urlparse(url)
     path = parsed_url.path
@@ -161,28 +573,53 @@ def download_image(image: dict, to: Path, progress, task) -> None:
     # are extension-less since they come from a synthetic image generator.
     extension = PurePosixPath(path).suffix.lstrip(".") or "jpg"
 
-    dest_path = to / f'{image["isic_id"]}.{extension}'
-
-    # Avoid re downloading the image if one of the same name/size exists. This is a decent
-    # enough proxy for detecting file differences without going through a hashing mechanism.
-    if dest_path.exists() and dest_path.stat().st_size == image["files"]["full"]["size"]:
+    name = f'{image["isic_id"]}.{extension}'
+    size = image["files"]["full"]["size"]
+
+    with TRACER.span("download image", "download", isic_id=image["isic_id"]) as span:
+        # Avoid re downloading the image if one of the same name/size exists. This is a decent
+        # enough proxy for detecting file differences without going through a hashing mechanism.
+        if existing_files is not None:
+            exists = existing_files.get(name) == size
+        else:
+            exists = sink.exists(name, size)
+
+        if exists:
+            span.args["skipped"] = True
+        else:
+            with _get_image_file(_file_session(), image, refresh_url) as r:
+                num_bytes = 0
+                with sink.open(name) as outfile:
+                    for chunk in r.iter_content(1024 * 1024 * 5):
+                        outfile.write(chunk)
+                        num_bytes += len(chunk)
+                        RATE_LIMITER.consume_bytes(len(chunk))
+
+                span.args["bytes"] = num_bytes
+
+    if progress is not None:
         progress.update(task, advance=1)
-        return
 
-    # intentionally omit auth headers, since these are s3 signed urls that already contain
-    # credentials.
-    with IsicCliSession() as session:
-        r = session.get(image["files"]["full"]["url"], stream=True)
-        r.raise_for_status()
+    return sink.location(name)
 
-        temp_file_name = None
-        with NamedTemporaryFile(
-            dir=to, prefix=f".isic-partial.{os.getpid()}.", delete=False
-        ) as outfile:
-            temp_file_name = outfile.name
-            for chunk in r.iter_content(1024 * 1024 * 5):
-                outfile.write(chunk)
 
-        shutil.move(temp_file_name, dest_path)
+def skip_failed_downloads(download: Callable[..., T]) -> Callable[..., T | None]:
+    """
+    Wrap download_image to log and skip (returning None) images which fail to download.
+
+    One image failing shouldn't end a bulk download. A CircuitOpenError is still raised,
+    since it means the archive itself is down.
+    """
 
-    progress.update(task, advance=1)
+    @functools.wraps(download)
+    def wrapper(image: dict, *args, **kwargs) -> T | None:
+        try:
+            return download(image, *args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception as e:  # noqa: BLE001
+            logger.warning("Unable to download %s, skipping it: %s", image["isic_id"], e)
+            logger.debug("Download of %s failed", image["isic_id"], exc_info=True)
+            return None
+
+    return wrapper
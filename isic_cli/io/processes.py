@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import atexit
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+import contextlib
+import functools
+import multiprocessing
+from multiprocessing.connection import Client, Listener
+import os
+import signal
+import threading
+from typing import TYPE_CHECKING
+
+from isic_cli.io.http import download_image, skip_failed_downloads
+from isic_cli.io.sinks import get_sink
+from isic_cli.resilience import RATE_LIMITER, CircuitOpenError
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+    from multiprocessing.connection import Connection
+    from pathlib import Path
+
+    from isic_cli.io.sinks import Sink
+
+# the state of a worker process, set up once by _init_worker
+_download: Callable[[dict], Path | str | None] | None = None
+_thread_pool: ThreadPoolExecutor | None = None
+
+
+class _RefreshServer:
+    """
+    Refresh the signed urls of worker processes in the parent process.
+
+    Only the parent holds the login (and refreshes its access token), so workers send the
+    images whose urls expired here. Refreshes of every worker are batched together, see
+    SignedUrlRefresher.
+    """
+
+    def __init__(self, refresh_url: Callable[[dict], dict | None]) -> None:
+        self.refresh_url = refresh_url
+        self._listener = Listener(authkey=multiprocessing.current_process().authkey)
+        self.address = self._listener.address
+        self._closed = False
+        threading.Thread(target=self._accept, name="isic-refresh-server", daemon=True).start()
+
+    def _accept(self) -> None:
+        while True:
+            try:
+                conn = self._listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except OSError:
+                return
+
+            if self._closed:
+                conn.close()
+                return
+
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        with conn:
+            while True:
+                try:
+                    image = conn.recv()
+                except (EOFError, OSError):
+                    return
+
+                try:
+                    conn.send((self.refresh_url(image), None))
+                except CircuitOpenError as e:
+                    conn.send((None, e))
+                except Exception as e:  # noqa: BLE001
+                    # exceptions of requests can hold responses, which don't pickle reliably
+                    conn.send((None, RuntimeError(f"Unable to refresh signed url: {e}")))
+
+    def close(self) -> None:
+        self._closed = True
+        # wake up the accepting thread, closing the listener alone doesn't
+        with contextlib.suppress(OSError):
+            Client(self.address, authkey=multiprocessing.current_process().authkey).close()
+        self._listener.close()
+
+
+class _RefreshClient:
+    """The worker side of _RefreshServer, with a connection per thread."""
+
+    def __init__(self, address) -> None:
+        self.address = address
+        self._local = threading.local()
+
+    def refresh(self, image: dict) -> dict | None:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = Client(
+                self.address, authkey=multiprocessing.current_process().authkey
+            )
+
+        conn.send({"isic_id": image["isic_id"], "files": image["files"]})
+        fresh_image, error = conn.recv()
+        if error is not None:
+            raise error
+
+        return fresh_image
+
+
+def _cleanup_and_exit(sink: Sink, signum, frame) -> None:
+    sink.cleanup()
+    # exiting with an exception would only fail the batch in progress, see ProcessPoolExecutor
+    os._exit(1)
+
+
+def _init_worker(  # noqa: PLR0913
+    destination: Path | str,
+    existing_files: dict[str, int],
+    refresh_address,
+    threads: int,
+    max_requests_per_second: float | None,
+    max_bandwidth: int | None,
+) -> None:
+    global _download, _thread_pool  # noqa: PLW0603
+
+    RATE_LIMITER.configure(
+        max_requests_per_second=max_requests_per_second, max_bandwidth=max_bandwidth
+    )
+    sink = get_sink(destination)
+
+    # partial files (or multipart uploads) are tracked per process, so each worker removes its
+    # own, as the parent does for threads.
+    atexit.register(sink.cleanup)
+    signal.signal(signal.SIGINT, functools.partial(_cleanup_and_exit, sink))
+    signal.signal(signal.SIGTERM, functools.partial(_cleanup_and_exit, sink))
+
+    _download = functools.partial(
+        skip_failed_downloads(download_image),
+        to=sink,
+        refresh_url=_RefreshClient(refresh_address).refresh,
+        existing_files=existing_files,
+    )
+    _thread_pool = ThreadPoolExecutor(threads)
+
+
+def _download_batch(images: list[dict]) -> int:
+    return sum(1 for location in _thread_pool.map(_download, images) if location is not None)
+
+
+class ProcessDownloader:
+    """
+    Download images across worker processes, each with its own thread pool and sessions.
+
+    A single process is limited by the GIL on TLS, hashing, and file writes well below the
+    bandwidth of fast hosts. The parent process remains responsible for pagination and
+    metadata, and sends batches of images to the workers. Expired signed urls are refreshed
+    by the parent with refresh_url. Rate limits are split evenly between the workers.
+
+    As with threads, images which fail to download are skipped (see skip_failed_downloads).
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        processes: int,
+        destination: Path | str,
+        *,
+        existing_files: dict[str, int],
+        refresh_url: Callable[[dict], dict | None],
+        threads_per_process: int = 10,
+    ) -> None:
+        def split(limit: float | None) -> float | None:
+            return limit / processes if limit else None
+
+        self._refresh_server = _RefreshServer(refresh_url)
+        self._executor = ProcessPoolExecutor(
+            processes,
+            # forking a process with running threads (e.g. pagination) isn't safe
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                destination,
+                existing_files,
+                self._refresh_server.address,
+                threads_per_process,
+                split(RATE_LIMITER.requests.rate if RATE_LIMITER.requests else None),
+                split(RATE_LIMITER.bandwidth.rate if RATE_LIMITER.bandwidth else None),
+            ),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        if args[0] is not None:
+            # rather than waiting for the batches in progress, stop the workers, which clean up
+            # after themselves (see _init_worker).
+            for process in list((self._executor._processes or {}).values()):  # noqa: SLF001
+                process.terminate()
+
+        try:
+            self._executor.shutdown(wait=True, cancel_futures=args[0] is not None)
+        finally:
+            self._refresh_server.close()
+
+    def submit(self, images: list[dict]) -> Future[int]:
+        """Download a batch of images, resolving to the number downloaded."""
+        # only what's needed for downloading, to save pickling the metadata
+        return self._executor.submit(
+            _download_batch,
+            [{"isic_id": image["isic_id"], "files": image["files"]} for image in images],
+        )
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from typing import TypedDict
+
+# The shapes of API responses. These are plain dicts at runtime, so decoding into them is
+# free, but they document (and let type checkers verify) the fields the cli relies on.
+
+
+class ImageFile(TypedDict):
+    url: str
+    size: int
+
+
+class ImageFiles(TypedDict):
+    full: ImageFile
+
+
+class ImageMetadata(TypedDict):
+    acquisition: dict
+    clinical: dict
+
+
+class Image(TypedDict):
+    isic_id: str
+    public: bool
+    attribution: str
+    copyright_license: str
+    metadata: ImageMetadata
+    files: ImageFiles
+
+
+class Collection(TypedDict):
+    id: int
+    name: str
+    public: bool
+    pinned: bool
+    locked: bool
+    doi: str | None
+
+
+class Page(TypedDict):
+    next: str | None
+    previous: str | None
+    results: list
+
+
+class SearchPage(Page):
+    count: int
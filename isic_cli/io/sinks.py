@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import io
+import logging
+import os
+from pathlib import Path, PurePosixPath
+import sys
+from tempfile import NamedTemporaryFile
+import threading
+import time
+from typing import IO, TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger("isic_cli")
+
+PARTIAL_PREFIX = ".isic-partial."
+
+# partial files of dead processes which were modified more recently than this are left alone,
+# since they may belong to a download running on another host sharing the directory.
+STALE_PARTIAL_AGE = 10 * 60
+
+
+class PartialDownloads:
+    """
+    The temporary files of downloads in progress.
+
+    Tracking them lets partial files be removed on exit without scanning the output directory.
+    """
+
+    def __init__(self) -> None:
+        self._paths: set[Path] = set()
+        self._lock = threading.Lock()
+
+    def add(self, path: Path) -> None:
+        with self._lock:
+            self._paths.add(path)
+
+    def discard(self, path: Path) -> None:
+        with self._lock:
+            self._paths.discard(path)
+
+    def in_directory(self, directory: Path) -> list[Path]:
+        """Return the partial files under directory, including those in its subdirectories."""
+        with self._lock:
+            return [path for path in self._paths if directory in path.parents]
+
+
+PARTIAL_DOWNLOADS = PartialDownloads()
+
+
+def _pid_exists(pid: int) -> bool:
+    if sys.platform == "win32":
+        import ctypes
+
+        process_query_limited_information = 0x1000
+        error_access_denied = 5
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(process_query_limited_information, False, pid)  # noqa: FBT003
+        if not handle:
+            return ctypes.GetLastError() == error_access_denied
+
+        kernel32.CloseHandle(handle)
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists, but belongs to another user
+        return True
+
+    return True
+
+
+def _is_stale_partial_file(entry: os.DirEntry, now: float) -> bool:
+    pid = entry.name[len(PARTIAL_PREFIX) :].split(".", 1)[0]
+    if not pid.isdigit() or int(pid) == os.getpid() or _pid_exists(int(pid)):
+        return False
+
+    return now - entry.stat().st_mtime > STALE_PARTIAL_AGE
+
+
+def index_output_directory(directory: Path) -> dict[str, int]:
+    """
+    Map the names of the files in directory to their sizes, in a single os.scandir pass.
+
+    This lets downloads skip existing images without stat calls of their own, which add up on
+    network filesystems. Partial files left behind by processes which have died are removed
+    along the way.
+    """
+    index = {}
+    now = time.time()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.name.startswith(PARTIAL_PREFIX):
+                    if _is_stale_partial_file(entry, now):
+                        logger.debug("Removing stale partial file %s", entry.path)
+                        Path(entry.path).unlink(missing_ok=True)
+                elif entry.is_file():
+                    index[entry.name] = entry.stat().st_size
+            except OSError:  # noqa: PERF203
+                logger.debug("Unable to inspect %s", entry.path, exc_info=True)
+
+    return index
+
+
+class LocalSink:
+    """
+    Writes downloads to a local directory.
+
+    Files are written to temporary files which are moved into place once complete, so an
+    interrupted download never leaves a truncated file behind under its final name.
+    """
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    def __str__(self) -> str:
+        return f"{self.directory}/"
+
+    def location(self, name: str) -> Path:
+        return self.directory / name
+
+    def prepare(self) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def index(self) -> dict[str, int]:
+        return index_output_directory(self.directory)
+
+    def exists(self, name: str, size: int) -> bool:
+        path = self.location(name)
+        return path.exists() and path.stat().st_size == size
+
+    @contextmanager
+    def open(self, name: str, *, text: bool = False) -> Iterator[IO]:
+        path = self.location(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with NamedTemporaryFile(
+            "w" if text else "wb",
+            dir=path.parent,
+            prefix=f"{PARTIAL_PREFIX}{os.getpid()}.",
+            delete=False,
+            **({"encoding": "utf8", "newline": ""} if text else {}),
+        ) as outfile:
+            temp_file = path.parent / Path(outfile.name).name
+            PARTIAL_DOWNLOADS.add(temp_file)
+            yield outfile
+
+        temp_file.replace(path)
+        PARTIAL_DOWNLOADS.discard(temp_file)
+
+    def cleanup(self) -> bool:
+        """Remove the partial files of downloads in progress, returning False if any remain."""
+        removed_all = True
+        for p in PARTIAL_DOWNLOADS.in_directory(self.directory):
+            # missing_ok=True because it's possible that another thread moved the temporary
+            # file to its final destination after listing it but before unlinking.
+            try:
+                p.unlink(missing_ok=True)
+            except PermissionError:  # noqa: PERF203
+                # frequently on windows this is raised. it appears like this could be caused by
+                # antivirus or various indexers that attempt to use the file shortly after it's
+                # created.
+                removed_all = False
+            else:
+                PARTIAL_DOWNLOADS.discard(p)
+
+        return removed_all
+
+
+class _MultipartUpload(io.RawIOBase):
+    """
+    A writable file which streams into an S3 object, a part at a time.
+
+    Objects smaller than a single part are uploaded with one PutObject request instead.
+    """
+
+    def __init__(self, sink: S3Sink, key: str) -> None:
+        super().__init__()
+        self.sink = sink
+        self.key = key
+        self.upload_id: str | None = None
+        self._buffer = bytearray()
+        self._parts: list[dict] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._buffer += b
+        while len(self._buffer) >= self.sink.part_size:
+            self._upload_part(self._buffer[: self.sink.part_size])
+            del self._buffer[: self.sink.part_size]
+
+        return len(b)
+
+    def _upload_part(self, data: bytes | bytearray) -> None:
+        client = self.sink.client
+        if self.upload_id is None:
+            upload = client.create_multipart_upload(Bucket=self.sink.bucket, Key=self.key)
+            self.upload_id = upload["UploadId"]
+            self.sink.uploads_in_progress.add(self)
+
+        part_number = len(self._parts) + 1
+        part = client.upload_part(
+            Bucket=self.sink.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(data),
+        )
+        self._parts.append({"ETag": part["ETag"], "PartNumber": part_number})
+
+    def complete(self) -> None:
+        client = self.sink.client
+        if self.upload_id is None:
+            client.put_object(Bucket=self.sink.bucket, Key=self.key, Body=bytes(self._buffer))
+            return
+
+        if self._buffer:
+            self._upload_part(self._buffer)
+        client.complete_multipart_upload(
+            Bucket=self.sink.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+        self.sink.uploads_in_progress.discard(self)
+
+    def abort(self) -> None:
+        if self.upload_id is not None:
+            self.sink.client.abort_multipart_upload(
+                Bucket=self.sink.bucket, Key=self.key, UploadId=self.upload_id
+            )
+            self.sink.uploads_in_progress.discard(self)
+
+
+class S3Sink:
+    """
+    Writes downloads straight to an S3 compatible object store, given a s3://bucket/prefix url.
+
+    Files are streamed into multipart uploads without touching the local disk. Credentials and
+    the endpoint (e.g. for MinIO) come from the usual AWS configuration, such as the
+    AWS_PROFILE and AWS_ENDPOINT_URL environment variables. Requires boto3.
+    """
+
+    def __init__(self, url: str, *, client=None, part_size: int = 8 * 1024 * 1024) -> None:
+        parsed = urlparse(url)
+        self.url = url
+        self.bucket = parsed.netloc
+        self.prefix = parsed.path.strip("/")
+        self.part_size = part_size
+        self.uploads_in_progress: set[_MultipartUpload] = set()
+
+        if client is None:
+            # boto3 is an optional dependency, and slow to import
+            import boto3
+            from botocore.config import Config
+
+            client = boto3.client("s3", config=Config(max_pool_connections=50))
+        self.client = client
+
+    def __str__(self) -> str:
+        return f"s3://{self.bucket}/{self.prefix}/" if self.prefix else f"s3://{self.bucket}/"
+
+    def _key(self, name: str) -> str:
+        return str(PurePosixPath(self.prefix, name)) if self.prefix else name
+
+    def location(self, name: str) -> str:
+        return f"s3://{self.bucket}/{self._key(name)}"
+
+    def prepare(self) -> None:
+        pass
+
+    def index(self) -> dict[str, int]:
+        """Map the names of the objects directly under the prefix to their sizes."""
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        index = {}
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter="/"):
+            for obj in page.get("Contents", []):
+                index[obj["Key"][len(prefix) :]] = obj["Size"]
+
+        return index
+
+    def exists(self, name: str, size: int) -> bool:
+        from botocore.exceptions import ClientError
+
+        try:
+            obj = self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except ClientError:
+            return False
+
+        return obj["ContentLength"] == size
+
+    @contextmanager
+    def open(self, name: str, *, text: bool = False) -> Iterator[IO]:
+        upload = _MultipartUpload(self, self._key(name))
+        try:
+            if text:
+                with io.TextIOWrapper(
+                    io.BufferedWriter(upload), encoding="utf8", newline=""
+                ) as outfile:
+                    yield outfile
+                    outfile.flush()
+                    upload.complete()
+            else:
+                yield upload
+                upload.complete()
+        except BaseException:
+            upload.abort()
+            raise
+
+    def cleanup(self) -> bool:
+        """Abort the multipart uploads in progress, so their parts aren't left behind."""
+        for upload in list(self.uploads_in_progress):
+            try:
+                upload.abort()
+            except Exception:  # noqa: BLE001, PERF203
+                logger.debug("Unable to abort upload of %s", upload.key, exc_info=True)
+                return False
+
+        return True
+
+
+Sink = LocalSink | S3Sink
+
+
+def get_sink(destination: str | Path) -> Sink:
+    """Return the sink for an output directory or s3://bucket/prefix url."""
+    if isinstance(destination, str) and destination.startswith("s3://"):
+        return S3Sink(destination)
+
+    return LocalSink(Path(destination))
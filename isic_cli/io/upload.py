@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import io
+import logging
+from typing import TYPE_CHECKING, BinaryIO
+
+from requests.exceptions import HTTPError
+from s3_file_field_client import S3FileFieldClient
+
+if TYPE_CHECKING:
+    from collections.abc import Callable
+
+    import requests
+    from s3_file_field_client import _File
+
+logger = logging.getLogger("isic_cli")
+
+
+class ResumableS3FileFieldClient(S3FileFieldClient):
+    """
+    An S3FileFieldClient which can continue an interrupted multipart upload.
+
+    The multipart upload initialization and every completed part are recorded in state, and
+    save_state is called after each change so the caller can persist it. Passing the same
+    state back in resumes the upload from the last completed part.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_session: requests.Session | None = None,
+        *,
+        state: dict,
+        save_state: Callable[[dict], None],
+    ) -> None:
+        super().__init__(base_url, api_session)
+        self.state = state
+        self.save_state = save_state
+
+    def _initialize_upload(self, file: _File, field_id: str) -> dict:
+        if "multipart" not in self.state:
+            self.state["multipart"] = super()._initialize_upload(file, field_id)
+            self.state["parts"] = []
+            self.save_state(self.state)
+
+        return self.state["multipart"]
+
+    def _upload_parts(self, file: _File, part_initializations: list[dict]) -> list[dict]:
+        completed = {part["part_number"]: part for part in self.state["parts"]}
+        upload_infos = []
+
+        for part_initialization in part_initializations:
+            part_number = part_initialization["part_number"]
+
+            if part_number in completed:
+                file.stream.seek(part_initialization["size"], io.SEEK_CUR)
+                upload_infos.append(completed[part_number])
+                continue
+
+            upload_info = self._upload_part(
+                file.stream.read(part_initialization["size"]), part_initialization
+            )
+            upload_infos.append(upload_info)
+            self.state["parts"].append(upload_info)
+            self.save_state(self.state)
+
+        return upload_infos
+
+    def upload_file(
+        self, *, file_stream: BinaryIO, file_name: str, file_content_type: str, field_id: str
+    ) -> str:
+        kwargs = {
+            "file_stream": file_stream,
+            "file_name": file_name,
+            "file_content_type": file_content_type,
+            "field_id": field_id,
+        }
+
+        if "multipart" in self.state:
+            try:
+                return super().upload_file(**kwargs)
+            except HTTPError as e:
+                # the presigned urls of a stale upload can expire, or the upload may have been
+                # aborted server side. in that case the upload has to start over.
+                if e.response is None or e.response.status_code not in [400, 403, 404]:
+                    raise
+
+                logger.debug("Unable to resume upload, restarting: %s", e)
+                self.state.clear()
+                self.save_state(self.state)
+                file_stream.seek(0)
+
+        return super().upload_file(**kwargs)
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+from array import array
+from collections import Counter
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+
+def flatten_metadata(image: dict) -> dict:
+    """Return the metadata of an image as a single flat record, as written to csv."""
+    return {
+        "isic_id": image["isic_id"],
+        "attribution": image["attribution"],
+        "copyright_license": image["copyright_license"],
+        **image["metadata"]["acquisition"],
+        **image["metadata"]["clinical"],
+    }
+
+
+_BASE_FIELDS = ["isic_id", "attribution", "copyright_license"]
+
+
+class MetadataRecords:
+    """
+    Flat metadata records (see flatten_metadata), stored by column.
+
+    Values are dictionary encoded: each distinct value is stored once and each column is an
+    array of 4 byte codes referring to them. Records of the archive share most of their values
+    (diagnoses, attributions, licenses), so this takes a fraction of the memory of a dict per
+    record. Iterating yields each record as a dict, omitting its missing fields.
+    """
+
+    _MISSING = 0
+
+    def __init__(self) -> None:
+        self._columns: dict[str, array[int]] = {}
+        self._values: list = [None]
+        # non-strings are keyed by type as well, since otherwise True, 1 and 1.0 would share a
+        # code. strings (most values) are keyed by themselves, sparing a tuple each.
+        self._codes: dict[object, int] = {}
+        self._length = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _encode(self, value) -> int:
+        if value is None:
+            return self._MISSING
+
+        try:
+            key = value if type(value) is str else (type(value), value)
+            code = self._codes.get(key)
+        except TypeError:
+            # unhashable values are stored as they are
+            key, code = None, None
+
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            if key is not None:
+                self._codes[key] = code
+
+        return code
+
+    def append(self, record: dict) -> None:
+        for field, value in record.items():
+            column = self._columns.get(field)
+            if column is None:
+                column = self._columns[field] = array("I", [self._MISSING]) * self._length
+            column.append(self._encode(value))
+
+        self._length += 1
+        for column in self._columns.values():
+            if len(column) < self._length:
+                column.append(self._MISSING)
+
+    @property
+    def fields(self) -> list[str]:
+        return _BASE_FIELDS + sorted(self._columns.keys() - set(_BASE_FIELDS))
+
+    def __iter__(self) -> Iterator[dict]:
+        values = self._values
+        columns = list(self._columns.items())
+        for i in range(self._length):
+            yield {field: values[column[i]] for field, column in columns if column[i]}
+
+    def value_counts(self, field: str) -> Counter:
+        """Count the records having each value of field, without decoding every record."""
+        codes = Counter(self._columns.get(field, ()))
+        codes.pop(self._MISSING, None)
+        return Counter({self._values[code]: count for code, count in codes.items()})
+
+
+# This is memory intensive but unavoidable since the CSV needs to look at ALL
+# records to determine what the final headers should be. The alternative would
+# be to iterate through all images_iterator twice (hitting the API each time).
+def extract_metadata(
+    images: Iterable[dict], progress=None, task=None
+) -> tuple[list[str], MetadataRecords]:
+    records = MetadataRecords()
+
+    for image in images:
+        records.append(flatten_metadata(image))
+
+        if progress is not None and task is not None:
+            progress.update(task, advance=1)
+
+    return records.fields, records
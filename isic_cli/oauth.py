@@ -1,10 +1,79 @@
 from __future__ import annotations
 
-from girder_cli_oauth_client import GirderCliOAuthClient
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from requests.auth import AuthBase
+
+if TYPE_CHECKING:
+    from girder_cli_oauth_client import GirderCliOAuthClient
+    import requests
+
+logger = logging.getLogger("isic_cli")
 
 
 def get_oauth_client(
     oauth_url: str = "https://api.isic-archive.com/oauth",
     client_id: str = "RpCzc4hFjv5gOJdM2DM2nBdokOviOh5ne63Tpn7Q",
-):
+) -> GirderCliOAuthClient:
+    # authlib is expensive to import, so avoid it until a client is actually needed.
+    from girder_cli_oauth_client import GirderCliOAuthClient
+
     return GirderCliOAuthClient(oauth_url, client_id)
+
+
+class OAuthTokenAuth(AuthBase):
+    """
+    Authenticate requests with the access token of a logged in oauth client.
+
+    Access tokens expire well before a large download or bulk operation finishes, so the token
+    is refreshed shortly before it expires. Refreshing happens once, under a lock, while any
+    other threads wait for the new token. A request rejected with a 401 (e.g. because the
+    token expired early) is sent once more after a refresh, see retry_rejected.
+    """
+
+    def __init__(self, oauth: GirderCliOAuthClient) -> None:
+        self.oauth = oauth
+        self._lock = threading.Lock()
+
+    @property
+    def _token(self):
+        # the oauth client has no public api for refreshing an unexpired token
+        return self.oauth._session.token  # noqa: SLF001
+
+    def _refresh(self) -> None:
+        logger.debug("Refreshing access token")
+        self.oauth._session.refresh_token(f"{self.oauth.oauth_url}/token/")  # noqa: SLF001
+        self.oauth._save()  # noqa: SLF001
+
+    def headers(self) -> dict:
+        with self._lock:
+            if self._token is not None and self._token.is_expired():
+                self._refresh()
+
+            return self.oauth.auth_headers or {}
+
+    def refresh(self, rejected_authorization: str | None) -> None:
+        with self._lock:
+            # another thread may have refreshed the token since the rejected request was sent
+            if (self.oauth.auth_headers or {}).get("Authorization") == rejected_authorization:
+                self._refresh()
+
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        r.headers.update(self.headers())
+        return r
+
+    def retry_rejected(self, r: requests.Response) -> bool:
+        """
+        Refresh the token after a 401, returning whether the request should be sent again.
+
+        IsicCliSession makes the retry, so it's subject to the same rate limits and
+        instrumentation as any other request.
+        """
+        # streamed bodies (e.g. file uploads) can't be sent again
+        if r.status_code != 401 or self._token is None or hasattr(r.request.body, "read"):
+            return False
+
+        self.refresh(r.request.headers.get("Authorization"))
+        return True
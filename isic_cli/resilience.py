@@ -0,0 +1,291 @@
+from __future__ import annotations
+
+from collections import deque
+import logging
+import statistics
+import threading
+import time
+
+logger = logging.getLogger("isic_cli")
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryBudget:
+    """
+    Limit retries to a fraction of all requests made by the process.
+
+    Every request deposits ratio into the budget and every retry withdraws one, so when most
+    requests are failing, workers stop multiplying the load with retries of their own. The
+    reserve allows a few retries before any requests have been made.
+    """
+
+    def __init__(self, ratio: float = 0.2, reserve: float = 10, max_balance: float = 100) -> None:
+        self.ratio = ratio
+        self.max_balance = max_balance
+        self._balance = reserve
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._balance = min(self._balance + self.ratio, self.max_balance)
+
+    def try_withdraw(self) -> bool:
+        with self._lock:
+            if self._balance < 1:
+                return False
+
+            self._balance -= 1
+            return True
+
+
+class CircuitBreaker:
+    """
+    Pause all requests to a host while most recent attempts against it are failing.
+
+    When the failure rate of the last window attempts reaches failure_threshold, the circuit
+    opens and requests wait for cooldown seconds. A single probe request is then let through:
+    if it succeeds the circuit closes and everyone resumes, otherwise the circuit reopens with
+    a doubled cooldown. After max_probes failed probes in a row the host is considered down:
+    requests fail immediately with a CircuitOpenError rather than waiting, and the host is
+    only probed every max_cooldown seconds until it recovers. A probe which ends without an
+    outcome (e.g. it's interrupted) must be abandoned, and one which hasn't finished after
+    probe_timeout seconds is taken over by another request.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(  # noqa: PLR0913
+        self,
+        host: str,
+        *,
+        window: int = 20,
+        min_attempts: int = 10,
+        failure_threshold: float = 0.5,
+        cooldown: float = 5,
+        max_cooldown: float = 60,
+        max_probes: int = 6,
+        probe_timeout: float = 60,
+    ) -> None:
+        self.host = host
+        self.min_attempts = min_attempts
+        self.failure_threshold = failure_threshold
+        self.initial_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_probes = max_probes
+        self.probe_timeout = probe_timeout
+
+        self.state = self.CLOSED
+        self._outcomes: deque[bool] = deque(maxlen=window)
+        self._cooldown = cooldown
+        self._opened_at = 0.0
+        self._failed_probes = 0
+        self._probe: int | None = None
+        self._probe_started_at = 0.0
+        self._condition = threading.Condition()
+
+    def wait_until_available(self) -> None:
+        """Block while the circuit is open, raising a CircuitOpenError if the host is down."""
+        with self._condition:
+            while True:
+                if self.state == self.CLOSED:
+                    return
+
+                if self.state == self.OPEN:
+                    remaining = self._opened_at + self._cooldown - time.monotonic()
+                else:
+                    remaining = self._probe_started_at + self.probe_timeout - time.monotonic()
+
+                if remaining <= 0:
+                    # the calling thread becomes the probe
+                    self.state = self.HALF_OPEN
+                    self._probe = threading.get_ident()
+                    self._probe_started_at = time.monotonic()
+                    return
+
+                if self._failed_probes >= self.max_probes:
+                    raise CircuitOpenError(
+                        f"{self.host} is unavailable, giving up after {self._failed_probes} "
+                        "attempts to reconnect."
+                    )
+
+                self._condition.wait(remaining)
+
+    def abandon_probe(self) -> None:
+        """Reopen the circuit if the calling thread is the probe, e.g. after it was interrupted."""
+        with self._condition:
+            if self.state == self.HALF_OPEN and self._probe == threading.get_ident():
+                self._open()
+                self._condition.notify_all()
+
+    def record(self, *, success: bool) -> None:
+        with self._condition:
+            self._outcomes.append(success)
+
+            if self.state == self.HALF_OPEN:
+                if success:
+                    logger.debug("Circuit for %s closed", self.host)
+                    self.state = self.CLOSED
+                    self._outcomes.clear()
+                    self._cooldown = self.initial_cooldown
+                    self._failed_probes = 0
+                else:
+                    self._failed_probes += 1
+                    if self._failed_probes >= self.max_probes:
+                        self._cooldown = self.max_cooldown
+                    else:
+                        self._cooldown = min(self._cooldown * 2, self.max_cooldown)
+                    self._open()
+                self._condition.notify_all()
+            elif self.state == self.CLOSED and self._should_open():
+                self._open()
+
+    def _should_open(self) -> bool:
+        if len(self._outcomes) < self.min_attempts:
+            return False
+
+        failures = self._outcomes.count(False)
+        return failures / len(self._outcomes) >= self.failure_threshold
+
+    def _open(self) -> None:
+        logger.debug("Circuit for %s opened for %.1fs", self.host, self._cooldown)
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """
+    Allow amounts (requests, bytes) to be consumed at rate per second, with bursts of capacity.
+
+    Consumers reserve their amount up front and sleep off any deficit, so an amount larger
+    than the capacity is allowed and concurrent consumers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: float = 1) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= amount
+            deficit = -self._tokens
+
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+class RateLimiter:
+    """
+    Throttle the requests and downloaded bytes of all workers in the process.
+
+    Limits are disabled until configured. A server asking clients to back off (with a
+    Retry-After header) pauses every worker, rather than just the one which received it.
+    """
+
+    def __init__(self) -> None:
+        self.requests: TokenBucket | None = None
+        self.bandwidth: TokenBucket | None = None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def configure(
+        self, *, max_requests_per_second: float | None, max_bandwidth: int | None
+    ) -> None:
+        self.requests = TokenBucket(max_requests_per_second) if max_requests_per_second else None
+        self.bandwidth = TokenBucket(max_bandwidth) if max_bandwidth else None
+
+    def pause(self, seconds: float) -> None:
+        logger.debug("Pausing all requests for %.1fs", seconds)
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def wait_for_pause(self) -> None:
+        with self._lock:
+            remaining = self._paused_until - time.monotonic()
+
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def before_request(self) -> None:
+        self.wait_for_pause()
+
+        if self.requests is not None:
+            self.requests.consume()
+
+    def consume_bytes(self, num_bytes: int) -> None:
+        if self.bandwidth is not None:
+            self.bandwidth.consume(num_bytes)
+
+
+class CircuitBreakers:
+    """A CircuitBreaker for each host, created on first use."""
+
+    def __init__(self, **kwargs) -> None:
+        self._kwargs = kwargs
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, host: str) -> CircuitBreaker:
+        with self._lock:
+            if host not in self._breakers:
+                self._breakers[host] = CircuitBreaker(host, **self._kwargs)
+            return self._breakers[host]
+
+
+class Hedger:
+    """
+    Decide when a slow request should be hedged with a duplicate.
+
+    A request which hasn't responded after multiplier times the median of recent response
+    times (and at least min_delay seconds) is likely stuck on a bad connection, so a second
+    request is sent and whichever responds first is used. Hedges are drawn from a budget of
+    ratio of all requests, so a slow server isn't sent twice the load.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        *,
+        multiplier: float = 4,
+        min_delay: float = 0.5,
+        min_samples: int = 10,
+        window: int = 100,
+        ratio: float = 0.05,
+    ) -> None:
+        self.multiplier = multiplier
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = RetryBudget(ratio=ratio, reserve=1, max_balance=10)
+        self._samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def delay(self) -> float | None:
+        """Seconds to wait before hedging a request, or None if too little is known yet."""
+        self.budget.deposit()
+
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            median = statistics.median(self._samples)
+
+        return max(median * self.multiplier, self.min_delay)
+
+
+# shared by every session and worker thread in the process
+RETRY_BUDGET = RetryBudget()
+CIRCUIT_BREAKERS = CircuitBreakers()
+RATE_LIMITER = RateLimiter()
+HEDGER = Hedger()
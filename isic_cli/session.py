@@ -1,17 +1,107 @@
 from __future__ import annotations
 
+from contextlib import contextmanager
 import logging
+import threading
 import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
 
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from requests.exceptions import RequestException
+from requests.packages.urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
 from requests.packages.urllib3.util.retry import Retry
 from retryable_requests import RetryableSession
 
+from isic_cli.resilience import CIRCUIT_BREAKERS, RATE_LIMITER, RETRY_BUDGET
+from isic_cli.stats import STATS, RequestRecord, current_record, endpoint_class, set_current_record
+from isic_cli.tracing import TRACER
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
 logger = logging.getLogger("isic_cli")
 
+_local = threading.local()
+
+
+def _is_failure(status: int) -> bool:
+    return status >= 500 or status == 429
+
+
+class IsicRetry(Retry):
+    """
+    A Retry which records each attempt, retry, and backoff to the in flight RequestRecord.
+
+    Retries are also drawn from the process wide retry budget, and are subject to the process
+    wide rate limits. Circuit breakers are left to IsicCliSession, which records the outcome
+    of each request (rather than each attempt) and checks them before sending it.
+    """
+
+    def increment(self, method=None, url=None, response=None, error=None, *args, **kwargs):
+        record = current_record()
+        if record is not None:
+            record.end_attempt()
+
+        fail_fast = getattr(_local, "fail_fast", False) and error is not None
+        if fail_fast and (self._is_connection_error(error) or self._is_read_error(error)):
+            # see fail_fast_on_timeouts
+            return Retry.increment(self.new(total=0), method, url, response, error, *args, **kwargs)
+
+        new_retry = super().increment(method, url, response, error, *args, **kwargs)
+
+        # only reached if the request would be retried
+        if not RETRY_BUDGET.try_withdraw():
+            logger.debug("Retry budget exhausted, not retrying %s", url)
+            # fail as if this was the last retry, raising or returning the last response
+            return Retry.increment(self.new(total=0), method, url, response, error, *args, **kwargs)
+
+        if record is not None:
+            reason = type(error).__name__ if error else f"status {getattr(response, 'status', '-')}"
+            record.retry_reasons.append(reason)
+
+        return new_retry
+
+    def sleep(self, response=None) -> None:
+        start = time.monotonic()
+
+        retry_after = (
+            self.get_retry_after(response)
+            if response is not None and self.respect_retry_after_header
+            else None
+        )
+        if retry_after:
+            # the server is asking clients to slow down, so every worker should wait
+            RATE_LIMITER.pause(retry_after)
+            RATE_LIMITER.wait_for_pause()
+        else:
+            super().sleep(response)
+
+        RATE_LIMITER.before_request()
+
+        record = current_record()
+        if record is not None:
+            record.start_attempt(backoff=time.monotonic() - start)
+
+
+@contextmanager
+def fail_fast_on_timeouts(*, enabled: bool = True) -> Iterator[None]:
+    """
+    Don't retry timeouts and connection errors of requests made on this thread.
+
+    This is for callers which handle them better than retrying the same request, e.g. by
+    asking for less.
+    """
+    _local.fail_fast = enabled
+    try:
+        yield
+    finally:
+        _local.fail_fast = False
+
 
 # The same as retryable-requests DEFAULT_RETRY_STRATEGY with an
 # increased backoff factor.
-ISIC_RETRY_STRATEGY = Retry(
+ISIC_RETRY_STRATEGY = IsicRetry(
     total=15,
     status_forcelist=[429, 500, 502, 503, 504],
     backoff_factor=5,
@@ -20,14 +110,46 @@ ISIC_RETRY_STRATEGY = Retry(
 )
 
 
+class _CountingConnectionsMixin:
+    def _new_conn(self):
+        record = current_record()
+        if record is not None:
+            record.new_connections += 1
+
+        return super()._new_conn()
+
+
+class _CountingHTTPConnectionPool(_CountingConnectionsMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingConnectionsMixin, HTTPSConnectionPool):
+    pass
+
+
+class _InstrumentedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
 class IsicCliSession(RetryableSession):
-    def __init__(self, *args, **kwargs) -> None:
+    def __init__(self, *args, pool_maxsize: int = DEFAULT_POOLSIZE, **kwargs) -> None:
         from isic_cli.utils.version import get_version
 
         kwargs.setdefault("retry_strategy", ISIC_RETRY_STRATEGY)
 
         super().__init__(*args, **kwargs)
 
+        adapter = _InstrumentedHTTPAdapter(
+            pool_maxsize=pool_maxsize, max_retries=kwargs["retry_strategy"]
+        )
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
         self.headers.update(
             {
                 "Accept": "application/json",
@@ -35,16 +157,65 @@ class IsicCliSession(RetryableSession):
             }
         )
 
-    def request(self, *args, **kwargs):
-        kwargs.setdefault("timeout", (3.05, 15))
+    def request(self, method, url, *args, **kwargs):
+        r = self._instrumented_request(method, url, *args, **kwargs)
 
-        start = time.time()
-        r = super().request(*args, **kwargs)
-        end = time.time()
+        # auths which can recover from rejected requests (see OAuthTokenAuth) get to send them
+        # once more, going through the same rate limits and instrumentation.
+        retry_rejected = getattr(kwargs.get("auth") or self.auth, "retry_rejected", None)
+        if r.status_code == 401 and retry_rejected is not None and retry_rejected(r):
+            r.close()
+            retried = self._instrumented_request(method, url, *args, **kwargs)
+            retried.history.append(r)
+            return retried
 
-        # TODO: this is a little confusing because retries are included in
-        # these times - maybe break it out.
-        logger.debug("timing: %f", end - start)
+        return r
+
+    def _instrumented_request(self, method, url, *args, **kwargs):
+        kwargs.setdefault("timeout", (3.05, 15))
+
+        full_url = self.create_url(url)
+        breaker = CIRCUIT_BREAKERS[urlparse(full_url).hostname]
+        breaker.wait_until_available()
+
+        record = RequestRecord(endpoint=endpoint_class(full_url))
+        set_current_record(record)
+        try:
+            RATE_LIMITER.before_request()
+            RETRY_BUDGET.deposit()
+            with TRACER.span(f"{method} {record.endpoint}", "http") as span:
+                r = super().request(method, url, *args, **kwargs)
+                span.args.update(status=r.status_code, attempts=len(record.attempts) + 1)
+        except RequestException:
+            breaker.record(success=False)
+            record.finish(status=None, num_bytes=0)
+            STATS.add(record)
+            raise
+        except BaseException:
+            # e.g. an OAuthError from refreshing the token, or an interrupt. The request never
+            # had an outcome, but if it was probing the host the requests waiting on it must
+            # be released.
+            breaker.abandon_probe()
+            raise
+        finally:
+            set_current_record(None)
+
+        breaker.record(success=not _is_failure(r.status_code))
+
+        if kwargs.get("stream"):
+            num_bytes = int(r.headers.get("Content-Length") or 0)
+        else:
+            num_bytes = len(r.content)
+
+        record.finish(status=r.status_code, num_bytes=num_bytes)
+        STATS.add(record)
+
+        logger.debug(
+            "timing: %f (%d attempts, %f spent in backoff)",
+            record.duration,
+            len(record.attempts),
+            record.backoff,
+        )
 
         if not r.ok:
             logger.debug("bad response: %s", r.text)
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass, field
+import re
+import threading
+import time
+from typing import TYPE_CHECKING
+from urllib.parse import urlparse
+
+if TYPE_CHECKING:
+    from rich.console import Console
+
+# upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 15000)
+
+_ID_SEGMENT = re.compile(r"^(\d+|ISIC_\d+)$")
+
+_local = threading.local()
+
+
+def endpoint_class(url: str) -> str:
+    """Group a url with others that hit the same endpoint, e.g. collections/{id}/."""
+    parsed = urlparse(url)
+
+    if "/api/" not in parsed.path:
+        # signed file urls are unique per file, so they're grouped by host
+        return parsed.netloc
+
+    path = parsed.path.split("/api/v2/", 1)[-1]
+    segments = ["{id}" if _ID_SEGMENT.match(segment) else segment for segment in path.split("/")]
+    return f"{parsed.netloc}/{'/'.join(segments)}"
+
+
+@dataclass
+class RequestRecord:
+    """The timings of a single logical request, which may span several attempts."""
+
+    endpoint: str
+    started_at: float = field(default_factory=time.monotonic)
+    attempt_started_at: float | None = None
+    attempts: list[float] = field(default_factory=list)
+    retry_reasons: list[str] = field(default_factory=list)
+    backoff: float = 0.0
+    new_connections: int = 0
+    bytes: int = 0
+    status: int | None = None
+    duration: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.attempt_started_at = self.started_at
+
+    def end_attempt(self) -> None:
+        if self.attempt_started_at is not None:
+            self.attempts.append(time.monotonic() - self.attempt_started_at)
+            self.attempt_started_at = None
+
+    def start_attempt(self, backoff: float) -> None:
+        self.backoff += backoff
+        self.attempt_started_at = time.monotonic()
+
+    def finish(self, status: int | None, num_bytes: int) -> None:
+        self.end_attempt()
+        self.status = status
+        self.bytes = num_bytes
+        self.duration = time.monotonic() - self.started_at
+
+
+def current_record() -> RequestRecord | None:
+    """Return the record of the request in flight on this thread, if any."""
+    return getattr(_local, "record", None)
+
+
+def set_current_record(record: RequestRecord | None) -> None:
+    _local.record = record
+
+
+@dataclass
+class EndpointStats:
+    requests: int = 0
+    attempts: int = 0
+    errors: int = 0
+    retry_reasons: Counter = field(default_factory=Counter)
+    statuses: Counter = field(default_factory=Counter)
+    bytes: int = 0
+    new_connections: int = 0
+    reused_connections: int = 0
+    duration: float = 0.0
+    backoff: float = 0.0
+    latency_histogram: list[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1)
+    )
+
+    def add(self, record: RequestRecord) -> None:
+        self.requests += 1
+        self.attempts += len(record.attempts)
+        self.errors += record.status is None or record.status >= 400
+        self.retry_reasons.update(record.retry_reasons)
+        self.statuses[str(record.status or "error")] += 1
+        self.bytes += record.bytes
+        self.new_connections += record.new_connections
+        self.reused_connections += max(len(record.attempts) - record.new_connections, 0)
+        self.duration += record.duration
+        self.backoff += record.backoff
+
+        for attempt in record.attempts:
+            ms = attempt * 1000
+            bucket = next(
+                (i for i, bound in enumerate(LATENCY_BUCKETS_MS) if ms <= bound),
+                len(LATENCY_BUCKETS_MS),
+            )
+            self.latency_histogram[bucket] += 1
+
+    def latency_percentile(self, percentile: float) -> float | None:
+        """Estimate a latency percentile (in ms) as the upper bound of its histogram bucket."""
+        total = sum(self.latency_histogram)
+        if not total:
+            return None
+
+        seen = 0
+        for i, count in enumerate(self.latency_histogram):
+            seen += count
+            if seen >= total * percentile:
+                return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else float("inf")
+
+    def to_dict(self) -> dict:
+        bucket_names = [f"le_{bound}ms" for bound in LATENCY_BUCKETS_MS] + [
+            f"gt_{LATENCY_BUCKETS_MS[-1]}ms"
+        ]
+        return {
+            "requests": self.requests,
+            "attempts": self.attempts,
+            "errors": self.errors,
+            "retry_reasons": dict(self.retry_reasons),
+            "statuses": dict(self.statuses),
+            "bytes": self.bytes,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "duration_seconds": self.duration,
+            "backoff_seconds": self.backoff,
+            "attempt_latency_histogram": dict(zip(bucket_names, self.latency_histogram)),
+        }
+
+
+class RequestStats:
+    """Aggregates request records by endpoint. Recording is a no-op until enabled."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._endpoints: dict[str, EndpointStats] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def add(self, record: RequestRecord) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._endpoints.setdefault(record.endpoint, EndpointStats()).add(record)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"endpoints": {k: v.to_dict() for k, v in sorted(self._endpoints.items())}}
+
+    def print_summary(self, console: Console) -> None:
+        from humanize import naturalsize
+        from rich.table import Table
+
+        table = Table(title="HTTP requests")
+        table.add_column("Endpoint", style="cyan")
+        table.add_column("Requests", justify="right")
+        table.add_column("Retries", justify="right")
+        table.add_column("Errors", justify="right")
+        table.add_column("p50/p90/p99 attempt (ms)", justify="right")
+        table.add_column("Backoff (s)", justify="right")
+        table.add_column("Transferred", justify="right")
+        table.add_column("New/reused conns", justify="right")
+
+        with self._lock:
+            endpoints = sorted(self._endpoints.items())
+
+        for endpoint, stats in endpoints:
+            percentiles = "/".join(
+                f"{p:g}" if p is not None else "-"
+                for p in (stats.latency_percentile(x) for x in (0.5, 0.9, 0.99))
+            )
+            retries = ", ".join(f"{n}x {reason}" for reason, n in stats.retry_reasons.most_common())
+            table.add_row(
+                endpoint,
+                str(stats.requests),
+                retries or "0",
+                str(stats.errors),
+                percentiles,
+                f"{stats.backoff:.1f}",
+                naturalsize(stats.bytes),
+                f"{stats.new_connections}/{stats.reused_connections}",
+            )
+
+        console.print(table)
+
+
+STATS = RequestStats()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class Span:
+    """A timed section of work, recorded as a chrome trace "complete" event when it ends."""
+
+    def __init__(self, tracer: Tracer, name: str, category: str, args: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+
+        self.tracer.add_complete_event(self, time.perf_counter_ns())
+
+
+class _NullSpan:
+    """Stands in for a Span when tracing is disabled, so instrumentation costs next to nothing."""
+
+    @property
+    def args(self) -> dict[str, Any]:
+        # a throwaway dict, so callers can annotate spans without checking if tracing is enabled
+        return {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """Collects spans in the chrome trace event format, viewable in Perfetto or about:tracing."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._events: list[dict] = []
+        self._thread_names: dict[int, str] = {}
+        self._origin = time.perf_counter_ns()
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def span(self, name: str, category: str = "isic", **args: Any) -> Span | _NullSpan:
+        if not self.enabled:
+            return _NULL_SPAN
+
+        return Span(self, name, category, args)
+
+    def add_complete_event(self, span: Span, end_ns: int) -> None:
+        thread = threading.current_thread()
+        event = {
+            "name": span.name,
+            "cat": span.category,
+            "ph": "X",
+            "ts": (span.start_ns - self._origin) / 1000,
+            "dur": (end_ns - span.start_ns) / 1000,
+            "pid": os.getpid(),
+            "tid": thread.ident,
+            "args": span.args,
+        }
+
+        with self._lock:
+            self._events.append(event)
+            self._thread_names.setdefault(thread.ident, thread.name)
+
+    def write(self, path: Path) -> None:
+        with self._lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": os.getpid(),
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self._thread_names.items()
+            ]
+            events = metadata + self._events
+
+        with path.open("w", encoding="utf8") as outfile:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, outfile, default=str)
+
+
+TRACER = Tracer()
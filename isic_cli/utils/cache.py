@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import time
+from typing import Any
+
+from isic_cli.utils.storage import get_data_dir, read_json, write_json
+
+
+class TTLCache:
+    """A small on-disk cache whose entries expire after ttl seconds."""
+
+    def __init__(self, name: str, ttl: float) -> None:
+        self.path = get_data_dir() / f"{name}-cache.json"
+        self.ttl = ttl
+        self._data = read_json(self.path)
+
+    def _is_fresh(self, entry: Any, now: float) -> bool:
+        return isinstance(entry, dict) and now - entry.get("cached_at", 0) < self.ttl
+
+    def get(self, key: str) -> Any | None:
+        entry = self._data.get(key)
+        return entry["value"] if self._is_fresh(entry, time.time()) else None
+
+    def update(self, values: dict[str, Any]) -> None:
+        if not values:
+            return
+
+        now = time.time()
+        # re-read the file so entries written by other processes in the meantime survive
+        self._data = {k: v for k, v in read_json(self.path).items() if self._is_fresh(v, now)}
+        self._data.update({k: {"cached_at": now, "value": v} for k, v in values.items()})
+        write_json(self.path, self._data)
@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+# decoding large search pages is on the critical path of metadata exports, so a faster
+# decoder is used when one happens to be installed (see the "fast" extra).
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    loads = orjson.loads
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    loads = msgspec.json.Decoder().decode
+else:
+    BACKEND = "json"
+
+    def loads(data: bytes | str) -> Any:
+        return json.loads(data)
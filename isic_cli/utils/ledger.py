@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import hashlib
+from typing import TYPE_CHECKING
+
+from isic_cli.utils.storage import get_data_dir, locked, read_json, write_json
+
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+def file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class UploadLedger:
+    """
+    A local record of accession uploads.
+
+    Entries are keyed by environment, cohort, and the sha256 of the file contents so that
+    renamed or moved files are still recognized. Each entry has a status of "uploading"
+    (along with the state needed to resume a multipart upload) or "created" (along with the
+    resulting accession).
+
+    Writes re-read the file under a lock, so concurrent uploads (e.g. with xargs -P) don't
+    overwrite each other's entries.
+    """
+
+    def __init__(self, path: Path, env: str) -> None:
+        self.path = path
+        self.env = env
+        self._data = read_json(path)
+
+    @classmethod
+    def load(cls, env: str) -> UploadLedger:
+        return cls(get_data_dir() / "upload-ledger.json", env)
+
+    def _entries(self, cohort_id: int) -> dict:
+        return self._data.setdefault(self.env, {}).setdefault(str(cohort_id), {})
+
+    def get(self, cohort_id: int, digest: str) -> dict | None:
+        return self._entries(cohort_id).get(digest)
+
+    def update(self, cohort_id: int, digest: str, entry: dict) -> None:
+        with locked(self.path):
+            self._data = read_json(self.path)
+            self._entries(cohort_id)[digest] = entry
+            write_json(self.path, self._data)
+
+    def remove(self, cohort_id: int, digest: str) -> None:
+        with locked(self.path):
+            self._data = read_json(self.path)
+            if self._entries(cohort_id).pop(digest, None) is not None:
+                write_json(self.path, self._data)
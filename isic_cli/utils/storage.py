@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+import json
+import logging
+import os
+from pathlib import Path
+import sys
+from tempfile import NamedTemporaryFile
+from typing import TYPE_CHECKING
+
+import click
+
+if TYPE_CHECKING:
+    from collections.abc import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+def get_data_dir() -> Path:
+    """
+    Get the directory isic-cli uses for persistent local state.
+
+    This can be overridden with the ISIC_CLI_DATA_DIR environment variable, which is useful
+    for machines with a read only home directory.
+    """
+    data_dir = Path(os.environ.get("ISIC_CLI_DATA_DIR") or click.get_app_dir("isic-cli"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def read_json(path: Path) -> dict:
+    try:
+        with path.open(encoding="utf8") as infile:
+            data = json.load(infile)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        # a corrupt or unreadable file is treated the same as a missing one, this state is
+        # only ever an optimization.
+        logger.debug("Unable to read %s", path)
+        return {}
+
+    return data if isinstance(data, dict) else {}
+
+
+def write_json(path: Path, data: dict) -> None:
+    # write to a temporary file and rename it so that concurrent readers and interrupted
+    # writers never observe a partially written file.
+    with NamedTemporaryFile(
+        "w", dir=path.parent, prefix=f".{path.name}.", delete=False, encoding="utf8"
+    ) as outfile:
+        json.dump(data, outfile)
+
+    Path(outfile.name).replace(path)
+
+
+@contextmanager
+def locked(path: Path) -> Iterator[None]:
+    """
+    Hold an exclusive lock on path, across processes.
+
+    The lock is taken on a separate .lock file, since write_json replaces path itself.
+    """
+    with path.with_name(f"{path.name}.lock").open("a+b") as lock_file:
+        if sys.platform == "win32":
+            import msvcrt
+
+            # blocks, retrying every second for up to 10 seconds
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -1,16 +1,27 @@
 from __future__ import annotations
 
+import atexit
 from importlib.metadata import PackageNotFoundError, version
 import logging
+import os
 import sys
+import threading
+import time
 
 import click
-from packaging.version import Version
+from packaging.version import InvalidVersion, Version
 import requests
 from requests.exceptions import RequestException
 
+from isic_cli.utils.storage import get_data_dir, read_json, write_json
+
 logger = logging.getLogger(__name__)
 
+# how often pypi is consulted for a newer version, in seconds
+VERSION_CHECK_TTL = 60 * 60 * 24
+# how long exiting waits on a version check still in progress, in seconds
+VERSION_CHECK_EXIT_TIMEOUT = 1
+
 
 def get_version() -> Version | None:
     try:
@@ -47,35 +58,89 @@ def newest_version_available() -> Version | None:
         return sorted(real_releases)[-1]
 
 
+def _version_check_cache_path():
+    return get_data_dir() / "version-check.json"
+
+
+def refresh_newest_version_cache() -> None:
+    cache_path = _version_check_cache_path()
+    cache = read_json(cache_path)
+
+    # record the check before making it, so checks which fail (e.g. on machines without
+    # internet access) or are cut short by the process exiting aren't retried on every
+    # invocation.
+    cache["checked_at"] = time.time()
+    write_json(cache_path, cache)
+
+    try:
+        newest_version = newest_version_available()
+    except RequestException:
+        logger.debug("Failed to check for newer version of isic-cli.")
+        return
+
+    cache["newest_version"] = str(newest_version) if newest_version else None
+    write_json(cache_path, cache)
+
+
+def cached_newest_version() -> tuple[Version | None, bool]:
+    """Return the newest version recorded by the last check, and whether that check is stale."""
+    cache = read_json(_version_check_cache_path())
+    checked_at = cache.get("checked_at")
+    stale = not isinstance(checked_at, (int, float)) or time.time() - checked_at > VERSION_CHECK_TTL
+
+    try:
+        newest_version = Version(cache["newest_version"]) if cache.get("newest_version") else None
+    except InvalidVersion:
+        newest_version = None
+
+    return newest_version, stale
+
+
+def _is_interactive() -> bool:
+    return all(stream is not None and stream.isatty() for stream in [sys.stdin, sys.stderr]) and (
+        not os.environ.get("CI")
+    )
+
+
 def check_for_newer_version():
     this_version = get_version()
 
     if not this_version or this_version.is_devrelease:
         return
 
-    try:
-        newest_version = newest_version_available()
-    except RequestException:
-        logger.warning("Failed to check for newer version of isic-cli.")
+    # batch jobs and scripts get no benefit from an upgrade notice
+    if not _is_interactive():
+        return
+
+    newest_version, stale = cached_newest_version()
+
+    if stale:
+        # the result is only used by subsequent invocations, so never make this one wait on
+        # pypi.
+        thread = threading.Thread(
+            target=refresh_newest_version_cache, name="isic-version-check", daemon=True
+        )
+        thread.start()
+        # give the check a moment to finish at exit, rather than killing it mid write
+        atexit.register(thread.join, VERSION_CHECK_EXIT_TIMEOUT)
+
+    if not newest_version:
         return
-    else:
-        if not newest_version:
-            return
 
-        upgrade_type_available = upgrade_type(this_version, newest_version)
+    upgrade_type_available = upgrade_type(this_version, newest_version)
 
-        if upgrade_type_available == "major":
-            click.secho(
-                """There is a new major version of isic-cli available.
+    if upgrade_type_available == "major":
+        click.secho(
+            """There is a new major version of isic-cli available.
 You must upgrade before continuing. See https://github.com/ImageMarkup/isic-cli for instructions.
 """,
-                fg="yellow",
-                err=True,
-            )
-            sys.exit(1)
-        elif upgrade_type_available == "minor":
-            click.secho(
-                "Psst, there's a new version of isic-cli available. Upgrade!\n",
-                fg="yellow",
-                err=True,
-            )
+            fg="yellow",
+            err=True,
+        )
+        sys.exit(1)
+    elif upgrade_type_available == "minor":
+        click.secho(
+            "Psst, there's a new version of isic-cli available. Upgrade!\n",
+            fg="yellow",
+            err=True,
+        )
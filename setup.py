@@ -54,9 +54,13 @@ setup(
         "tenacity",
     ],
     extras_require={
+        # faster decoding of api responses
+        "fast": ["orjson"],
+        # downloading straight to s3 compatible object storage
+        "s3": ["boto3"],
         "dev": [
             "ipython",
             "tox",
-        ]
+        ],
     },
 )
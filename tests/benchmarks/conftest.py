@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+import json
+import os
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+import pytest
+
+# runs the cli against an arbitrary server by overriding the dev domain
+_RUN_CLI = (
+    "import sys; import isic_cli.cli as cli; "
+    "cli.DOMAINS['dev'] = sys.argv.pop(1); sys.argv[0] = 'isic'; cli.main()"
+)
+
+_results: list[dict] = []
+
+
+@dataclass
+class CliRun:
+    returncode: int
+    seconds: float
+    # None where peak memory of a child process can't be measured (windows)
+    peak_rss_bytes: int | None
+    output: str
+
+
+@pytest.fixture()
+def run_isic(tmp_path):
+    """Run the isic cli in a subprocess, measuring wall time and peak memory."""
+
+    def run(server_url: str, args: list[str]) -> CliRun:
+        env = {**os.environ, "ISIC_CLI_DATA_DIR": str(tmp_path / "isic-cli-data")}
+        cmd = [sys.executable, "-c", _RUN_CLI, server_url, "--dev", "--no-version-check", *args]
+        output_path = tmp_path / "output.txt"
+
+        with output_path.open("wb") as output:
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                cmd, cwd=tmp_path, env=env, stdout=output, stderr=subprocess.STDOUT
+            )
+
+            if hasattr(os, "wait4"):
+                _, status, rusage = os.wait4(process.pid, 0)
+                seconds = time.perf_counter() - start
+                returncode = os.waitstatus_to_exitcode(status)
+                # ru_maxrss is in kilobytes on linux and bytes on macos
+                peak_rss = rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+            else:
+                returncode = process.wait()
+                seconds = time.perf_counter() - start
+                peak_rss = None
+
+        return CliRun(returncode, seconds, peak_rss, output_path.read_text(errors="replace"))
+
+    return run
+
+
+@pytest.fixture()
+def record_benchmark(request):
+    """Record metrics of a benchmark, reported at the end of the session."""
+
+    def record(**metrics) -> None:
+        _results.append({"benchmark": request.node.name, **metrics})
+
+    return record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+
+    terminalreporter.section("benchmarks")
+    for result in _results:
+        metrics = ", ".join(
+            f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+            for k, v in result.items()
+            if k != "benchmark"
+        )
+        terminalreporter.write_line(f"{result['benchmark']}: {metrics}")
+
+    if output := os.environ.get("ISIC_BENCHMARK_JSON"):
+        with Path(output).open("w") as f:
+            json.dump(_results, f, indent=2)
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import csv
+import functools
+import json
+import statistics
+import time
+import tracemalloc
+
+import pytest
+
+from isic_cli.io.http import (
+    bulk_collection_operation,
+    download_image,
+    get_images,
+    get_images_page,
+    get_images_partitioned,
+)
+from isic_cli.metadata import extract_metadata
+from isic_cli.session import get_session
+
+pytestmark = pytest.mark.benchmark
+
+MB = 1024 * 1024
+
+NETWORKS = {
+    "local": {},
+    "slow": {"latency": 0.02, "bandwidth": 20 * MB, "error_rate": 0.05},
+}
+
+
+class _Progress:
+    def update(self, task, advance):
+        pass
+
+
+@pytest.mark.parametrize("network", NETWORKS)
+def test_image_download(fake_isic, run_isic, record_benchmark, tmp_path, network):
+    server = fake_isic(num_images=200, image_size=256 * 1024, **NETWORKS[network])
+
+    run = run_isic(server.url, ["--guest", "image", "download", "images"])
+
+    assert run.returncode == 0, run.output
+    assert len(list((tmp_path / "images").glob("*.jpg"))) == 200
+    record_benchmark(
+        files_per_second=200 / run.seconds,
+        mb_per_second=200 * server.config.image_size / MB / run.seconds,
+        peak_rss_mb=run.peak_rss_bytes / MB if run.peak_rss_bytes else None,
+        seconds=run.seconds,
+    )
+
+
+def test_image_download_with_stalls(fake_isic, run_isic, record_benchmark, tmp_path):
+    # a few requests stall for longer than the download of every other image takes
+    server = fake_isic(num_images=500, image_size=64 * 1024, stall_rate=0.01, stall_seconds=10)
+
+    run = run_isic(server.url, ["--guest", "image", "download", "images"])
+
+    assert run.returncode == 0, run.output
+    assert len(list((tmp_path / "images").glob("*.jpg"))) == 500
+    record_benchmark(seconds=run.seconds, hedged_requests=server.requests["/files/"] - 500)
+
+
+def test_metadata_download(fake_isic, run_isic, record_benchmark, tmp_path):
+    server = fake_isic(num_images=5000, image_size=1, page_size=100)
+
+    run = run_isic(server.url, ["--guest", "metadata", "download", "-o", "metadata.csv"])
+
+    assert run.returncode == 0, run.output
+    with (tmp_path / "metadata.csv").open() as f:
+        assert sum(1 for _ in csv.DictReader(f)) == 5000
+    record_benchmark(
+        records_per_second=5000 / run.seconds,
+        peak_rss_mb=run.peak_rss_bytes / MB if run.peak_rss_bytes else None,
+        seconds=run.seconds,
+    )
+
+
+def test_metadata_validate(run_isic, record_benchmark, tmp_path):
+    num_rows = 20000
+    with (tmp_path / "metadata.csv").open("w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["patient_id", "lesion_id", "age", "sex", "anatom_site_general"])
+        for i in range(num_rows):
+            writer.writerow([f"p{i // 4}", f"l{i // 2}", 20 + i % 60, "male", "head/neck"])
+
+    # validation is local, the server url is never used
+    run = run_isic("http://127.0.0.1:1", ["metadata", "validate", "metadata.csv"])
+
+    assert run.returncode == 0, run.output
+    record_benchmark(
+        rows_per_second=num_rows / run.seconds,
+        peak_rss_mb=run.peak_rss_bytes / MB if run.peak_rss_bytes else None,
+        seconds=run.seconds,
+    )
+
+
+@pytest.mark.parametrize("args", [["--help"], ["image", "download", "--help"]])
+def test_startup_time(run_isic, record_benchmark, args):
+    runs = [run_isic("http://127.0.0.1:1", args) for _ in range(5)]
+
+    assert all(run.returncode == 0 for run in runs), runs[0].output
+    record_benchmark(
+        median_seconds=statistics.median(run.seconds for run in runs),
+        min_seconds=min(run.seconds for run in runs),
+    )
+
+
+@pytest.mark.parametrize("network", NETWORKS)
+def test_get_images_pagination(fake_isic, record_benchmark, network):
+    server = fake_isic(num_images=10000, image_size=1, page_size=100, **NETWORKS[network])
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        start = time.perf_counter()
+        num_images = sum(1 for _ in get_images(session))
+        seconds = time.perf_counter() - start
+
+    assert num_images == 10000
+    record_benchmark(
+        images_per_second=num_images / seconds,
+        pages_per_second=server.requests["/api/v2/images/search/"] / seconds,
+    )
+
+
+@pytest.mark.parametrize("network", NETWORKS)
+def test_get_images_partitioned_pagination(fake_isic, record_benchmark, network):
+    server = fake_isic(
+        num_images=10000, image_size=1, page_size=100, num_collections=4, **NETWORKS[network]
+    )
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        start = time.perf_counter()
+        first_page = get_images_page(session, collections="1,2,3,4")
+        num_images = sum(
+            1 for _ in get_images_partitioned(session, collections="1,2,3,4", first_page=first_page)
+        )
+        seconds = time.perf_counter() - start
+
+    assert num_images == 10000
+    record_benchmark(images_per_second=num_images / seconds)
+
+
+@pytest.mark.parametrize("network", NETWORKS)
+def test_download_image(fake_isic, record_benchmark, tmp_path, network):
+    server = fake_isic(num_images=100, image_size=MB, **NETWORKS[network])
+    func = functools.partial(download_image, to=tmp_path, progress=_Progress(), task=None)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(10) as thread_pool:
+        list(thread_pool.map(func, server.images))
+    seconds = time.perf_counter() - start
+
+    assert len(list(tmp_path.glob("*.jpg"))) == 100
+    record_benchmark(files_per_second=100 / seconds, mb_per_second=100 / seconds)
+
+
+def test_extract_metadata(fake_isic, record_benchmark):
+    images = fake_isic(num_images=100000, image_size=1).images
+
+    start = time.perf_counter()
+    headers, records = extract_metadata(images)
+    seconds = time.perf_counter() - start
+
+    # decode the images afresh, as they would be from the API, so no strings are shared with
+    # the fake server and the memory retained by the records is measured
+    encoded = json.dumps(images)
+    tracemalloc.start()
+    _, retained = extract_metadata(json.loads(encoded))
+    retained_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    assert len(records) == 100000
+    assert "age_approx" in headers
+    record_benchmark(
+        records_per_second=len(records) / seconds,
+        retained_mb=retained_bytes / MB,
+    )
+
+
+def test_bulk_collection_operation(fake_isic, record_benchmark):
+    server = fake_isic(num_images=0, latency=0.005)
+    isic_ids = [f"ISIC_{i:07d}" for i in range(5000)]
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        start = time.perf_counter()
+        summary = bulk_collection_operation(
+            session, 1, "populate-from-list", isic_ids, _Progress(), None
+        )
+        seconds = time.perf_counter() - start
+
+    assert len(summary["succeeded"]) == 5000
+    record_benchmark(ids_per_second=len(isic_ids) / seconds)
+
+
+@pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+def test_page_decode(fake_isic, record_benchmark, backend):
+    if backend == "json":
+        loads = json.loads
+    elif backend == "orjson":
+        loads = pytest.importorskip("orjson").loads
+    else:
+        loads = pytest.importorskip("msgspec").json.Decoder().decode
+
+    images = fake_isic(num_images=1000, image_size=1).images
+    page = json.dumps({"count": 1000, "next": None, "previous": None, "results": images}).encode()
+
+    num_decodes = 50
+    start = time.perf_counter()
+    for _ in range(num_decodes):
+        loads(page)
+    seconds = time.perf_counter() - start
+
+    record_benchmark(
+        ms_per_1000_result_page=seconds / num_decodes * 1000,
+        mb_per_second=len(page) * num_decodes / MB / seconds,
+    )
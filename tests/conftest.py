@@ -6,6 +6,8 @@ from click.testing import CliRunner
 import pytest
 
 from isic_cli.cli import cli
+from tests.fake_s3 import FakeS3Server
+from tests.fake_server import FakeIsicConfig, FakeIsicServer
 
 
 @pytest.fixture(autouse=True)
@@ -13,6 +15,11 @@ def _mock_sentry_setup(mocker):
     mocker.patch("isic_cli.cli._sentry_setup", return_value=None)
 
 
+@pytest.fixture(autouse=True)
+def _isolated_data_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv("ISIC_CLI_DATA_DIR", str(tmp_path / "isic-cli-data"))
+
+
 @pytest.fixture()
 def runner():
     return CliRunner()
@@ -53,4 +60,31 @@ def _mock_user(mocker):
     mocker.patch.object(GirderCliOAuthClient, "maybe_restore_login", maybe_restore_login)
     mocker.patch.object(GirderCliOAuthClient, "auth_headers", auth_headers)
 
-    mocker.patch("isic_cli.cli.get_users_me", return_value={"email": "fakeuser@email.test"})
+    mocker.patch("isic_cli.cli.context.get_users_me", return_value={"email": "fakeuser@email.test"})
+
+
+@pytest.fixture()
+def fake_isic():
+    """Start local stand-ins for the ISIC API and S3, see tests/fake_server.py."""
+    servers = []
+
+    def factory(**kwargs) -> FakeIsicServer:
+        server = FakeIsicServer(FakeIsicConfig(**kwargs)).__enter__()
+        servers.append(server)
+        return server
+
+    yield factory
+
+    for server in servers:
+        server.__exit__()
+
+
+@pytest.fixture()
+def fake_s3(monkeypatch):
+    """Start a local stand-in for S3 compatible storage, see tests/fake_s3.py."""
+    with FakeS3Server() as server:
+        monkeypatch.setenv("AWS_ENDPOINT_URL", server.url)
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+        monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+        yield server
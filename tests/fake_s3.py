@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import re
+import threading
+from urllib.parse import parse_qs, unquote, urlparse
+import uuid
+from xml.sax.saxutils import escape
+
+
+class FakeS3Server:
+    """
+    A local stand-in for an S3 compatible object store (like MinIO), with path style urls.
+
+    It implements just enough of the API for uploads: put, head, and listing objects, and
+    creating, completing, and aborting multipart uploads.
+    """
+
+    def __init__(self) -> None:
+        self.objects: dict[str, bytes] = {}
+        # upload id -> key and parts by part number
+        self.uploads: dict[str, tuple[str, dict[int, bytes]]] = {}
+        self.aborted: list[str] = []
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}"
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:  # noqa: C901
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _parse(self) -> tuple[str, dict[str, str]]:
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query, keep_blank_values=True).items()}
+                return unquote(url.path.lstrip("/")), params
+
+            def _body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _send(self, status: int, body: bytes = b"", headers: dict | None = None) -> None:
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _send_xml(self, xml: str) -> None:
+                self._send(
+                    200,
+                    f'<?xml version="1.0" encoding="UTF-8"?>{xml}'.encode(),
+                    {"Content-Type": "application/xml"},
+                )
+
+            def _etag(self, data: bytes) -> str:
+                return f'"{hashlib.md5(data).hexdigest()}"'
+
+            def do_PUT(self) -> None:  # noqa: N802
+                key, params = self._parse()
+                data = self._body()
+
+                with server._lock:
+                    if "uploadId" in params:
+                        server.uploads[params["uploadId"]][1][int(params["partNumber"])] = data
+                    else:
+                        server.objects[key] = data
+
+                self._send(200, headers={"ETag": self._etag(data)})
+
+            def do_POST(self) -> None:  # noqa: N802
+                key, params = self._parse()
+                body = self._body()
+                bucket, _, object_key = key.partition("/")
+
+                if "uploads" in params:
+                    upload_id = uuid.uuid4().hex
+                    with server._lock:
+                        server.uploads[upload_id] = (key, {})
+                    self._send_xml(
+                        f"<InitiateMultipartUploadResult><Bucket>{bucket}</Bucket>"
+                        f"<Key>{escape(object_key)}</Key><UploadId>{upload_id}</UploadId>"
+                        "</InitiateMultipartUploadResult>"
+                    )
+                else:
+                    part_numbers = [int(n) for n in re.findall(rb"<PartNumber>(\d+)<", body)]
+                    with server._lock:
+                        _, parts = server.uploads.pop(params["uploadId"])
+                        server.objects[key] = b"".join(parts[n] for n in part_numbers)
+                    self._send_xml(
+                        f"<CompleteMultipartUploadResult><Bucket>{bucket}</Bucket>"
+                        f"<Key>{escape(object_key)}</Key><ETag>&quot;fake&quot;</ETag>"
+                        "</CompleteMultipartUploadResult>"
+                    )
+
+            def do_DELETE(self) -> None:  # noqa: N802
+                _, params = self._parse()
+                with server._lock:
+                    server.uploads.pop(params["uploadId"], None)
+                    server.aborted.append(params["uploadId"])
+                self._send(204)
+
+            def do_HEAD(self) -> None:  # noqa: N802
+                key, _ = self._parse()
+                data = server.objects.get(key)
+                if data is None:
+                    self._send(404)
+                else:
+                    self._send(200, data, {"ETag": self._etag(data)})
+
+            def do_GET(self) -> None:  # noqa: N802
+                bucket, params = self._parse()
+                prefix = f"{bucket}/{params.get('prefix', '')}"
+                with server._lock:
+                    contents = "".join(
+                        f"<Contents><Key>{escape(key[len(bucket) + 1 :])}</Key>"
+                        f"<Size>{len(data)}</Size></Contents>"
+                        for key, data in sorted(server.objects.items())
+                        # only objects directly under the prefix, as with a "/" delimiter
+                        if key.startswith(prefix) and "/" not in key[len(prefix) :]
+                    )
+                self._send_xml(
+                    f"<ListBucketResult><Name>{bucket}</Name><IsTruncated>false</IsTruncated>"
+                    f"{contents}</ListBucketResult>"
+                )
+
+        return Handler
@@ -0,0 +1,273 @@
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qs, urlencode, urlparse
+
+ATTRIBUTIONS = ["Anonymous", "Hospital A", "Hospital B", "University C"]
+LICENSES = ["CC-0", "CC-BY", "CC-BY-NC"]
+
+
+@dataclass
+class FakeIsicConfig:
+    num_images: int = 100
+    image_size: int = 64 * 1024
+    page_size: int = 50
+    num_collections: int = 3
+    # how many (consecutive) collections each image belongs to
+    collections_per_image: int = 1
+    # seconds added to every response
+    latency: float = 0.0
+    # bytes per second per file transfer, or None for unlimited
+    bandwidth: int | None = None
+    # probability that the first request for a file fails with a 503
+    error_rate: float = 0.0
+    # probability that the first request for a file stalls for stall_seconds before responding
+    stall_rate: float = 0.0
+    stall_seconds: float = 5.0
+    # seconds until signed urls in search results expire, or None for urls which never expire
+    url_ttl: float | None = None
+    # when set, api requests must be made with this bearer token (see FakeIsicServer.access_token)
+    access_token: str | None = None
+    seed: int = 0
+
+
+class FakeIsicServer:
+    """
+    A local stand-in for the ISIC API and the S3 bucket its signed urls point to.
+
+    It implements just enough of the API to drive image/metadata downloads and collection
+    operations, with configurable latency, bandwidth, and error injection.
+    """
+
+    def __init__(self, config: FakeIsicConfig | None = None) -> None:
+        self.config = config or FakeIsicConfig()
+        self.requests: Counter[str] = Counter()
+        # can be changed to revoke the tokens of clients
+        self.access_token = self.config.access_token
+        self._lock = threading.Lock()
+        self._random = random.Random(self.config.seed)
+        self._failed_files: set[str] = set()
+        self._stalled_files: set[str] = set()
+        self._payload = bytes(range(256)) * (self.config.image_size // 256 + 1)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._httpd.request_queue_size = 128
+        self.url = f"http://127.0.0.1:{self._httpd.server_port}"
+        self.images = [self._image(i) for i in range(self.config.num_images)]
+        # image payloads of the API don't list the collections an image belongs to
+        self.image_collections = {
+            image["isic_id"]: {
+                (i + offset) % self.config.num_collections + 1
+                for offset in range(self.config.collections_per_image)
+            }
+            for i, image in enumerate(self.images)
+        }
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _image(self, i: int) -> dict:
+        isic_id = f"ISIC_{i:07d}"
+        return {
+            "isic_id": isic_id,
+            "public": True,
+            "attribution": ATTRIBUTIONS[i % len(ATTRIBUTIONS)],
+            "copyright_license": LICENSES[i % len(LICENSES)],
+            "metadata": {
+                "acquisition": {"image_type": "dermoscopic", "pixels_x": 640, "pixels_y": 480},
+                "clinical": {
+                    "age_approx": 20 + i % 60,
+                    "sex": "male" if i % 2 else "female",
+                    "anatom_site_general": "head/neck",
+                },
+            },
+            "files": {
+                "full": {
+                    "url": f"{self.url}/files/{isic_id}.jpg?X-Amz-Signature=fake",
+                    "size": self.config.image_size,
+                },
+            },
+        }
+
+    def _signed(self, image: dict) -> dict:
+        if self.config.url_ttl is None:
+            return image
+
+        expires = time.time() + self.config.url_ttl
+        url = f"{self.url}/files/{image['isic_id']}.jpg?Expires={expires}&Signature=fake"
+        return {**image, "files": {"full": {**image["files"]["full"], "url": url}}}
+
+    def _collection(self, collection_id: int) -> dict:
+        return {
+            "id": collection_id,
+            "name": f"Collection {collection_id}",
+            "public": True,
+            "pinned": False,
+            "locked": False,
+            "doi": None,
+        }
+
+    def _count(self, path: str) -> None:
+        with self._lock:
+            self.requests[path] += 1
+
+    def _first_request_affected(self, path: str, seen: set[str], rate: float) -> bool:
+        with self._lock:
+            if path in seen or self._random.random() >= rate:
+                return False
+
+            seen.add(path)
+            return True
+
+    def _should_fail(self, path: str) -> bool:
+        return self._first_request_affected(path, self._failed_files, self.config.error_rate)
+
+    def _should_stall(self, path: str) -> bool:
+        return self._first_request_affected(path, self._stalled_files, self.config.stall_rate)
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:  # noqa: C901
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # headers and bodies are written separately, which nagle would delay by ~40ms
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args) -> None:
+                pass
+
+            def _send(self, status: int, body: bytes, content_type="application/json") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _authorized(self) -> bool:
+                return (
+                    server.access_token is None
+                    or self.headers.get("Authorization") == f"Bearer {server.access_token}"
+                )
+
+            def _send_json(self, data, status: int = 200) -> None:
+                self._send(status, json.dumps(data).encode())
+
+            def _send_file(self) -> None:
+                body = server._payload[: server.config.image_size]
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+
+                chunk_size = 64 * 1024
+                for offset in range(0, len(body), chunk_size):
+                    chunk = body[offset : offset + chunk_size]
+                    self.wfile.write(chunk)
+                    if server.config.bandwidth:
+                        time.sleep(len(chunk) / server.config.bandwidth)
+
+            def _search(self, url, params) -> None:
+                collections = {int(c) for c in params.get("collections", "").split(",") if c}
+                # only queries on isic ids are supported, other queries match every image
+                isic_ids = set(re.findall(r"isic_id:(ISIC_\d+)", params.get("query", "")))
+                images = [
+                    image
+                    for image in server.images
+                    if (not collections or collections & server.image_collections[image["isic_id"]])
+                    and (not isic_ids or image["isic_id"] in isic_ids)
+                ]
+
+                if url.path.endswith("/size/"):
+                    self._send_json({"size": sum(i["files"]["full"]["size"] for i in images)})
+                    return
+
+                cursor = int(params.get("cursor", 0))
+                limit = int(params.get("limit", server.config.page_size))
+                next_page = None
+                if cursor + limit < len(images):
+                    next_params = {**params, "cursor": cursor + limit, "limit": limit}
+                    next_page = f"{server.url}{url.path}?{urlencode(next_params)}"
+
+                self._send_json(
+                    {
+                        "count": len(images),
+                        "next": next_page,
+                        "previous": None,
+                        "results": [server._signed(i) for i in images[cursor : cursor + limit]],
+                    }
+                )
+
+            def _file(self, url, params) -> None:
+                if float(params.get("Expires", "inf")) < time.time():
+                    self._send(
+                        403,
+                        b"<Error><Code>AccessDenied</Code>"
+                        b"<Message>Request has expired</Message></Error>",
+                        content_type="application/xml",
+                    )
+                elif server._should_fail(url.path):
+                    self._send(503, b"")
+                else:
+                    if server._should_stall(url.path):
+                        time.sleep(server.config.stall_seconds)
+                    self._send_file()
+
+            def do_GET(self) -> None:  # noqa: N802
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                server._count("/files/" if url.path.startswith("/files/") else url.path)
+                time.sleep(server.config.latency)
+
+                if not url.path.startswith("/files/") and not self._authorized():
+                    self._send_json({"detail": "Invalid token."}, status=401)
+                elif url.path.startswith("/files/"):
+                    self._file(url, params)
+                elif url.path.startswith("/api/v2/images/search/"):
+                    self._search(url, params)
+                elif url.path == "/api/v2/collections/":
+                    collections = [
+                        server._collection(i + 1) for i in range(server.config.num_collections)
+                    ]
+                    self._send_json({"next": None, "previous": None, "results": collections})
+                elif match := re.fullmatch(r"/api/v2/collections/(\d+)/", url.path):
+                    collection_id = int(match.group(1))
+                    if 0 < collection_id <= server.config.num_collections:
+                        self._send_json(server._collection(collection_id))
+                    else:
+                        self._send_json({"detail": "Not found."}, status=404)
+                elif url.path.startswith("/api/v2/zip-download/license-file/"):
+                    self._send(200, b"license text", content_type="text/plain")
+                else:
+                    self._send_json({"detail": "Not found."}, status=404)
+
+            def do_POST(self) -> None:  # noqa: N802
+                url = urlparse(self.path)
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server._count(url.path)
+                time.sleep(server.config.latency)
+
+                if not self._authorized():
+                    self._send_json({"detail": "Invalid token."}, status=401)
+                elif re.fullmatch(
+                    r"/api/v2/collections/\d+/(populate|remove)-from-list/", url.path
+                ):
+                    self._send_json({"succeeded": body["isic_ids"]})
+                else:
+                    self._send_json({"detail": "Not found."}, status=404)
+
+        return Handler
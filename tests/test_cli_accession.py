@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from isic_cli.io.upload import ResumableS3FileFieldClient
+from isic_cli.utils.ledger import UploadLedger, file_digest
+
+
+@pytest.fixture()
+def _mock_cohort(mocker):
+    mocker.patch("isic_cli.cli.types.get_cohort", return_value={"id": 1})
+
+
+@pytest.fixture()
+def accession_file():
+    path = Path("ISIC_foo.jpg")
+    path.write_bytes(b"0" * 30)
+    return path
+
+
+@pytest.mark.usefixtures("_isolated_filesystem", "_mock_user", "_mock_cohort")
+def test_accession_upload_skips_already_uploaded(cli_run, mocker, accession_file):
+    upload_file = mocker.patch.object(
+        ResumableS3FileFieldClient, "upload_file", return_value="field-value"
+    )
+    create_accession = mocker.patch(
+        "isic_cli.cli.accession.create_accession", return_value={"id": 42}
+    )
+
+    result = cli_run(["accession", "upload", "1", str(accession_file)])
+    assert result.exit_code == 0, result.exception
+    assert "Accession uploaded, id=42" in result.output
+
+    result = cli_run(["accession", "upload", "1", str(accession_file), "--json"])
+    assert result.exit_code == 0, result.exception
+    assert json.loads(result.output) == {"id": 42}
+
+    assert upload_file.call_count == 1
+    assert create_accession.call_count == 1
+
+
+@pytest.mark.usefixtures("_isolated_filesystem", "_mock_user", "_mock_cohort")
+def test_accession_upload_resumes_multipart_upload(cli_run, mocker, accession_file):
+    ledger = UploadLedger.load("prod")
+    ledger.update(
+        1,
+        file_digest(accession_file),
+        {
+            "status": "uploading",
+            "file_name": accession_file.name,
+            "upload": {
+                "multipart": {
+                    "upload_id": "upload-id",
+                    "upload_signature": "signature",
+                    "parts": [
+                        {"part_number": 1, "size": 10, "upload_url": "https://s3/1"},
+                        {"part_number": 2, "size": 10, "upload_url": "https://s3/2"},
+                        {"part_number": 3, "size": 10, "upload_url": "https://s3/3"},
+                    ],
+                },
+                "parts": [{"part_number": 1, "size": 10, "etag": "etag-1"}],
+            },
+        },
+    )
+
+    initialize_upload = mocker.patch("s3_file_field_client.S3FileFieldClient._initialize_upload")
+    upload_part = mocker.patch(
+        "s3_file_field_client.S3FileFieldClient._upload_part",
+        side_effect=lambda part_bytes, part: {
+            "part_number": part["part_number"],
+            "size": len(part_bytes),
+            "etag": f'etag-{part["part_number"]}',
+        },
+    )
+    complete_upload = mocker.patch("s3_file_field_client.S3FileFieldClient._complete_upload")
+    mocker.patch("s3_file_field_client.S3FileFieldClient._finalize", return_value="field-value")
+    mocker.patch("isic_cli.cli.accession.create_accession", return_value={"id": 42})
+
+    result = cli_run(["accession", "upload", "1", str(accession_file)])
+    assert result.exit_code == 0, result.exception
+
+    initialize_upload.assert_not_called()
+    assert [c.args[1]["part_number"] for c in upload_part.call_args_list] == [2, 3]
+    assert [p["etag"] for p in complete_upload.call_args.args[1]] == ["etag-1", "etag-2", "etag-3"]
+    assert UploadLedger.load("prod").get(1, file_digest(accession_file))["status"] == "created"
+
+
+def test_upload_ledger_concurrent_writers_keep_each_others_entries():
+    first, second = UploadLedger.load("prod"), UploadLedger.load("prod")
+
+    first.update(1, "a", {"status": "created"})
+    second.update(1, "b", {"status": "created"})
+    first.remove(1, "c")
+
+    ledger = UploadLedger.load("prod")
+    assert ledger.get(1, "a") == {"status": "created"}
+    assert ledger.get(1, "b") == {"status": "created"}
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import subprocess
+import sys
+
 from packaging.version import Version
 import pytest
 
@@ -26,8 +29,14 @@ def test_base_command(cli_run):
 def test_new_version(
     cli_run, mocker, current_version, latest_version, expected_exit_code, output_pattern
 ):
+    from isic_cli.utils.version import refresh_newest_version_cache
+
     mocker.patch("isic_cli.utils.version.get_version", return_value=current_version)
     mocker.patch("isic_cli.utils.version.newest_version_available", return_value=latest_version)
+    mocker.patch("isic_cli.utils.version._is_interactive", return_value=True)
+    # the check only consults the cache, which is normally populated in the background by a
+    # previous invocation.
+    refresh_newest_version_cache()
 
     # The command is arbitrary, it just normally exits 0 with no mocking necessary
     result = cli_run(["user", "print-token"], catch_exceptions=False)
@@ -45,7 +54,8 @@ def test_new_version(
 )
 def test_sentry_error_capture(mocker, send_bug_report, capture_exception_sent):
     # Note: _sentry_setup is always mocked
-    from isic_cli import cli
+    import sentry_sdk
+
     from isic_cli.cli import main
 
     def _exception():
@@ -55,6 +65,65 @@ def test_sentry_error_capture(mocker, send_bug_report, capture_exception_sent):
     mocker.patch("isic_cli.cli.click.prompt", return_value=send_bug_report)
     mocker.patch("isic_cli.cli.is_dev_install", return_value=False)
 
-    spy = mocker.spy(cli, "capture_exception")
+    spy = mocker.spy(sentry_sdk, "capture_exception")
     main()
     assert spy.call_count == capture_exception_sent
+
+
+def _imported_modules(args: list[str]) -> set[str]:
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "isic_cli.cli", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return {
+        line.split("|")[-1].strip()
+        for line in r.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+@pytest.mark.parametrize(
+    "args",
+    [["--help"], ["collection", "--help"], ["metadata", "validate", "--help"]],
+)
+def test_startup_avoids_expensive_imports(args):
+    # these dependencies add hundreds of milliseconds to startup, and should only be imported
+    # by the commands which need them.
+    expensive_packages = {
+        "authlib",
+        "isic_metadata",
+        "pydantic",
+        "rich",
+        "s3_file_field_client",
+        "sentry_sdk",
+    }
+
+    imported_packages = {module.split(".")[0] for module in _imported_modules(args)}
+
+    assert not imported_packages & expensive_packages, imported_packages & expensive_packages
+
+
+def test_startup_imports_only_invoked_subcommand():
+    # importtime doesn't report modules loaded with importlib.import_module, so inspect
+    # sys.modules after the command runs instead.
+    code = (
+        "import sys\n"
+        "from isic_cli.cli import cli\n"
+        "try:\n"
+        "    cli(['collection', '--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(' '.join(m for m in sys.modules if m.startswith('isic_cli.cli.')), file=sys.stderr)"
+    )
+    r = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    imported = set(r.stderr.split())
+
+    assert "isic_cli.cli.collection" in imported
+    assert not imported & {
+        "isic_cli.cli.accession",
+        "isic_cli.cli.image",
+        "isic_cli.cli.metadata",
+        "isic_cli.cli.user",
+    }
@@ -7,7 +7,7 @@ from click.testing import CliRunner
 import pytest
 from requests.models import HTTPError
 
-from isic_cli.cli.types import CollectionId
+from isic_cli.cli.types import CollectionId, CommaSeparatedCollectionIds
 
 
 @pytest.mark.parametrize(
@@ -74,6 +74,68 @@ def test_collection_id_type_access(mocker):
     assert "does not exist" in result.output, result.output
 
 
+def test_comma_separated_collection_ids_lookups_cached(mocker):
+    @click.command()
+    @click.option("--collections", type=CommaSeparatedCollectionIds())
+    def cmd(collections):
+        pass
+
+    get_collection = mocker.patch(
+        "isic_cli.cli.types.get_collection",
+        side_effect=lambda _, collection_id: {"id": int(collection_id), "locked": False},
+    )
+
+    # magicmock is used to mock out ctx.obj
+    obj = mocker.MagicMock()
+    result = CliRunner().invoke(cmd, ["--collections", "1,2,3,2"], obj=obj)
+    assert result.exit_code == 0, result.output
+    assert sorted(c.args[1] for c in get_collection.call_args_list) == ["1", "2", "3"]
+
+    # subsequent invocations are served from the cache
+    result = CliRunner().invoke(cmd, ["--collections", "3,1"], obj=obj)
+    assert result.exit_code == 0, result.output
+    assert get_collection.call_count == 3
+
+
+def test_collection_id_type_locking_not_cached(mocker):
+    @click.command()
+    @click.argument("foo", type=CollectionId(locked_okay=False))
+    def cmd(foo):
+        pass
+
+    get_collection = mocker.patch(
+        "isic_cli.cli.types.get_collection",
+        return_value={"id": 1, "name": "foo", "locked": False},
+    )
+
+    # magicmock is used to mock out ctx.obj
+    obj = mocker.MagicMock()
+    result = CliRunner().invoke(cmd, ["1"], obj=obj)
+    assert result.exit_code == 0, result.output
+
+    # the collection was locked since
+    get_collection.return_value = {"id": 1, "name": "foo", "locked": True}
+    result = CliRunner().invoke(cmd, ["1"], obj=obj)
+    assert result.exit_code == 1, result.output
+    assert get_collection.call_count == 2
+
+
+def test_comma_separated_collection_ids_empty(mocker):
+    @click.command()
+    @click.option("--collections", type=CommaSeparatedCollectionIds(), default="")
+    def cmd(collections):
+        pass
+
+    ttl_cache = mocker.patch("isic_cli.cli.types.TTLCache")
+    get_collection = mocker.patch("isic_cli.cli.types.get_collection")
+
+    # magicmock is used to mock out ctx.obj
+    result = CliRunner().invoke(cmd, ["--collections", ""], obj=mocker.MagicMock())
+    assert result.exit_code == 0, result.output
+    ttl_cache.assert_not_called()
+    get_collection.assert_not_called()
+
+
 def test_collection_list(cli_run, mocker):
     mocker.patch(
         "isic_cli.cli.collection.get_collections",
@@ -1,13 +1,32 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
 import logging
 import os
 from pathlib import Path
+import subprocess
+import sys
+import threading
+import time
 
 import pytest
 from requests import HTTPError
 
+from isic_cli.cli import utils
 from isic_cli.cli.image import cleanup_partially_downloaded_files
+from isic_cli.io.http import (
+    InvalidSearchError,
+    SignedUrlRefresher,
+    download_image,
+    get_images,
+)
+from isic_cli.io.processes import ProcessDownloader
+from isic_cli.io.sinks import PARTIAL_DOWNLOADS, index_output_directory
+from isic_cli.resilience import CircuitOpenError
+from isic_cli.session import get_session
+from isic_cli.stats import RequestStats
 
 
 @pytest.fixture()
@@ -21,12 +40,13 @@ def _mock_images(mocker, _isolated_filesystem, outdir):
         with (Path(outdir) / "ISIC_0000000.jpg").open("wb") as f:
             f.write(b"12345")
 
-    mocker.patch("isic_cli.cli.image.get_num_images", return_value=1)
-    mocker.patch("isic_cli.cli.image.get_size_images", return_value=2e6)
+    mocker.patch("isic_cli.cli.utils.get_size_images", return_value=2e6)
     mocker.patch(
-        "isic_cli.cli.image.get_images",
-        return_value=iter(
-            [
+        "isic_cli.cli.utils.get_images_page",
+        return_value={
+            "count": 1,
+            "next": None,
+            "results": [
                 {
                     "isic_id": "ISIC_0000000",
                     "copyright_license": "CC-0",
@@ -36,8 +56,8 @@ def _mock_images(mocker, _isolated_filesystem, outdir):
                         "clinical": {"sex": "male", "diagnosis": "melanoma"},
                     },
                 }
-            ]
-        ),
+            ],
+        },
     )
     mocker.patch("isic_cli.cli.image.download_image", side_effect=_download_image_side_effect)
 
@@ -80,6 +100,7 @@ def test_image_download_cleanup(cli_run, outdir):
     partial_file = Path(outdir) / f".isic-partial.{os.getpid()}.ISIC_0000000.jpg"
     partial_file.parent.mkdir(parents=True)
     partial_file.touch()
+    PARTIAL_DOWNLOADS.add(partial_file)
 
     result = cli_run(["image", "download", outdir])
     assert result.exit_code == 0
@@ -91,11 +112,34 @@ def test_image_download_cleanup(cli_run, outdir):
     assert not partial_file.exists()
 
 
+def test_index_output_directory_removes_stale_partial_files(tmp_path):
+    dead = subprocess.Popen([sys.executable, "-c", ""])
+    dead.wait()
+
+    stale = tmp_path / f".isic-partial.{dead.pid}.abc"
+    recent = tmp_path / f".isic-partial.{dead.pid}.def"
+    ours = tmp_path / f".isic-partial.{os.getpid()}.ghi"
+    for path in [stale, recent, ours]:
+        path.touch()
+    an_hour_ago = time.time() - 3600
+    os.utime(stale, (an_hour_ago, an_hour_ago))
+    os.utime(ours, (an_hour_ago, an_hour_ago))
+
+    (tmp_path / "ISIC_0000000.jpg").write_bytes(b"12345")
+    (tmp_path / "subdir").mkdir()
+
+    assert index_output_directory(tmp_path) == {"ISIC_0000000.jpg": 5}
+    assert not stale.exists()
+    assert recent.exists()
+    assert ours.exists()
+
+
 @pytest.mark.usefixtures("_isolated_filesystem", "_mock_images")
 def test_image_download_cleanup_permission_error(cli_run, outdir, mocker, caplog):
     partial_file = Path(outdir) / f".isic-partial.{os.getpid()}.ISIC_0000000.jpg"
     partial_file.parent.mkdir(parents=True)
     partial_file.touch()
+    PARTIAL_DOWNLOADS.add(partial_file)
 
     original_unlink = Path.unlink
 
@@ -179,3 +223,253 @@ def test_image_download_disk_space_check_unavailable(cli_run, outdir, mocker):
     assert result.exit_code == 0
     assert "Warning: Insufficient disk space" not in result.output
     assert "Successfully downloaded 1 images" in result.output
+
+
+@pytest.mark.usefixtures("_isolated_filesystem", "_mock_images")
+def test_image_download_invalid_search(cli_run, outdir, mocker):
+    mocker.patch(
+        "isic_cli.cli.utils.get_images_page",
+        side_effect=InvalidSearchError('Invalid search query string "foo:"'),
+    )
+
+    result = cli_run(["image", "download", outdir, "--search", "foo:"])
+    assert result.exit_code == 2
+    assert "Invalid search query string" in result.output
+
+
+@pytest.mark.usefixtures("_isolated_filesystem", "_mock_images")
+def test_image_download_plan_requests_concurrent(cli_run, outdir, mocker):
+    # the first page and size requests must be in flight at the same time, this would
+    # deadlock (and time out) if they were made serially.
+    barrier = threading.Barrier(2, timeout=5)
+    first_page = utils.get_images_page.return_value
+
+    def _wait(return_value):
+        def f(*args, **kwargs):
+            barrier.wait()
+            return return_value
+
+        return f
+
+    mocker.patch("isic_cli.cli.utils.get_images_page", side_effect=_wait(first_page))
+    mocker.patch("isic_cli.cli.utils.get_size_images", side_effect=_wait(2e6))
+
+    result = cli_run(["image", "download", outdir])
+    assert result.exit_code == 0, result.exception
+    assert "1 files, 2.0 MB" in result.output
+
+
+def test_download_image_refreshes_expired_urls(fake_isic, mocker, tmp_path):
+    server = fake_isic(num_images=5, url_ttl=0.2)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        images = list(get_images(session))
+        time.sleep(0.3)
+        server.config.url_ttl = 60
+
+        func = functools.partial(
+            download_image,
+            to=tmp_path,
+            progress=mocker.MagicMock(),
+            task=None,
+            refresh_url=SignedUrlRefresher(session).refresh,
+        )
+        with ThreadPoolExecutor(5) as thread_pool:
+            list(thread_pool.map(func, images))
+
+    assert len(list(tmp_path.glob("*.jpg"))) == 5
+    # the expired urls of all workers are refreshed with a single search
+    assert server.requests["/api/v2/images/search/"] == 2
+
+
+def test_process_downloader_workers_clean_up_when_interrupted(fake_isic, tmp_path):
+    # each file takes a few seconds to transfer
+    server = fake_isic(num_images=2, image_size=256 * 1024, bandwidth=64 * 1024)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        images = list(get_images(session))
+
+    downloader = ProcessDownloader(1, tmp_path, existing_files={}, refresh_url=lambda _: None)
+    downloader.submit(images)
+
+    deadline = time.monotonic() + 10
+    while not list(tmp_path.glob(".isic-partial.*")) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert list(tmp_path.glob(".isic-partial.*"))
+
+    downloader.__exit__(KeyboardInterrupt, KeyboardInterrupt(), None)
+
+    # the partial files are tracked by the worker, not the parent
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_image_download_processes_reject_stats(cli_run, mocker):
+    stats = RequestStats()
+    mocker.patch("isic_cli.cli.STATS", stats)
+    mocker.patch("isic_cli.cli.image.STATS", stats)
+
+    result = cli_run(["--stats", "image", "download", "--processes", "2", "images"])
+
+    assert result.exit_code == 2
+    assert "can't be combined with --processes" in result.output
+
+
+def test_process_downloader_refreshes_expired_urls_in_parent(fake_isic, tmp_path):
+    # only the parent is logged in, workers couldn't search for fresh urls themselves
+    server = fake_isic(num_images=5, url_ttl=0.2, access_token="secret")
+
+    with get_session(f"{server.url}/api/v2/", {"Authorization": "Bearer secret"}) as session:
+        images = list(get_images(session))
+        time.sleep(0.3)
+        server.config.url_ttl = 60
+
+        with ProcessDownloader(
+            2,
+            tmp_path,
+            existing_files={},
+            refresh_url=SignedUrlRefresher(session).refresh,
+            threads_per_process=5,
+        ) as downloader:
+            assert downloader.submit(images).result() == 5
+
+    assert len(list(tmp_path.glob("*.jpg"))) == 5
+    assert server.requests["/api/v2/images/search/"] >= 2
+
+
+@pytest.fixture()
+def fake_archive(fake_isic, mocker):
+    server = fake_isic(num_images=5, page_size=2)
+    mocker.patch.dict("isic_cli.cli.DOMAINS", {"prod": server.url})
+    return server
+
+
+def test_image_list(cli_run, fake_archive):
+    result = cli_run(["--guest", "image", "list", "--limit", "3"])
+
+    assert result.exit_code == 0, result.exception
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert lines == fake_archive.images[:3]
+
+
+def test_image_list_fields(cli_run, fake_archive):
+    result = cli_run(
+        ["--guest", "image", "list", "-c", "1", "--fields", "isic_id,files.full.size,missing.key"]
+    )
+
+    assert result.exit_code == 0, result.exception
+    lines = [json.loads(line) for line in result.stdout.splitlines()]
+    assert lines == [
+        {"isic_id": "ISIC_0000000", "files": {"full": {"size": 65536}}},
+        {"isic_id": "ISIC_0000003", "files": {"full": {"size": 65536}}},
+    ]
+
+
+def test_image_list_invalid_fields(cli_run, fake_archive):
+    result = cli_run(["--guest", "image", "list", "--fields", "isic_id,files..url"])
+
+    assert result.exit_code == 2
+    assert "Improperly formatted" in result.output
+
+
+def test_image_list_page_size(cli_run, fake_archive):
+    result = cli_run(["--guest", "image", "list", "--page-size", "1"])
+
+    assert result.exit_code == 0, result.exception
+    assert len(result.stdout.splitlines()) == 5
+    assert fake_archive.requests["/api/v2/images/search/"] == 5
+
+
+def test_image_list_invalid_page_size(cli_run, fake_archive):
+    result = cli_run(["--guest", "image", "list", "--page-size", "big"])
+
+    assert result.exit_code == 2
+    assert "is not an integer or" in result.output
+
+
+def test_download_image_skips_indexed_files(fake_isic, tmp_path):
+    server = fake_isic(num_images=2, image_size=10)
+    complete, truncated = server.images
+    existing_files = {f"{complete['isic_id']}.jpg": 10, f"{truncated['isic_id']}.jpg": 5}
+
+    download_image(complete, tmp_path, existing_files=existing_files)
+    download_image(truncated, tmp_path, existing_files=existing_files)
+
+    assert server.requests["/files/"] == 1
+    assert (tmp_path / f"{truncated['isic_id']}.jpg").stat().st_size == 10
+
+
+def test_image_download_to_s3(cli_run, fake_archive, fake_s3):
+    pytest.importorskip("boto3")
+
+    for _ in range(2):
+        result = cli_run(["--guest", "image", "download", "s3://bucket/images"])
+        assert result.exit_code == 0, result.exception
+
+    assert sorted(fake_s3.objects) == [
+        "bucket/images/ISIC_0000000.jpg",
+        "bucket/images/ISIC_0000001.jpg",
+        "bucket/images/ISIC_0000002.jpg",
+        "bucket/images/ISIC_0000003.jpg",
+        "bucket/images/ISIC_0000004.jpg",
+        "bucket/images/attribution.txt",
+        "bucket/images/licenses/CC-0.txt",
+        "bucket/images/licenses/CC-BY-NC.txt",
+        "bucket/images/licenses/CC-BY.txt",
+        "bucket/images/metadata.csv",
+    ]
+    assert fake_s3.objects["bucket/images/metadata.csv"].count(b"\n") == 6
+    # the second download skipped the images already uploaded
+    assert fake_archive.requests["/files/"] == 5
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_image_download_skips_failed_images(cli_run, fake_archive, outdir, mocker):
+    def fail_one(image, *args, **kwargs):
+        if image["isic_id"] == "ISIC_0000001":
+            raise HTTPError("404 Client Error")
+        return download_image(image, *args, **kwargs)
+
+    mocker.patch("isic_cli.cli.image.download_image", side_effect=fail_one)
+
+    result = cli_run(["--guest", "image", "download", outdir])
+
+    assert result.exit_code == 0, result.exception
+    assert len(list(Path(outdir).glob("*.jpg"))) == 4
+    assert (Path(outdir) / "metadata.csv").read_text().count("\n") == 6
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+@pytest.mark.parametrize("processes", ["1", "2"])
+def test_image_download_skips_broken_images(cli_run, fake_archive, outdir, processes):
+    broken = fake_archive.images[1]
+    broken["files"]["full"]["url"] = f"{fake_archive.url}/missing/{broken['isic_id']}.jpg"
+
+    result = cli_run(["--guest", "image", "download", "--processes", processes, outdir])
+
+    assert result.exit_code == 0, result.exception
+    assert len(list(Path(outdir).glob("*.jpg"))) == 4
+    assert (Path(outdir) / "metadata.csv").read_text().count("\n") == 6
+    assert (Path(outdir) / "attribution.txt").exists()
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_image_download_stops_on_outage(cli_run, fake_archive, outdir, mocker):
+    mocker.patch(
+        "isic_cli.cli.image.download_image", side_effect=CircuitOpenError("archive is down")
+    )
+
+    result = cli_run(["--guest", "image", "download", outdir])
+
+    assert isinstance(result.exception, CircuitOpenError)
+    assert not (Path(outdir) / "metadata.csv").exists()
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_image_download_processes(cli_run, fake_archive, outdir):
+    result = cli_run(["--guest", "image", "download", "--processes", "2", outdir])
+
+    assert result.exit_code == 0, result.exception
+    assert len(list(Path(outdir).glob("*.jpg"))) == 5
+    assert (Path(outdir) / "metadata.csv").read_text().count("\n") == 6
+    assert fake_archive.requests["/files/"] == 5
@@ -10,11 +10,12 @@ from pytest_lazy_fixtures import lf
 
 @pytest.fixture()
 def _mock_image_metadata(mocker):
-    mocker.patch("isic_cli.cli.metadata.get_num_images", return_value=2)
     mocker.patch(
-        "isic_cli.cli.metadata.get_images",
-        return_value=iter(
-            [
+        "isic_cli.cli.utils.get_images_page",
+        return_value={
+            "count": 2,
+            "next": None,
+            "results": [
                 {
                     "isic_id": "ISIC_0000000",
                     "attribution": "\U00001f600 Foo",
@@ -33,8 +34,8 @@ def _mock_image_metadata(mocker):
                         "clinical": {"sex": "female", "diagnosis": "nevus"},
                     },
                 },
-            ]
-        ),
+            ],
+        },
     )
 
 
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import asyncio
+import io
+
+import pytest
+
+from isic_cli.client import AsyncIsicClient, IsicClient
+
+
+@pytest.fixture()
+def server(fake_isic):
+    return fake_isic(num_images=25, image_size=1024, page_size=10)
+
+
+@pytest.fixture()
+def client(server):
+    with IsicClient(server.url, max_workers=3) as client:
+        yield client
+
+
+def test_client_search_streams_pages(client, server):
+    images = client.search()
+
+    assert next(images)["isic_id"] == "ISIC_0000000"
+    assert server.requests["/api/v2/images/search/"] == 1
+    assert len(list(images)) == 24
+    assert client.count(collections=[1]) == 9
+
+
+def test_client_fetch_images(client, server):
+    fetched = list(client.fetch_images(client.search()))
+
+    assert [image["isic_id"] for image, _ in fetched] == [i["isic_id"] for i in server.images]
+    assert all(len(content) == 1024 for _, content in fetched)
+
+
+def test_client_download_images(client, tmp_path):
+    paths = list(client.download_images(client.search(), tmp_path / "images"))
+
+    assert len(paths) == 25
+    assert all(path.stat().st_size == 1024 for path in paths)
+
+
+def test_client_export_metadata(client):
+    f = io.StringIO()
+
+    assert client.export_metadata(f, collections=[2]) == 8
+    assert f.getvalue().startswith("isic_id,attribution,copyright_license,")
+
+
+def test_client_collections(client):
+    assert len(list(client.collections())) == 3
+    assert client.add_to_collection(1, ["ISIC_0000000"]) == {"succeeded": ["ISIC_0000000"]}
+
+
+def test_async_client(server, tmp_path):
+    async def run():
+        async with AsyncIsicClient(server.url, max_workers=3) as client:
+            count = await client.count()
+            fetched = [image async for image, _ in client.fetch_images(client.search())]
+            paths = [path async for path in client.download_images(fetched[:5], tmp_path)]
+            return count, fetched, paths
+
+    count, fetched, paths = asyncio.run(run())
+
+    assert count == 25
+    assert len(fetched) == 25
+    assert len(paths) == 5
+
+
+def test_async_client_search_page_size(server):
+    async def run():
+        async with AsyncIsicClient(server.url) as client:
+            return [image async for image in client.search(page_size=5)]
+
+    assert len(asyncio.run(run())) == 25
+    assert server.requests["/api/v2/images/search/"] == 5
+
+
+def test_client_stream_images_sharded(client, server):
+    shards = [list(client.stream_images(prefetch=2, rank=rank, world_size=3)) for rank in range(3)]
+
+    isic_ids = [isic_id for shard in shards for isic_id, _, _ in shard]
+    assert sorted(isic_ids) == [image["isic_id"] for image in server.images]
+    assert all(shard for shard in shards)
+
+    isic_id, content, record = shards[0][0]
+    assert len(content) == 1024
+    assert record["isic_id"] == isic_id
+    assert "age_approx" in record
+
+
+def test_client_stream_images_sharded_across_collections(fake_isic):
+    server = fake_isic(num_images=30, image_size=16, page_size=5, collections_per_image=2)
+
+    with IsicClient(server.url) as client:
+        shards = [
+            [isic_id for isic_id, _, _ in client.stream_images("", [1, 2, 3], rank=r, world_size=3)]
+            for r in range(3)
+        ]
+
+    # images in several of the collections still go to exactly one rank
+    isic_ids = [isic_id for shard in shards for isic_id in shard]
+    assert sorted(isic_ids) == [image["isic_id"] for image in server.images]
+
+
+def test_client_stream_images_invalid_rank(client):
+    with pytest.raises(ValueError, match="rank"):
+        client.stream_images(rank=2, world_size=2)
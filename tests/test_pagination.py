@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+from requests.exceptions import ReadTimeout
+
+from isic_cli.io import http
+from isic_cli.io.http import (
+    AdaptivePageSize,
+    get_images,
+    get_images_page,
+    get_images_partitioned,
+)
+from isic_cli.session import get_session
+
+
+def test_adaptive_page_size_grows_while_fast(fake_isic):
+    server = fake_isic(num_images=1000, image_size=1)
+    page_size = AdaptivePageSize(10, maximum=400, target_seconds=60)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        num_images = sum(1 for _ in get_images(session, page_size=page_size))
+
+    assert num_images == 1000
+    # 10 + 10 + 20 + 40 + 80 + 160 + 320 + 360, the first page only sets the initial size
+    assert server.requests["/api/v2/images/search/"] == 8
+    assert page_size.current == 400
+
+
+def test_adaptive_page_size_shrinks_when_slow():
+    page_size = AdaptivePageSize(100, minimum=30, target_seconds=1)
+
+    page_size.record(1.5)
+    assert page_size.current == 50
+    page_size.record(1.5)
+    assert page_size.current == 30
+    page_size.record(0.75)
+    assert page_size.current == 30
+
+
+def test_adaptive_page_size_shrinks_on_timeout(mocker):
+    page = {"next": None, "previous": None, "results": []}
+    get_page = mocker.patch.object(http, "_get_page", side_effect=[ReadTimeout(), page])
+    page_size = AdaptivePageSize(100, minimum=10)
+
+    assert page_size.get_page(mocker.MagicMock(), "http://example.com/?cursor=a&limit=100") == page
+    assert get_page.call_args.args[1] == "http://example.com/?cursor=a&limit=50"
+
+    page_size.current = 10
+    get_page.side_effect = ReadTimeout()
+    with pytest.raises(ReadTimeout):
+        page_size.get_page(mocker.MagicMock(), "http://example.com/")
+
+
+@pytest.fixture()
+def slow_large_pages_server():
+    # pages of more than 50 results take longer than clients wait
+    limits = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            limit = int(parse_qs(urlparse(self.path).query)["limit"][0])
+            limits.append(limit)
+            if limit > 50:
+                time.sleep(0.5)
+
+            body = b'{"next": null, "previous": null, "results": []}'
+            try:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                # the client already gave up
+                pass
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v2/", limits
+    server.shutdown()
+    server.server_close()
+
+
+def test_adaptive_page_size_shrinks_without_retrying_timeouts(slow_large_pages_server):
+    url, limits = slow_large_pages_server
+    page_size = AdaptivePageSize(100, minimum=10)
+
+    with get_session(url) as session:
+        session.request = functools.partial(session.request, timeout=0.1)
+        page_size.get_page(session, f"{url}images/search/?cursor=a")
+
+    # the timed out page wasn't retried at the same size
+    assert limits == [100, 50]
+
+
+def test_get_images_partitioned_dedupes_across_collections(fake_isic):
+    server = fake_isic(num_images=300, image_size=1, num_collections=3, collections_per_image=2)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        first_page = get_images_page(session, collections="1,2,3")
+        isic_ids = [
+            image["isic_id"]
+            for image in get_images_partitioned(session, collections="1,2,3", first_page=first_page)
+        ]
+
+    # merged in the same order on every run, rather than the order pages arrive in
+    assert isic_ids == [image["isic_id"] for image in server.images]
+    # the first page plus 4 pages of each of the 3 collections
+    assert server.requests["/api/v2/images/search/"] == 13
+
+
+def test_get_images_partitioned_more_collections_than_workers(fake_isic):
+    server = fake_isic(num_images=100, image_size=1, page_size=10, num_collections=5)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        first_page = get_images_page(session, collections="1,2,3,4,5")
+        images = get_images_partitioned(
+            session, collections="1,2,3,4,5", first_page=first_page, max_workers=2
+        )
+        isic_ids = [image["isic_id"] for image in images]
+
+    assert isic_ids == [image["isic_id"] for image in server.images]
+
+
+def test_get_images_partitioned_single_collection_is_serial(fake_isic):
+    server = fake_isic(num_images=200, image_size=1)
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        first_page = get_images_page(session, collections="1")
+        images = list(get_images_partitioned(session, collections="1", first_page=first_page))
+
+    assert images == [
+        image for image in server.images if server.image_collections[image["isic_id"]] == {1}
+    ]
+
+
+def test_get_images_partitioned_raises_partition_errors(fake_isic, mocker):
+    server = fake_isic(num_images=300, image_size=1)
+    mocker.patch("isic_cli.io.http._get_page", side_effect=ReadTimeout())
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        first_page = get_images_page(session, collections="1,2")
+        with pytest.raises(ReadTimeout):
+            list(get_images_partitioned(session, collections="1,2", first_page=first_page))
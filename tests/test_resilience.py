@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import pytest
+
+from isic_cli.cli.types import ByteSize
+from isic_cli.io.http import download_image
+from isic_cli.resilience import (
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitOpenError,
+    Hedger,
+    RateLimiter,
+    RetryBudget,
+    TokenBucket,
+)
+from isic_cli.session import IsicCliSession, IsicRetry
+
+
+@pytest.fixture()
+def unavailable_server():
+    requests = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            requests.append(self.path)
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v2/", requests
+    server.shutdown()
+
+
+@pytest.fixture()
+def rate_limited_server():
+    # asks clients to back off on the first request to /limited/
+    served_at = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path == "/api/v2/limited/" and self.path not in served_at:
+                served_at[self.path] = time.monotonic()
+                self.send_response(429)
+                self.send_header("Retry-After", "1")
+            else:
+                served_at.setdefault(self.path, time.monotonic())
+                self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v2/", served_at
+    server.shutdown()
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, reserve=1)
+
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_withdraw()
+
+
+def test_circuit_breaker_opens_probes_and_closes():
+    breaker = CircuitBreaker("example.com", window=4, min_attempts=4, cooldown=0.05)
+
+    for success in [True, False, False, True]:
+        breaker.record(success=success)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    start = time.monotonic()
+    breaker.wait_until_available()
+    assert time.monotonic() - start >= 0.04
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+    # other workers wait for the probe to finish
+    waiter = threading.Thread(target=breaker.wait_until_available)
+    waiter.start()
+    waiter.join(0.05)
+    assert waiter.is_alive()
+
+    breaker.record(success=True)
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def _probing_breaker(**kwargs) -> CircuitBreaker:
+    breaker = CircuitBreaker("example.com", min_attempts=1, cooldown=0.01, **kwargs)
+    breaker.record(success=False)
+    breaker.wait_until_available()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    return breaker
+
+
+def test_circuit_breaker_abandoned_probe_releases_waiters():
+    breaker = _probing_breaker()
+
+    waiter = threading.Thread(target=breaker.wait_until_available)
+    waiter.start()
+    waiter.join(0.05)
+    assert waiter.is_alive()
+
+    breaker.abandon_probe()
+    # the waiter becomes the next probe once the cooldown passes
+    waiter.join(1)
+    assert not waiter.is_alive()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_circuit_breaker_probe_taken_over_after_timeout():
+    breaker = _probing_breaker(probe_timeout=0.05)
+
+    start = time.monotonic()
+    waiter = threading.Thread(target=breaker.wait_until_available)
+    waiter.start()
+    waiter.join(1)
+
+    assert not waiter.is_alive()
+    assert time.monotonic() - start >= 0.04
+
+
+def test_session_abandons_probe_on_unexpected_error(mocker, unavailable_server):
+    url, _ = unavailable_server
+    breaker = CircuitBreaker("127.0.0.1", min_attempts=1, cooldown=0.01)
+    breaker.record(success=False)
+    mocker.patch("isic_cli.session.CIRCUIT_BREAKERS", {"127.0.0.1": breaker})
+    time.sleep(0.02)
+
+    def interrupt(*args, **kwargs):
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        raise KeyboardInterrupt
+
+    retry = IsicRetry(total=0, raise_on_status=False)
+    with IsicCliSession(url, retry_strategy=retry) as session, pytest.raises(KeyboardInterrupt):
+        session.get("images/", hooks={"response": interrupt})
+
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_circuit_breaker_gives_up():
+    breaker = CircuitBreaker(
+        "example.com", min_attempts=1, cooldown=0.01, max_cooldown=0.1, max_probes=2
+    )
+    breaker.record(success=False)
+
+    for _ in range(2):
+        breaker.wait_until_available()
+        breaker.record(success=False)
+
+    with pytest.raises(CircuitOpenError, match="example.com is unavailable"):
+        breaker.wait_until_available()
+
+    # the host is still probed every max_cooldown, and recovers on a successful probe
+    time.sleep(0.1)
+    breaker.wait_until_available()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record(success=True)
+    breaker.wait_until_available()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_session_retries_limited_by_budget(mocker, unavailable_server):
+    url, requests = unavailable_server
+    mocker.patch("isic_cli.session.RETRY_BUDGET", RetryBudget(ratio=0, reserve=1))
+
+    with IsicCliSession(url) as session:
+        r = session.get("images/")
+
+    assert r.status_code == 503
+    assert len(requests) == 2
+
+
+def test_session_fails_fast_when_host_is_down(mocker, unavailable_server):
+    url, requests = unavailable_server
+    breakers = CircuitBreakers(window=2, min_attempts=2, cooldown=0.01, max_probes=2)
+    mocker.patch("isic_cli.session.CIRCUIT_BREAKERS", breakers)
+    retry = IsicRetry(total=1, status_forcelist=[503], backoff_factor=0, raise_on_status=False)
+
+    with IsicCliSession(url, retry_strategy=retry) as session:
+        session.get("images/")
+        # a request is a single outcome, however many times it was retried
+        assert len(requests) == 2
+        assert breakers["127.0.0.1"].state == CircuitBreaker.CLOSED
+
+        # opens the circuit, then two probes fail
+        for _ in range(3):
+            session.get("images/")
+
+        num_requests = len(requests)
+        with pytest.raises(CircuitOpenError):
+            session.get("images/")
+
+    assert len(requests) == num_requests
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=100, capacity=1)
+
+    start = time.monotonic()
+    for _ in range(11):
+        bucket.consume()
+
+    assert time.monotonic() - start >= 0.09
+
+
+def test_retry_after_pauses_all_workers(mocker, rate_limited_server):
+    url, served_at = rate_limited_server
+    mocker.patch("isic_cli.session.RATE_LIMITER", RateLimiter())
+
+    with IsicCliSession(url) as session:
+        limited = threading.Thread(target=session.get, args=("limited/",))
+        limited.start()
+        time.sleep(0.2)
+        session.get("other/")
+        limited.join()
+
+    assert served_at["/api/v2/other/"] - served_at["/api/v2/limited/"] >= 0.9
+
+
+@pytest.mark.parametrize(
+    ("value", "num_bytes"),
+    [("100", 100), ("500KB", 500_000), ("10 MB", 10_000_000), ("1.5GiB", 1_610_612_736)],
+)
+def test_byte_size(value, num_bytes):
+    assert ByteSize().convert(value, None, None) == num_bytes
+
+
+def test_max_bandwidth_option(cli_run, mocker):
+    configure = mocker.patch("isic_cli.cli.RATE_LIMITER.configure")
+
+    result = cli_run(["--max-bandwidth", "fast", "user", "print-token"])
+    assert result.exit_code == 2
+    assert "Invalid size" in result.output
+
+    cli_run(["--max-requests-per-second", "5", "--max-bandwidth", "1MB", "collection"])
+    configure.assert_called_once_with(max_requests_per_second=5, max_bandwidth=1_000_000)
+
+
+def test_hedger_delay():
+    hedger = Hedger(multiplier=4, min_delay=0.5, min_samples=3)
+    assert hedger.delay() is None
+
+    for seconds in [0.1, 0.2, 10]:
+        hedger.record(seconds)
+    assert hedger.delay() == pytest.approx(0.8)
+
+    hedger = Hedger(multiplier=4, min_delay=0.5, min_samples=1)
+    hedger.record(0.01)
+    assert hedger.delay() == 0.5
+
+
+def test_stalled_downloads_are_hedged(fake_isic, mocker, tmp_path):
+    server = fake_isic(num_images=50, image_size=1024, stall_rate=0.2, stall_seconds=3)
+    hedger = Hedger(min_delay=0.2, min_samples=5, ratio=1, multiplier=4)
+    for _ in range(5):
+        hedger.record(0.01)
+    mocker.patch("isic_cli.io.http.HEDGER", hedger)
+    func = functools.partial(download_image, to=tmp_path)
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(5) as thread_pool:
+        list(thread_pool.map(func, server.images))
+
+    # without hedging, the stalled downloads would take at least 3 seconds
+    assert time.monotonic() - start < 2.5
+    assert server.requests["/files/"] > 50
+    assert all(path.stat().st_size == 1024 for path in tmp_path.glob("*.jpg"))
+    assert len(list(tmp_path.glob("*.jpg"))) == 50
+
+
+def test_hedgeable_requests_reuse_threads(fake_isic, mocker, tmp_path):
+    server = fake_isic(num_images=20, image_size=1024)
+    hedger = Hedger(min_samples=1)
+    hedger.record(1)
+    mocker.patch("isic_cli.io.http.HEDGER", hedger)
+    mocker.patch("isic_cli.io.http._hedging_executor", return_value=ThreadPoolExecutor(4))
+    thread_start = mocker.spy(threading.Thread, "start")
+
+    for image in server.images:
+        download_image(image, tmp_path)
+
+    assert len(list(tmp_path.glob("*.jpg"))) == 20
+    # at most the threads of the executor, rather than one per request
+    assert thread_start.call_count <= 4
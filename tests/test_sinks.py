@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import pytest
+
+from isic_cli.io.sinks import LocalSink, S3Sink, get_sink
+
+pytest.importorskip("boto3")
+
+
+@pytest.mark.usefixtures("fake_s3")
+def test_get_sink(tmp_path):
+    assert isinstance(get_sink(tmp_path), LocalSink)
+    assert isinstance(get_sink("s3://bucket/prefix"), S3Sink)
+
+
+def test_s3_sink_streams_multipart_uploads(fake_s3):
+    sink = S3Sink("s3://bucket/images", part_size=4)
+
+    with sink.open("ISIC_0000000.jpg") as outfile:
+        outfile.write(b"0123456789")
+    with sink.open("metadata.csv", text=True) as outfile:
+        outfile.write("isic_id\nISIC_0000000\n")
+
+    assert fake_s3.objects == {
+        "bucket/images/ISIC_0000000.jpg": b"0123456789",
+        "bucket/images/metadata.csv": b"isic_id\nISIC_0000000\n",
+    }
+    assert fake_s3.uploads == {}
+    assert sink.index() == {"ISIC_0000000.jpg": 10, "metadata.csv": 21}
+    assert sink.exists("ISIC_0000000.jpg", 10)
+    assert not sink.exists("ISIC_0000000.jpg", 11)
+    assert sink.location("metadata.csv") == "s3://bucket/images/metadata.csv"
+
+
+def test_s3_sink_aborts_failed_uploads(fake_s3):
+    sink = S3Sink("s3://bucket", part_size=4)
+
+    def upload():
+        with sink.open("ISIC_0000000.jpg") as outfile:
+            outfile.write(b"0123456789")
+            raise ConnectionError
+
+    with pytest.raises(ConnectionError):
+        upload()
+
+    assert fake_s3.objects == {}
+    assert len(fake_s3.aborted) == 1
+    assert not sink.uploads_in_progress
+
+
+def test_local_sink_cleanup_removes_partial_files_in_subdirectories(tmp_path):
+    sink = LocalSink(tmp_path)
+
+    def interrupted_write():
+        with sink.open("licenses/CC-0.txt", text=True) as outfile:
+            outfile.write("partial")
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        interrupted_write()
+
+    assert len(list((tmp_path / "licenses").glob(".isic-partial.*"))) == 1
+    assert sink.cleanup()
+    assert list((tmp_path / "licenses").iterdir()) == []
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from pathlib import Path
+import threading
+
+import pytest
+
+from isic_cli.session import IsicCliSession, IsicRetry
+from isic_cli.stats import RequestStats, endpoint_class
+
+
+@pytest.fixture()
+def flaky_server():
+    # fails the first request to each path with a 503
+    seen = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):  # noqa: N802
+            if self.path not in seen:
+                seen.add(self.path)
+                self.send_response(503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+            body = b'{"ok": true}'
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/api/v2/"
+    server.shutdown()
+
+
+@pytest.mark.parametrize(
+    ("url", "endpoint"),
+    [
+        (
+            "https://api.isic-archive.com/api/v2/collections/12/",
+            "api.isic-archive.com/collections/{id}/",
+        ),
+        (
+            "https://api.isic-archive.com/api/v2/images/search/?query=",
+            "api.isic-archive.com/images/search/",
+        ),
+        (
+            "https://bucket.s3.amazonaws.com/images/ISIC_0000000.jpg?sig=1",
+            "bucket.s3.amazonaws.com",
+        ),
+    ],
+)
+def test_endpoint_class(url, endpoint):
+    assert endpoint_class(url) == endpoint
+
+
+def test_request_stats_retries(mocker, flaky_server):
+    stats = RequestStats()
+    stats.enable()
+    mocker.patch("isic_cli.session.STATS", stats)
+
+    retry = IsicRetry(total=2, status_forcelist=[503], backoff_factor=0, raise_on_status=False)
+    with IsicCliSession(flaky_server, retry_strategy=retry) as session:
+        r = session.get("collections/1/")
+        assert r.status_code == 200
+
+    endpoint_stats = stats.to_dict()["endpoints"][
+        f"{flaky_server.split('/')[2]}/collections/{{id}}/"
+    ]
+    assert endpoint_stats["requests"] == 1
+    assert endpoint_stats["attempts"] == 2
+    assert endpoint_stats["retry_reasons"] == {"status 503": 1}
+    assert endpoint_stats["bytes"] == len(b'{"ok": true}')
+    assert endpoint_stats["new_connections"] + endpoint_stats["reused_connections"] == 2
+    assert sum(endpoint_stats["attempt_latency_histogram"].values()) == 2
+
+
+def test_request_stats_disabled(mocker, flaky_server):
+    stats = RequestStats()
+    mocker.patch("isic_cli.session.STATS", stats)
+
+    with IsicCliSession(flaky_server) as session:
+        session.get("collections/1/", timeout=5)
+
+    assert stats.to_dict() == {"endpoints": {}}
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_stats_json(cli_run, mocker):
+    mocker.patch("isic_cli.cli.collection.get_collections", return_value=iter([]))
+
+    result = cli_run(["--stats", "--stats-json", "stats.json", "collection", "list"])
+
+    assert result.exit_code == 0, result.exception
+    assert "HTTP requests" in result.output
+    with Path("stats.json").open() as f:
+        assert "endpoints" in json.load(f)
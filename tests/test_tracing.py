@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import json
+from pathlib import Path
+import threading
+
+import pytest
+
+from isic_cli.tracing import Tracer
+
+
+def test_tracer_disabled():
+    tracer = Tracer()
+
+    with tracer.span("noop") as span:
+        span.args["ignored"] = True
+
+    assert tracer._events == []
+
+
+def test_tracer_records_spans_per_thread(tmp_path):
+    tracer = Tracer()
+    tracer.enable()
+
+    def work():
+        with tracer.span("child", "download", isic_id="ISIC_0000000"):
+            pass
+
+    with tracer.span("parent"):
+        thread = threading.Thread(target=work, name="worker")
+        thread.start()
+        thread.join()
+
+    tracer.write(tmp_path / "trace.json")
+    with (tmp_path / "trace.json").open() as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert spans["child"]["args"] == {"isic_id": "ISIC_0000000"}
+    assert spans["child"]["tid"] != spans["parent"]["tid"]
+    assert spans["parent"]["dur"] >= spans["child"]["dur"]
+    assert {"worker", "MainThread"} <= {
+        event["args"]["name"] for event in events if event["ph"] == "M"
+    }
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_trace_option(cli_run, mocker):
+    mocker.patch("isic_cli.cli.TRACER", Tracer())
+    mocker.patch("isic_cli.cli.collection.get_collections", return_value=iter([]))
+
+    result = cli_run(["--trace", "trace.json", "collection", "list"])
+
+    assert result.exit_code == 0, result.exception
+    with Path("trace.json").open() as f:
+        events = json.load(f)["traceEvents"]
+    assert [event["cat"] for event in events if event["ph"] == "X"] == ["command"]
@@ -1,9 +1,16 @@
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import time
+
 from authlib.integrations.base_client.errors import OAuthError
 from girder_cli_oauth_client import GirderCliOAuthClient
 import pytest
 
+from isic_cli.oauth import OAuthTokenAuth, get_oauth_client
+from isic_cli.session import get_session
+
 
 @pytest.mark.usefixtures("_isolated_filesystem", "_mock_user")
 def test_user_login_logged_in(cli_run):
@@ -22,3 +29,89 @@ def test_user_login_oauth_timeout(cli_run, mocker):
     assert result.exit_code == 1
     assert "Logging in timed out or had an unexpected error" in result.output
     mock_login.assert_called_once()
+
+
+@pytest.mark.usefixtures("_isolated_filesystem", "_mock_user")
+def test_user_identity_cached(cli_run, mocker):
+    from isic_cli.cli import context
+
+    result = cli_run(["user", "login"])
+    assert result.exit_code == 0
+    result = cli_run(["user", "login"])
+    assert result.exit_code == 0
+    assert "Hello fakeuser@email.test" in result.output
+
+    assert context.get_users_me.call_count == 1
+
+    # a different token invalidates the cached identity
+    mocker.patch.object(
+        GirderCliOAuthClient,
+        "auth_headers",
+        new_callable=mocker.PropertyMock,
+        return_value={"Authorization": "other-credentials"},
+    )
+    result = cli_run(["user", "login"])
+    assert result.exit_code == 0
+
+    assert context.get_users_me.call_count == 2
+
+
+@pytest.mark.usefixtures("_isolated_filesystem")
+def test_local_command_skips_login_restoration(cli_run, mocker):
+    maybe_restore_login = mocker.patch.object(GirderCliOAuthClient, "maybe_restore_login")
+
+    with Path("foo.csv").open("w") as f:
+        f.write("sex\nmale")
+
+    result = cli_run(["metadata", "validate", "foo.csv"])
+    assert result.exit_code == 0, result.output
+
+    maybe_restore_login.assert_not_called()
+
+
+@pytest.fixture()
+def oauth_client(mocker):
+    oauth = get_oauth_client("http://127.0.0.1/oauth")
+    oauth._session.token = {"token_type": "Bearer", "access_token": "old", "expires_in": 3600}
+    mocker.patch.object(oauth, "_save")
+
+    def refresh_token(url):
+        time.sleep(0.1)
+        oauth._session.token = {"token_type": "Bearer", "access_token": "new", "expires_in": 3600}
+
+    mocker.patch.object(oauth._session, "refresh_token", side_effect=refresh_token)
+    return oauth
+
+
+def test_token_refreshed_once_when_expired(fake_isic, oauth_client):
+    server = fake_isic(access_token="new")
+    oauth_client._session.token = {
+        "token_type": "Bearer",
+        "access_token": "old",
+        "expires_at": time.time() - 10,
+    }
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        session.auth = OAuthTokenAuth(oauth_client)
+        with ThreadPoolExecutor(10) as thread_pool:
+            responses = list(thread_pool.map(lambda _: session.get("collections/"), range(10)))
+
+    assert [r.status_code for r in responses] == [200] * 10
+    assert oauth_client._session.refresh_token.call_count == 1
+    assert server.requests["/api/v2/collections/"] == 10
+
+
+def test_request_retried_after_revoked_token(fake_isic, oauth_client, mocker):
+    server = fake_isic(access_token="new")
+    rate_limiter = mocker.patch("isic_cli.session.RATE_LIMITER")
+
+    with get_session(f"{server.url}/api/v2/") as session:
+        session.auth = OAuthTokenAuth(oauth_client)
+        r = session.post("collections/1/populate-from-list/", json={"isic_ids": ["ISIC_0000000"]})
+
+    assert r.status_code == 200
+    assert r.json() == {"succeeded": ["ISIC_0000000"]}
+    assert [response.status_code for response in r.history] == [401]
+    assert oauth_client._session.refresh_token.call_count == 1
+    # the retry is rate limited like any other request
+    assert rate_limiter.before_request.call_count == 2
@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import json
+
 import pytest
 
 from isic_cli.cli.utils import get_attributions
+from isic_cli.metadata import MetadataRecords
+from isic_cli.utils.fastjson import loads
 
 
 @pytest.mark.parametrize(
@@ -47,5 +51,48 @@ from isic_cli.cli.utils import get_attributions
         ),
     ],
 )
-def test_get_attributions(images, attributions):
+@pytest.mark.parametrize("columnar", [False, True])
+def test_get_attributions(images, attributions, columnar):
+    if columnar:
+        records = MetadataRecords()
+        for image in images:
+            records.append(image)
+        images = records
+
     assert get_attributions(images) == attributions
+
+
+def test_metadata_records_round_trip():
+    rows = [
+        {"isic_id": "ISIC_1", "attribution": "foo", "age_approx": 50, "melanocytic": True},
+        {"isic_id": "ISIC_2", "attribution": "foo", "age_approx": 1, "diagnosis": None},
+        {"isic_id": "ISIC_3", "attribution": "bar", "age_approx": 1.0, "diagnosis": "nevus"},
+    ]
+    records = MetadataRecords()
+    for row in rows:
+        records.append(row)
+
+    assert len(records) == 3
+    assert records.fields == [
+        "isic_id",
+        "attribution",
+        "copyright_license",
+        "age_approx",
+        "diagnosis",
+        "melanocytic",
+    ]
+    assert list(records) == [
+        rows[0],
+        {"isic_id": "ISIC_2", "attribution": "foo", "age_approx": 1},
+        rows[2],
+    ]
+    # equal values of different types aren't conflated
+    assert [type(record["age_approx"]) for record in records] == [int, int, float]
+    assert records.value_counts("attribution") == {"foo": 2, "bar": 1}
+    assert records.value_counts("diagnosis") == {"nevus": 1}
+
+
+def test_fastjson_loads_matches_stdlib():
+    data = '{"next": null, "results": [{"isic_id": "ISIC_0000000", "age": 1.5, "sex": "\\u00e9"}]}'
+
+    assert loads(data.encode()) == json.loads(data)
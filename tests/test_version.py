@@ -1,9 +1,19 @@
 from __future__ import annotations
 
+import time
+
 from packaging.version import Version
 import pytest
+from requests.exceptions import ConnectionError
 
-from isic_cli.utils.version import newest_version_available
+from isic_cli.utils.version import (
+    VERSION_CHECK_EXIT_TIMEOUT,
+    VERSION_CHECK_TTL,
+    cached_newest_version,
+    check_for_newer_version,
+    newest_version_available,
+    refresh_newest_version_cache,
+)
 
 
 @pytest.fixture()
@@ -17,3 +27,75 @@ def _mock_pypi_releases(mocker):
 def test_newest_version_available():
     newest_version = newest_version_available()
     assert newest_version == Version("1.2.3"), newest_version
+
+
+@pytest.mark.usefixtures("_mock_pypi_releases")
+def test_refresh_newest_version_cache():
+    assert cached_newest_version() == (None, True)
+
+    refresh_newest_version_cache()
+
+    assert cached_newest_version() == (Version("1.2.3"), False)
+
+
+@pytest.mark.usefixtures("_mock_pypi_releases")
+def test_cached_newest_version_expires(mocker):
+    refresh_newest_version_cache()
+
+    mocker.patch(
+        "isic_cli.utils.version.time.time", return_value=time.time() + VERSION_CHECK_TTL + 1
+    )
+
+    assert cached_newest_version() == (Version("1.2.3"), True)
+
+
+def test_refresh_newest_version_cache_offline(mocker):
+    mocker.patch("isic_cli.utils.version._pypi_releases", side_effect=ConnectionError)
+
+    refresh_newest_version_cache()
+
+    # a failed check is still recorded so it isn't retried on every invocation
+    assert cached_newest_version() == (None, False)
+
+
+def test_refresh_newest_version_cache_records_check_first(mocker):
+    def releases():
+        # an interrupted check is recorded as well
+        assert cached_newest_version() == (None, False)
+        return {"1.2.3": None}
+
+    mocker.patch("isic_cli.utils.version._pypi_releases", side_effect=releases)
+
+    refresh_newest_version_cache()
+
+    assert cached_newest_version() == (Version("1.2.3"), False)
+
+
+@pytest.mark.parametrize(("fresh_cache", "expected_refreshes"), [(True, 0), (False, 1)])
+def test_check_for_newer_version_refreshes_in_background(mocker, fresh_cache, expected_refreshes):
+    mocker.patch("isic_cli.utils.version.get_version", return_value=Version("1.2.3"))
+    mocker.patch("isic_cli.utils.version._is_interactive", return_value=True)
+    mocker.patch(
+        "isic_cli.utils.version.cached_newest_version",
+        return_value=(Version("1.2.3"), not fresh_cache),
+    )
+    thread = mocker.patch("isic_cli.utils.version.threading.Thread")
+    register = mocker.patch("isic_cli.utils.version.atexit.register")
+
+    check_for_newer_version()
+
+    assert thread.return_value.start.call_count == expected_refreshes
+    # the check is joined at exit rather than killed
+    assert register.call_count == expected_refreshes
+    if expected_refreshes:
+        register.assert_called_once_with(thread.return_value.join, VERSION_CHECK_EXIT_TIMEOUT)
+
+
+def test_check_for_newer_version_non_interactive(mocker):
+    mocker.patch("isic_cli.utils.version.get_version", return_value=Version("0.0.1"))
+    mocker.patch("isic_cli.utils.version._is_interactive", return_value=False)
+    cached = mocker.patch("isic_cli.utils.version.cached_newest_version")
+
+    check_for_newer_version()
+
+    cached.assert_not_called()